@@ -0,0 +1,223 @@
+"""In-memory stand-ins for the AWS clients the handlers use, for local benchmarks.
+
+Only the calls the handlers make are modelled, with the response shapes they read.
+Anything else answers with an empty response so new calls do not break a benchmark.
+"""
+import hashlib
+import threading
+
+
+class ClientError(Exception):
+    # Shaped like botocore's ClientError as far as retry_queue.error_code is concerned
+    def __init__(self, code, message=''):
+        super().__init__(message or code)
+        self.response = {'Error': {'Code': code, 'Message': message or code}}
+
+
+class Stub:
+    # Unmodelled calls succeed with an empty response
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: {}
+
+
+class StreamingBody:
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def read(self, size=None):
+        end = len(self._data) if size is None else self._pos + size
+        chunk = self._data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class FakeS3(Stub):
+
+    def __init__(self):
+        self.objects = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, data, metadata=None):
+        etag = '"' + hashlib.md5(data).hexdigest() + '"'
+        with self._lock:
+            self.objects[key] = (data, etag, metadata or {})
+
+    def _get(self, key):
+        try:
+            return self.objects[key]
+        except KeyError:
+            raise ClientError('NoSuchKey') from None
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, **kwargs):
+        self.put(Key, Body if isinstance(Body, bytes) else Body.encode('utf-8'), Metadata)
+        return {'ETag': self.objects[Key][1]}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, Range=None, **kwargs):
+        data, etag, metadata = self._get(Key)
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            raise ClientError('304', 'Not Modified')
+        if Range:
+            start, _, end = Range.split('=', 1)[1].partition('-')
+            data = data[int(start):int(end) + 1 if end else None]
+        return {'Body': StreamingBody(data), 'ContentLength': len(data), 'ETag': etag, 'Metadata': metadata}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        try:
+            data, etag, metadata = self._get(Key)
+        except ClientError:
+            raise ClientError('404', 'Not Found') from None
+        return {'ContentLength': len(data), 'ETag': etag, 'Metadata': metadata}
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None, MetadataDirective='COPY', **kwargs):
+        data, _, metadata = self._get(CopySource['Key'])
+        self.put(Key, data, Metadata if MetadataDirective == 'REPLACE' else metadata)
+        return {}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.objects.pop(Key, None)
+        return {}
+
+    def download_fileobj(self, Bucket, Key, Fileobj, **kwargs):
+        Fileobj.write(self._get(Key)[0])
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        # The transfer manager reports a missing key from its HeadObject, as a 404
+        try:
+            data = self._get(Key)[0]
+        except ClientError:
+            raise ClientError('404') from None
+        with open(Filename, 'wb') as f:
+            f.write(data)
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.put(Key, f.read())
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        with self._lock:
+            contents = [{'Key': key, 'Size': len(data)} for key, (data, _, _) in sorted(self.objects.items())
+                        if key.startswith(Prefix)]
+        return {'Contents': contents, 'IsTruncated': False}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        with self._lock:
+            for item in Delete['Objects']:
+                self.objects.pop(item['Key'], None)
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        with self._lock:
+            upload_id = str(len(self._uploads) + 1)
+            self._uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        parts = self._uploads.pop(UploadId)
+        self.put(Key, b''.join(parts[p['PartNumber']] for p in MultipartUpload['Parts']))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._uploads.pop(UploadId, None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class FakeTable(Stub):
+
+    def __init__(self):
+        self.items = {}
+        self.put_items = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return tuple(sorted(key.items()))
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {'Item': dict(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        # The key schema is not known here, so puts are kept in arrival order
+        with self._lock:
+            self.put_items.append(Item)
+        return {}
+
+    def update_item(self, Key, ExpressionAttributeValues=None, ReturnValues='NONE', **kwargs):
+        # Records that the item exists; attribute values are stored under their
+        # placeholders, which is enough for first-contact detection.
+        with self._lock:
+            old = self.items.get(self._key(Key))
+            self.items[self._key(Key)] = {**(old or {}), **Key, **(ExpressionAttributeValues or {})}
+        if ReturnValues in ('UPDATED_OLD', 'ALL_OLD') and old:
+            return {'Attributes': dict(old)}
+        return {}
+
+    def query(self, **kwargs):
+        return {'Items': [], 'Count': 0}
+
+
+class FakeDynamoDB(Stub):
+
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, FakeTable())
+
+
+class FakeSQS(Stub):
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.sent.append((QueueUrl, MessageBody))
+        return {'MessageId': str(len(self.sent))}
+
+
+class FakeSSM(Stub):
+
+    def __init__(self, parameters=None):
+        self.parameters = parameters or {}
+
+    def get_parameter(self, Name, **kwargs):
+        if Name not in self.parameters:
+            raise ClientError('ParameterNotFound')
+        return {'Parameter': {'Name': Name, 'Value': self.parameters[Name], 'Version': 1}}
+
+
+class FakeSES(Stub):
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_raw_email(self, **kwargs):
+        self.sent += 1
+        return {'MessageId': f'local-{self.sent}'}
+
+    send_email = send_raw_email
+
+    def get_send_quota(self):
+        return {'Max24HourSend': 1e6, 'MaxSendRate': 1e6, 'SentLast24Hours': 0.0}
@@ -0,0 +1,311 @@
+"""Benchmark suite for the inbound hot path on synthetic email corpora.
+
+Generates corpora (plain text, multipart with PDFs, huge HTML bodies, LinkedIn bounce
+senders, a spam-heavy mix), swaps the handlers' AWS clients for the in-memory stubs in
+aws_stubs.py, and times each stage per message:
+
+- parse:             BytesParser over the raw message
+- check_spam:        inbound-handler check_spam with the repo's keywords.txt
+- save_attachments:  inbound-handler save_attachments (content store cold each time)
+- build_raw_message: forward-sender build_raw_message (encoded-body cache cold)
+- lambda_handler:    inbound-handler end to end, staging object re-created and content
+                     store emptied each time
+
+Reports p50/p99/mean latency and the peak traced allocation per case as JSON. With
+--baseline, cases whose p99 regressed beyond --tolerance are listed and the exit status
+is 1, so the suite can gate a deploy.
+
+    python benchmarks/hot_path_bench.py --messages 50 --output bench.json
+    python benchmarks/hot_path_bench.py --baseline bench.json --tolerance 0.25
+
+Needs the handlers' requirements (boto3, mypylogger, pcre2); no AWS calls are made.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aws_stubs import FakeDynamoDB, FakeS3, FakeSES, FakeSQS, FakeSSM, Stub  # noqa: E402
+
+BUCKET = 'bench-bucket'
+PUBLIC_EMAIL = 'me@example.com'
+KEYWORDS_PARAM = '/bench/spam-keywords'
+KEYWORDS_KEY = 'spam-filter/keywords.txt'
+
+ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'BUCKET_NAME': BUCKET,
+    'TABLE_NAME': 'bench-conversations',
+    'DOMAIN_NAME': 'example.com',
+    'PUBLIC_EMAIL': PUBLIC_EMAIL,
+    'PRIVATE_EMAIL': 'me@private.example.com',
+    'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:000000000000:alerts',
+    'SPAM_KEYWORDS_SSM_PARAM': KEYWORDS_PARAM,
+    'ACK_QUEUE_URL': 'https://sqs.local/ack',
+    'FORWARD_QUEUE_URL': 'https://sqs.local/forward',
+    'QUEUE_URL': 'https://sqs.local/forward',
+    'SES_RATE_TABLE': '',
+    'METRICS_ENABLED': 'false',   # keep EMF lines out of the report
+}
+
+WORDS = ('role platform engineer remote salary team python aws distributed systems '
+         'interview schedule position opportunity experience contract hybrid').split()
+
+
+def prose(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def fake_pdf(rng, size):
+    # Only the bytes matter on the inbound path; nothing here parses the PDF.
+    return b'%PDF-1.4\n' + rng.randbytes(size) + b'\n%%EOF\n'
+
+
+def make_message(kind, i, rng):
+    msg = EmailMessage()
+    msg['To'] = PUBLIC_EMAIL
+    msg['Message-ID'] = f'<bench-{kind}-{i}@example.com>'
+    sender = f'recruiter{i}@agency{i % 17}.com'
+    subject = f'{rng.choice(WORDS).title()} opportunity #{i}'
+    body = prose(rng, 300)
+
+    if kind == 'linkedin':
+        sender = f'messages-noreply-{i}@bounce.linkedin.com'
+        msg['From'] = f'Jane Recruiter {i} <{sender}>'
+    elif kind == 'spam_mix':
+        choice = i % 4
+        if choice == 0:
+            sender = f'promo{i}@spam.com'
+        elif choice == 1:
+            subject = f'Congratulations you are a WINNER #{i}'
+        elif choice == 2:
+            body += '\nPlease verify your account immediately or it will be suspended.'
+        msg['From'] = sender
+    else:
+        msg['From'] = f'Recruiter {i} <{sender}>'
+
+    msg['Subject'] = subject
+    if kind == 'html_huge':
+        paragraphs = ''.join(f'<p style="margin:0">{prose(rng, 60)}</p>' for _ in range(1500))
+        msg.set_content(f'<html><head><style>p{{color:#333}}</style></head><body>{paragraphs}</body></html>', subtype='html')
+    else:
+        msg.set_content(body)
+
+    if kind == 'multipart_pdf':
+        for n in range(3):
+            msg.add_attachment(fake_pdf(rng, 200 * 1024), maintype='application', subtype='pdf',
+                               filename=f'role-{i}-{n}.pdf')
+        msg.add_attachment(b'PK\x03\x04' + rng.randbytes(4096), maintype='application', subtype='zip',
+                           filename='portfolio.zip')
+    return sender, msg.as_bytes()
+
+
+CORPORA = ('plain', 'multipart_pdf', 'html_huge', 'linkedin', 'spam_mix')
+
+
+def load_module(name, lambda_dir):
+    sys.path.insert(0, os.path.join(ROOT, 'lambda', lambda_dir))
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'lambda', lambda_dir, 'handler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.path.pop(0)
+    return module
+
+
+class Bench:
+
+    def __init__(self, messages, seed):
+        for name, value in ENV.items():
+            os.environ.setdefault(name, value)
+        sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+
+        self.s3 = FakeS3()
+        with open(os.path.join(ROOT, 'spam-filter', 'keywords.txt'), 'rb') as f:
+            self.s3.put(KEYWORDS_KEY, f.read())
+        self.inbound = load_module('inbound_handler', 'inbound-handler')
+        self.forward = load_module('forward_sender_handler', 'forward-sender')
+        self.blob_store = sys.modules['blob_store']
+        self.mime_builder = sys.modules['mime_builder']
+
+        self.inbound.s3 = self.s3
+        self.inbound.sqs = FakeSQS()
+        self.inbound.dynamodb = FakeDynamoDB()
+        self.inbound.sns = Stub()
+        self.inbound.ssm = FakeSSM({KEYWORDS_PARAM: KEYWORDS_KEY})
+        self.inbound.logs = Stub()
+        self.inbound.spam_audit.logs = self.inbound.logs
+        self.inbound.spam_rule_source.s3 = self.s3
+        self.inbound.spam_rule_source.ssm = self.inbound.ssm
+        self.forward.s3 = self.s3
+        self.forward.ses = FakeSES()
+        self.forward.sqs = FakeSQS()
+        self.forward.sns = Stub()
+
+        rng = random.Random(seed)
+        self.corpora = {kind: [make_message(kind, i, rng) for i in range(messages)] for kind in CORPORA}
+        self.rules = self.inbound.load_spam_keywords()
+
+    def parse(self, raw):
+        return BytesParser(policy=policy.default).parsebytes(raw)
+
+    def cases(self, kind):
+        # Each case is (name, setup, run): setup runs untimed before every iteration and
+        # returns the argument handed to run.
+        inbound = self.inbound
+        messages = self.corpora[kind]
+
+        def parsed(n):
+            sender, raw = messages[n]
+            msg = self.parse(raw)
+            return sender, msg
+
+        def spam_args(n):
+            sender, msg = parsed(n)
+            subject = msg['subject'] or '(no subject)'
+            ses_record = {'receipt': {}}
+            return ses_record, {'destination': [PUBLIC_EMAIL]}, subject, inbound.extract_body_text(msg), sender
+
+        def reset_store():
+            # Every iteration stores its attachments as new content
+            self.blob_store._known_blobs.clear()
+            for key in [k for k in self.s3.objects if k.startswith(('blobs/', 'attachments/'))]:
+                del self.s3.objects[key]
+
+        def save_setup(n):
+            reset_store()
+            return parsed(n)[1], n
+
+        def forward_setup(n):
+            self.mime_builder.encoded_cache.clear()
+            msg = parsed(n)[1]
+            attachments, _ = inbound.save_attachments(msg, 'bench-conversation', f'bench-{n}')
+            sources = [(a['blob_key'], a['filename']) for a in attachments]
+            return inbound.extract_body_text(msg), sources
+
+        def handler_setup(n):
+            sender, raw = messages[n]
+            message_id = f'{kind}-{n}'
+            reset_store()
+            self.s3.put(f'staging/{message_id}', raw)
+            subject = self.parse(raw)['subject']
+            return {'Records': [{'ses': {
+                'mail': {'messageId': message_id, 'source': sender, 'destination': [PUBLIC_EMAIL],
+                         'commonHeaders': {'subject': subject}},
+                'receipt': {'spamVerdict': {'status': 'PASS'}, 'virusVerdict': {'status': 'PASS'}},
+            }}]}
+
+        return [
+            ('parse', lambda n: messages[n][1], self.parse),
+            ('check_spam', spam_args, lambda args: inbound.check_spam(*args, rules=self.rules)),
+            ('save_attachments', save_setup, lambda args: inbound.save_attachments(args[0], 'bench-conversation', f'bench-{args[1]}')),
+            ('build_raw_message', forward_setup, lambda args: self.forward.build_raw_message(
+                'me@private.example.com', 'Fwd: bench', args[0], 'x@thread.example.com',
+                self.forward.plan_attachments(args[1], args[0]))),
+            ('lambda_handler', handler_setup, lambda event: inbound.lambda_handler(event, None)),
+        ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(setup, run, count, repeat):
+    timings = []
+    for _ in range(repeat):
+        for n in range(count):
+            arg = setup(n)
+            started = time.perf_counter()
+            run(arg)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    # Peak allocation is traced on a separate pass so tracing does not skew the timings
+    peak = 0
+    for n in range(count):
+        arg = setup(n)
+        tracemalloc.start()
+        run(arg)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        'samples': len(timings),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for case, stats in results.items():
+        before = baseline.get('results', {}).get(case)
+        if before and before['p99_ms'] > 0 and stats['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append({'case': case, 'baseline_p99_ms': before['p99_ms'], 'p99_ms': stats['p99_ms']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=30, help='messages per corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='timed passes over each corpus')
+    parser.add_argument('--corpora', nargs='+', default=list(CORPORA), choices=CORPORA)
+    parser.add_argument('--cases', nargs='+', help='only these stages (default: all)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here as well as stdout')
+    parser.add_argument('--baseline', help='earlier report to compare p99 against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p99 growth over the baseline')
+    parser.add_argument('--verbose', action='store_true', help="keep the handlers' log output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    bench = Bench(args.messages, args.seed)
+    os.chdir(os.path.join(ROOT, 'templates'))   # enqueue_acknowledgement reads its template from cwd
+
+    results = {}
+    for kind in args.corpora:
+        for name, setup, run in bench.cases(kind):
+            if args.cases and name not in args.cases:
+                continue
+            results[f'{name}/{kind}'] = measure(setup, run, args.messages, args.repeat)
+
+    report = {
+        'python': sys.version.split()[0],
+        'messages_per_corpus': args.messages,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    status = 0
+    if baseline is not None:
+        report['regressions'] = compare(results, baseline, args.tolerance)
+        status = 1 if report['regressions'] else 0
+
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Microbenchmark: email.mime message building vs lambda/common/mime_builder.py.
+
+Builds the same forward (text body plus attachments) three ways and reports time and
+peak traced allocation per message:
+
+- email_mime: the original MIMEMultipart / MIMEApplication / as_bytes() path
+- builder_cold: direct byte rendering, attachments base64-encoded on this send
+- builder_cached: direct byte rendering reusing already-encoded bodies (a resend)
+
+Every rendered message is parsed back and its attachments compared with the input.
+
+    python benchmarks/mime_builder_bench.py --attachments 3 --size-kb 1024
+"""
+import argparse
+import email.mime.application
+import email.mime.multipart
+import email.mime.text
+import os
+import sys
+import timeit
+import tracemalloc
+from email import policy
+from email.parser import BytesParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+
+from mime_builder import attachment_content_type, encode_base64, render_raw_message  # noqa: E402
+
+SENDER = 'me@example.com'
+RECIPIENT = 'private@example.com'
+SUBJECT = 'Fwd: Senior Platform Engineer – remote'
+BODY = 'Hi,\n\nPlease see the attached role description.\n\n--- METADATA ---\nReply-To: x@thread.example.com\n'
+REPLY_TO = 'jane-at-example.com@thread.example.com'
+
+
+def email_mime(files):
+    msg = email.mime.multipart.MIMEMultipart()
+    msg['From'] = SENDER
+    msg['To'] = RECIPIENT
+    msg['Subject'] = SUBJECT
+    msg['Reply-To'] = REPLY_TO
+    msg.attach(email.mime.text.MIMEText(BODY, 'plain'))
+    for filename, data in files:
+        part = email.mime.application.MIMEApplication(data, Name=filename)
+        part.add_header('Content-Disposition', 'attachment', filename=filename)
+        msg.attach(part)
+    return msg.as_bytes()
+
+
+def builder_cold(files):
+    attachments = [(name, attachment_content_type(name), (encode_base64(data),)) for name, data in files]
+    return render_raw_message(SENDER, RECIPIENT, SUBJECT, BODY, attachments, reply_to=REPLY_TO)
+
+
+def make_builder_cached(files):
+    attachments = [(name, attachment_content_type(name), (encode_base64(data),)) for name, data in files]
+
+    def builder_cached(_files):
+        return render_raw_message(SENDER, RECIPIENT, SUBJECT, BODY, attachments, reply_to=REPLY_TO)
+    return builder_cached
+
+
+def verify(raw, files):
+    msg = BytesParser(policy=policy.default).parsebytes(raw)
+    got = [(part.get_filename(), part.get_payload(decode=True)) for part in msg.iter_attachments()]
+    assert got == files, 'attachments did not round-trip'
+    text = msg.get_body(preferencelist=('plain',)).get_content()
+    assert text.replace('\r\n', '\n').strip() == BODY.strip()
+    assert str(msg['Subject']) == SUBJECT
+
+
+def measure(fn, files, repeat):
+    verify(fn(files), files)
+    seconds = min(timeit.repeat(lambda: fn(files), number=1, repeat=repeat))
+    tracemalloc.start()
+    fn(files)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attachments', type=int, default=3)
+    parser.add_argument('--size-kb', type=int, default=1024, help='size of each attachment')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    files = [(f'role-{i}.pdf', os.urandom(args.size_kb * 1024)) for i in range(args.attachments)]
+    variants = {
+        'email_mime': email_mime,
+        'builder_cold': builder_cold,
+        'builder_cached': make_builder_cached(files),
+    }
+
+    print(f"{args.attachments} x {args.size_kb} KiB attachments, best of {args.repeat}")
+    print(f"{'variant':>15} {'ms/msg':>9} {'peak_alloc_mb':>14}")
+    for name, fn in variants.items():
+        seconds, peak = measure(fn, files, args.repeat)
+        print(f"{name:>15} {seconds * 1000:>9.2f} {peak / 2**20:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Peak RSS of the inbound MIME ingest path by message size.
+
+Compares the original buffered path (read whole object, BytesParser, decode each
+attachment into memory, keep raw bytes for the archive upload) with the streaming path
+in lambda/common/mime_stream.py. Each measurement runs in a fresh interpreter so
+ru_maxrss reflects only that run.
+
+    python benchmarks/mime_memory.py --sizes 1 5 10 25
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from email.message import EmailMessage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+
+ATTACHMENTS_PER_MESSAGE = 3
+
+
+def build_message(size_mb):
+    msg = EmailMessage()
+    msg['From'] = 'Jane Recruiter <jane@example.com>'
+    msg['To'] = 'me@example.com'
+    msg['Subject'] = f'Opportunity ({size_mb} MB)'
+    msg.set_content('Please find the role description attached.\n' * 50)
+    per_attachment = size_mb * 1024 * 1024 * 3 // 4 // ATTACHMENTS_PER_MESSAGE
+    for i in range(ATTACHMENTS_PER_MESSAGE):
+        msg.add_attachment(os.urandom(per_attachment), maintype='application',
+                           subtype='pdf', filename=f'doc-{i}.pdf')
+    return msg.as_bytes()
+
+
+class FileBody:
+    def __init__(self, path):
+        self._f = open(path, 'rb')
+
+    def iter_chunks(self, chunk_size):
+        while True:
+            chunk = self._f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self):
+        return self._f.read()
+
+    def close(self):
+        self._f.close()
+
+
+class NullS3:
+    # Accepts uploads and discards them; only the Lambda-side memory is of interest.
+    def __init__(self, path):
+        self.path = path
+
+    def get_object(self, Bucket, Key):
+        return {'Body': FileBody(self.path), 'ContentLength': os.path.getsize(self.path)}
+
+    def put_object(self, **kwargs):
+        return {}
+
+    def create_multipart_upload(self, **kwargs):
+        return {'UploadId': 'local'}
+
+    def upload_part(self, PartNumber, **kwargs):
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        return {}
+
+    def copy_object(self, **kwargs):
+        return {}
+
+
+def run_buffered(path):
+    from email import policy
+    from email.parser import BytesParser
+
+    s3 = NullS3(path)
+    raw_email = s3.get_object(Bucket='b', Key='k')['Body'].read()
+    msg = BytesParser(policy=policy.default).parsebytes(raw_email)
+    for part in msg.iter_attachments():
+        data = part.get_payload(decode=True)
+        s3.put_object(Bucket='b', Key='a', Body=data)
+    s3.put_object(Bucket='b', Key='archive', Body=raw_email)
+
+
+def run_streaming(path):
+    from mime_stream import copy_within_bucket, iter_decoded_payload, parse_s3_object, upload_stream
+
+    s3 = NullS3(path)
+    msg, _ = parse_s3_object(s3, 'b', 'k')
+    for part in msg.iter_attachments():
+        upload_stream(s3, 'b', 'a', iter_decoded_payload(part))
+    copy_within_bucket(s3, 'b', 'k', 'archive')
+
+
+MODES = {'buffered': run_buffered, 'streaming': run_streaming}
+
+
+def peak_rss_mb():
+    # VmHWM is reset by exec; ru_maxrss can carry over the parent's high-water mark.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+def child(mode, path):
+    before = peak_rss_mb()
+    MODES[mode](path)
+    after = peak_rss_mb()
+    print(json.dumps({'peak_rss_mb': after, 'delta_mb': after - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 10, 25], help='message sizes in MB')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes:
+            path = os.path.join(tmp, f'{size_mb}.eml')
+            with open(path, 'wb') as f:
+                f.write(build_message(size_mb))
+            for mode in MODES:
+                out = subprocess.run([sys.executable, __file__, '--child', mode, path],
+                                     check=True, capture_output=True, text=True).stdout
+                results.append({'size_mb': size_mb, 'mode': mode, **json.loads(out)})
+
+    print(f"{'size_mb':>8} {'mode':>10} {'peak_rss_mb':>12} {'delta_mb':>9}")
+    for r in results:
+        print(f"{r['size_mb']:>8} {r['mode']:>10} {r['peak_rss_mb']:>12.1f} {r['delta_mb']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
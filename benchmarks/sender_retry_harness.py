@@ -0,0 +1,174 @@
+"""Local harness for the sender Lambdas' queue-driven retries.
+
+Drives ack-sender's lambda_handler against an in-memory SQS queue with a virtual clock
+and a fake SES that throttles on command, then reports how many invocations ran, how
+long the longest one took in real time, how many retries were requeued and whether
+anything paged SNS or reached the DLQ. Needs the handler's own requirements (boto3,
+mypylogger) installed; no AWS calls are made.
+
+    python benchmarks/sender_retry_harness.py --messages 50 --throttle-first 30
+    python benchmarks/sender_retry_harness.py --messages 5 --throttle-always
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUEUE_URL = 'https://sqs.local/000000000000/ack-sender'
+VISIBILITY_TIMEOUT = 180   # matches modules/sqs-queues
+MAX_RECEIVE_COUNT = 5
+
+
+class Throttled(Exception):
+    # Shaped like botocore's ClientError as far as retry_queue.error_code is concerned
+    def __init__(self):
+        super().__init__('Maximum sending rate exceeded.')
+        self.response = {'Error': {'Code': 'Throttling', 'Message': str(self)}}
+
+
+class FakeSES:
+    def __init__(self, throttle_first=0, throttle_always=False):
+        self.throttle_first = throttle_first
+        self.throttle_always = throttle_always
+        self.calls = 0
+        self.sent = 0
+
+    def send_email(self, **kwargs):
+        self.calls += 1
+        if self.throttle_always or self.calls <= self.throttle_first:
+            raise Throttled()
+        self.sent += 1
+        return {'MessageId': f'local-{self.calls}'}
+
+    send_raw_email = send_email
+
+    def get_send_quota(self):
+        # High enough that the real-time rate governor never sleeps on the virtual clock
+        return {'Max24HourSend': 1e6, 'MaxSendRate': 1000.0, 'SentLast24Hours': 0.0}
+
+
+class FakeSQS:
+    def __init__(self, clock):
+        self.clock = clock
+        self.ids = itertools.count(1)
+        self.messages = {}
+        self.dlq = []
+        self.requeued = 0
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds=0):
+        if json.loads(MessageBody).get('attempt', 1) > 1:
+            self.requeued += 1
+        message_id = str(next(self.ids))
+        self.messages[message_id] = {
+            'body': MessageBody,
+            'visible_at': self.clock.now + DelaySeconds,
+            'receive_count': 0,
+        }
+        return {'MessageId': message_id}
+
+    def next_visible_at(self):
+        return min((m['visible_at'] for m in self.messages.values()), default=None)
+
+    def receive(self, max_records):
+        records = []
+        for message_id, m in sorted(self.messages.items(), key=lambda kv: kv[1]['visible_at']):
+            if len(records) == max_records or m['visible_at'] > self.clock.now:
+                break
+            m['receive_count'] += 1
+            m['visible_at'] = self.clock.now + VISIBILITY_TIMEOUT
+            records.append({
+                'messageId': message_id,
+                'body': m['body'],
+                'attributes': {'ApproximateReceiveCount': str(m['receive_count'])},
+                'eventSourceARN': 'arn:aws:sqs:local:000000000000:ack-sender',
+            })
+        return records
+
+    def settle(self, records, failed_ids):
+        for record in records:
+            message_id = record['messageId']
+            if message_id not in failed_ids:
+                del self.messages[message_id]
+            elif self.messages[message_id]['receive_count'] >= MAX_RECEIVE_COUNT:
+                self.dlq.append(self.messages.pop(message_id))
+
+
+class FakeSNS:
+    def __init__(self):
+        self.pages = []
+
+    def publish(self, **kwargs):
+        self.pages.append(kwargs)
+
+
+class Clock:
+    now = 0.0
+
+
+def load_handler():
+    os.environ.setdefault('PUBLIC_EMAIL', 'me@example.com')
+    os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:alerts')
+    os.environ.setdefault('QUEUE_URL', QUEUE_URL)
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+    spec = importlib.util.spec_from_file_location(
+        'ack_sender_handler', os.path.join(ROOT, 'lambda', 'ack-sender', 'handler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--throttle-first', type=int, default=0, help='throttle the first N SES calls')
+    parser.add_argument('--throttle-always', action='store_true', help='throttle every SES call')
+    args = parser.parse_args()
+
+    handler = load_handler()
+    clock = Clock()
+    ses = FakeSES(args.throttle_first, args.throttle_always)
+    sqs = FakeSQS(clock)
+    sns = FakeSNS()
+    handler.ses, handler.sqs, handler.sns = ses, sqs, sns
+    handler.governor = handler.SendRateGovernor(ses, table_name='')
+
+    for i in range(args.messages):
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps({
+            'recipient': f'sender{i}@example.com',
+            'subject': 'Thank you for reaching out',
+            'body': 'Thanks, I will get back to you shortly.',
+        }))
+
+    invocations = 0
+    longest = 0.0
+    while sqs.messages:
+        clock.now = max(clock.now, sqs.next_visible_at())
+        records = sqs.receive(args.batch_size)
+        started = time.perf_counter()
+        response = handler.lambda_handler({'Records': records}, None) or {}
+        longest = max(longest, time.perf_counter() - started)
+        invocations += 1
+        failed_ids = {f['itemIdentifier'] for f in response.get('batchItemFailures', [])}
+        sqs.settle(records, failed_ids)
+
+    print(json.dumps({
+        'messages': args.messages,
+        'sent': ses.sent,
+        'ses_calls': ses.calls,
+        'invocations': invocations,
+        'retries_requeued': sqs.requeued,
+        'sns_pages': len(sns.pages),
+        'dead_lettered': len(sqs.dlq),
+        'virtual_elapsed_seconds': round(clock.now, 1),
+        'longest_invocation_seconds': round(longest, 4),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Cold-start cost of each Lambda handler: module import time and first-client setup.
+
+Every measurement runs in a fresh interpreter laid out like a deployed package
+(handler.py plus lambda/common on sys.path), imports the handler the way the Lambda
+runtime does, and then touches one of its clients to time the first boto3 client build
+separately. Also lists the slowest imports from `python -X importtime`. Needs the
+handlers' requirements installed; no AWS calls are made.
+
+    python benchmarks/startup_bench.py --runs 5
+    python benchmarks/startup_bench.py --handlers inbound-handler --top 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS = ['inbound-handler', 'reply-handler', 'attachment-extractor',
+            'ack-sender', 'forward-sender', 'reply-sender', 'search-indexer']
+
+# Enough configuration for every handler to import; nothing is contacted.
+DUMMY_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'BUCKET_NAME': 'bench-bucket',
+    'TABLE_NAME': 'bench-conversations',
+    'DOMAIN_NAME': 'example.com',
+    'PUBLIC_EMAIL': 'me@example.com',
+    'PRIVATE_EMAIL': 'me@private.example.com',
+    'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:000000000000:alerts',
+    'SPAM_KEYWORDS_SSM_PARAM': '/bench/spam-keywords',
+    'QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/bench',
+    'ACK_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/ack',
+    'FORWARD_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/forward',
+    'REPLY_QUEUE_URL': 'https://sqs.us-east-1.amazonaws.com/000000000000/reply',
+}
+
+CHILD = r'''
+import json, sys, time
+sys.path[:0] = [sys.argv[1], sys.argv[2]]
+started = time.perf_counter()
+import handler
+imported = time.perf_counter()
+client = getattr(handler, 's3', None) or getattr(handler, 'ses', None)
+if client is not None:
+    client.meta
+first_client = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_client_ms': (first_client - imported) * 1000,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def run_once(name, importtime=False):
+    env = {**os.environ, **DUMMY_ENV}
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', CHILD, os.path.join(ROOT, 'lambda', name), os.path.join(ROOT, 'lambda', 'common')]
+    result = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(stderr, top):
+    # importtime lines: "import time: self [us] | cumulative | imported package", with
+    # two extra spaces of indent per nesting level
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, package = line[len('import time:'):].split('|')
+        depth = (len(package) - len(package.lstrip()) - 1) // 2
+        if depth == 1:   # modules imported directly by the handler (or by site)
+            rows.append((int(cumulative), package.strip()))
+    rows.sort(reverse=True)
+    return [{'module': m, 'cumulative_ms': round(us / 1000, 1)} for us, m in rows[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--handlers', nargs='+', default=HANDLERS, choices=HANDLERS)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help="slowest of the handler's direct imports to list")
+    args = parser.parse_args()
+
+    report = {}
+    for name in args.handlers:
+        samples = [run_once(name)[0] for _ in range(args.runs)]
+        _, stderr = run_once(name, importtime=True)
+        report[name] = {
+            'import_ms_median': round(statistics.median(s['import_ms'] for s in samples), 1),
+            'first_client_ms_median': round(statistics.median(s['first_client_ms'] for s in samples), 1),
+            'modules_loaded': samples[0]['modules'],
+            'slowest_imports': slowest_imports(stderr, args.top),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
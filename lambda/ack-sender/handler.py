@@ -1,78 +1,61 @@
 import json
 import os
-import time
-import boto3
+from aws_clients import lazy_client, lazy_resource
+from ledger import ProcessingLedger
+from metrics import instrumented, span
 from mypylogger import get_logger
+from retry_queue import receive_count, send_with_retry
+from ses_governor import SendRateGovernor
+from sqs_batch import batch_response, process_batch
 
 logger = get_logger(__name__)
 
-ses = boto3.client('ses')
-sns = boto3.client('sns')
+ses = lazy_client('ses')
+sqs = lazy_client('sqs')
+sns = lazy_client('sns')
+
+governor = SendRateGovernor(ses)
+ledger = ProcessingLedger(lazy_resource('dynamodb'))
 
 PUBLIC_EMAIL = os.environ['PUBLIC_EMAIL']
 SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
+QUEUE_URL = os.environ['QUEUE_URL']
+
+
+def send_ack(message):
+    with span('rate_wait'):
+        governor.acquire()
+    with span('ses_send'):
+        ses.send_email(
+            Source=PUBLIC_EMAIL,
+            Destination={'ToAddresses': [message['recipient']]},
+            Message={
+                'Subject': {'Data': message['subject']},
+                'Body': {'Text': {'Data': message['body']}}
+            }
+        )
 
-RETRY_DELAYS = [0, 5, 30, 120]
-RETRYABLE_ERRORS = {'MailFromDomainNotVerifiedException', 'Throttling', 'ServiceUnavailable'}
-
-
-def send_with_retry(recipient, subject, body):
-    last_error = None
-
-    for attempt, delay in enumerate(RETRY_DELAYS, start=1):
-        if delay > 0:
-            time.sleep(delay)
-        try:
-            ses.send_email(
-                Source=PUBLIC_EMAIL,
-                Destination={'ToAddresses': [recipient]},
-                Message={
-                    'Subject': {'Data': subject},
-                    'Body': {'Text': {'Data': body}}
-                }
-            )
-            logger.info("ack_sent", extra={
-                "recipient": recipient,
-                "subject": subject,
-                "attempt": attempt
-            })
-            return
-        except ses.exceptions.ClientError as e:
-            error_code = e.response['Error']['Code']
-            last_error = e
-            logger.warning("ack_send_failed", extra={
-                "recipient": recipient,
-                "error_code": error_code,
-                "attempt": attempt
-            })
-            if error_code not in RETRYABLE_ERRORS:
-                break
-        except Exception as e:
-            last_error = e
-            logger.warning("ack_send_failed", extra={
-                "recipient": recipient,
-                "error": str(e),
-                "attempt": attempt
-            })
 
-    logger.error("ack_send_exhausted", extra={
-        "recipient": recipient,
-        "error": str(last_error),
-        "attempts": len(RETRY_DELAYS)
-    })
+def notify_exhausted(recipient, error):
     sns.publish(
         TopicArn=SNS_TOPIC_ARN,
         Subject="Ack Sender: Send Failed After Retries",
-        Message=f"Failed to send acknowledgement to {recipient}: {last_error}"
+        Message=f"Failed to send acknowledgement to {recipient}: {error}"
     )
-    raise last_error
 
 
+def handle_record(record):
+    message = json.loads(record['body'])
+    send_with_retry(message, send_ack, 'ack', ledger, sqs, QUEUE_URL, notify_exhausted,
+                    first_receive=receive_count(record) == 1)
+
+
+@instrumented
 def lambda_handler(event, context):
-    for record in event['Records']:
-        message = json.loads(record['body'])
-        send_with_retry(
-            recipient=message['recipient'],
-            subject=message['subject'],
-            body=message['body']
-        )
+    failures = process_batch(event['Records'], handle_record)
+    for record, error in failures:
+        logger.error("ack_record_failed", extra={
+            "message_id": record['messageId'],
+            "error": str(error)
+        })
+    return batch_response(failures)
@@ -1,60 +1,134 @@
 import json
 import os
-import boto3
-from pypdf import PdfReader
-from docx import Document
-from io import BytesIO
+import tempfile
+import time
+from aws_clients import lazy_client
+from blob_store import (TRUNCATED_METADATA, mark_truncated, put_pointer, read_pointer, text_key as hashed_text_key,
+                        text_metadata)
+from metrics import instrumented, span
+from mime_stream import upload_stream
 from mypylogger import get_logger
+from search_index import SearchQueue
+from text_extraction import ExtractionFailed, ExtractionStats, iter_docx_text, iter_pdf_text, iter_utf8_chunks
 
 logger = get_logger(__name__)
 
-s3 = boto3.client('s3')
-
-def extract_text_from_pdf(file_bytes):
-    try:
-        pdf = PdfReader(BytesIO(file_bytes))
-        text = ''
-        for page in pdf.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        logger.error("pdf_extraction_failed", extra={"error": str(e)})
-        return None
+s3 = lazy_client('s3')
+sqs = lazy_client('sqs')
+
+search_queue = SearchQueue(sqs)
+
+# Extraction stops this long before the Lambda timeout so the partial text is still
+# uploaded and the invocation ends cleanly.
+TIME_MARGIN_SECONDS = 10
+
+EXTRACTORS = {
+    '.pdf': ('pdf', iter_pdf_text),
+    '.docx': ('docx', iter_docx_text),
+}
+
 
-def extract_text_from_docx(file_bytes):
-    try:
-        doc = Document(BytesIO(file_bytes))
-        text = '\n'.join([para.text for para in doc.paragraphs])
-        return text
-    except Exception as e:
-        logger.error("docx_extraction_failed", extra={"error": str(e)})
+def extraction_deadline(context):
+    if context is None:
         return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - TIME_MARGIN_SECONDS
+
+
+def extract_to_s3(bucket, key, text_key, extractor, deadline):
+    # The source goes to /tmp (pypdf and python-docx need a seekable file, and forked
+    # page workers reopen it by path); the text is streamed back to S3 as it is produced.
+    stats = ExtractionStats()
+    with tempfile.NamedTemporaryFile(dir='/tmp') as source:
+        with span('s3_fetch') as timer:
+            s3.download_fileobj(bucket, key, source)
+            source.flush()
+            timer.bytes = source.tell()
+        with span('text_extract') as timer:
+            chunks = iter_utf8_chunks(extractor(source.name, stats, deadline), stats)
+            try:
+                written = upload_stream(s3, bucket, text_key, chunks)
+            finally:
+                chunks.close()
+            timer.bytes = written
+    return written, stats
+
+
+def index_text(key, text_key, received_at=None):
+    # Adds the extracted text to the search index as a document of the attachment's
+    # message. The indexer reads the text from text_key, which may have been extracted
+    # for an earlier message.
+    _, conversation_id, message_id, filename = key.split('/', 3)
+    with span('search_index'):
+        search_queue.add(conversation_id, message_id, filename, received_at=received_at, text_key=text_key)
+
 
+@instrumented
 def lambda_handler(event, context):
+    deadline = extraction_deadline(context)
+
     for record in event['Records']:
         bucket = record['s3']['bucket']['name']
         key = record['s3']['object']['key']
-        
+
         if not key.startswith('attachments/'):
             continue
-        
+
+        kind, extractor = EXTRACTORS.get(os.path.splitext(key)[1], (None, None))
+        if extractor is None:
+            logger.info("no_text_extracted", extra={"key": key})
+            continue
+
         try:
-            obj = s3.get_object(Bucket=bucket, Key=key)
-            file_bytes = obj['Body'].read()
-            
-            text = None
-            if key.endswith('.pdf'):
-                text = extract_text_from_pdf(file_bytes)
-            elif key.endswith('.docx'):
-                text = extract_text_from_docx(file_bytes)
-            
-            if text:
-                text_key = key.replace('attachments/', 'extracted-text/') + '.txt'
-                s3.put_object(Bucket=bucket, Key=text_key, Body=text.encode('utf-8'))
-                logger.info("text_extracted", extra={"source_key": key, "text_key": text_key})
+            # Attachments are stored once per content hash (see blob_store); text is keyed
+            # the same way, so a file seen before is not extracted again.
+            source_key, digest = read_pointer(s3, bucket, key)
+            message_text_key = key.replace('attachments/', 'extracted-text/') + '.txt'
+            if digest is None:
+                text_key = message_text_key
+            else:
+                text_key = hashed_text_key(digest)
+                metadata = text_metadata(s3, bucket, text_key)
+                # Text cut off by the deadline depends on how busy that invocation was,
+                # so it is extracted again; the page and size caps would cut it the same.
+                if metadata is not None and metadata.get(TRUNCATED_METADATA) != 'time_budget':
+                    put_pointer(s3, bucket, message_text_key, text_key, digest)
+                    if search_queue.enabled:
+                        index_text(key, text_key, record.get('eventTime'))
+                    logger.info("text_extraction_skipped", extra={
+                        "source_key": key,
+                        "text_key": text_key,
+                        "reason": "already_extracted"
+                    })
+                    continue
+
+            started = time.perf_counter()
+            try:
+                written, stats = extract_to_s3(bucket, source_key, text_key, extractor, deadline)
+            except ExtractionFailed as e:
+                logger.error(f"{kind}_extraction_failed", extra={"error": str(e), "key": key})
+                written, stats = 0, None
+
+            if digest is not None:
+                if not written:
+                    # Recorded as processed too, so a scan or a broken file is not retried
+                    # every time it is attached again
+                    s3.put_object(Bucket=bucket, Key=text_key, Body=b'')
+                if stats is not None and stats.truncated:
+                    mark_truncated(s3, bucket, text_key, stats.truncated)
+                put_pointer(s3, bucket, message_text_key, text_key, digest, written)
+
+            if written:
+                if search_queue.enabled:
+                    index_text(key, text_key, record.get('eventTime'))
+                logger.info("text_extracted", extra={
+                    "source_key": key,
+                    "text_key": text_key,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                    **stats.summary()
+                })
             else:
                 logger.info("no_text_extracted", extra={"key": key})
-                
+
         except Exception as e:
             logger.error("extraction_handler_failed", extra={"error": str(e), "key": key})
             raise
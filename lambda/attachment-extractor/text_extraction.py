@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import time
+from mypylogger import get_logger
+
+logger = get_logger(__name__)
+
+# Limits per document. Anything past them is dropped and the output is marked truncated.
+EXTRACT_MAX_PAGES = int(os.environ.get('EXTRACT_MAX_PAGES', '1000'))
+EXTRACT_MAX_BYTES = int(os.environ.get('EXTRACT_MAX_MB', '16')) * 1024 * 1024
+# Page extraction is CPU-bound pure Python, so threads would only take turns on the GIL;
+# workers are forked processes. Lambda allots one vCPU per 1769 MB of memory, but
+# os.cpu_count() reports the host's, so in Lambda the default follows the memory size:
+# one worker (no forking) below 3538 MB. Outside Lambda it is the CPU count.
+VCPU_MEMORY_MB = 1769
+FUNCTION_MEMORY_MB = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '0'))
+
+
+def default_workers(memory_mb=FUNCTION_MEMORY_MB, cpu_count=os.cpu_count()):
+    if memory_mb:
+        return max(1, min(memory_mb // VCPU_MEMORY_MB, cpu_count or 1))
+    return cpu_count or 1
+
+
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', '0')) or default_workers()
+MIN_PAGES_PER_WORKER = 8
+SLOW_PAGE_MS = 2000
+SLOWEST_PAGES_REPORTED = 5
+
+
+class ExtractionFailed(Exception):
+    pass
+
+
+class ExtractionStats:
+
+    def __init__(self):
+        self.page_count = None
+        self.pages = 0
+        self.failed_pages = 0
+        self.page_ms = []
+        self.bytes = 0
+        self.truncated = None
+
+    def summary(self):
+        slowest = sorted(self.page_ms, key=lambda t: t[1], reverse=True)[:SLOWEST_PAGES_REPORTED]
+        return {
+            "page_count": self.page_count,
+            "pages_extracted": self.pages,
+            "failed_pages": self.failed_pages,
+            "text_bytes": self.bytes,
+            "truncated": self.truncated,
+            "page_ms_total": round(sum(ms for _, ms in self.page_ms), 1),
+            "slowest_pages": [{"page": number + 1, "ms": round(ms, 1)} for number, ms in slowest],
+        }
+
+
+def _extract_page(reader, number):
+    started = time.perf_counter()
+    try:
+        # extract_text() returns None for pages without a text layer (scans, images)
+        text, error = reader.pages[number].extract_text() or '', None
+    except Exception as e:
+        text, error = '', str(e)
+    return number, text, (time.perf_counter() - started) * 1000, error
+
+
+def _page_worker(path, numbers, conn):
+    # Runs in a forked child: opens its own reader and streams results back in order.
+    # No logging here; the parent reports per-page errors.
+    from pypdf import PdfReader
+    try:
+        reader = PdfReader(path)
+        for number in numbers:
+            conn.send(_extract_page(reader, number))
+    finally:
+        conn.close()
+
+
+def _iter_pages_inline(path, count):
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    for number in range(count):
+        yield _extract_page(reader, number)
+
+
+def _iter_pages_parallel(path, count, workers):
+    # Page i goes to worker i % workers and is read back in page order. Each worker runs
+    # ahead of the reader by as much as its pipe buffers, so all of them stay busy while
+    # the text is still consumed (and uploaded) strictly in order.
+    context = multiprocessing.get_context('fork')
+    processes, connections = [], []
+    try:
+        for index in range(workers):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_page_worker, args=(path, range(index, count, workers), sender), daemon=True)
+            process.start()
+            sender.close()
+            processes.append(process)
+            connections.append(receiver)
+
+        for number in range(count):
+            try:
+                yield connections[number % workers].recv()
+            except EOFError:
+                raise ExtractionFailed(f"page worker exited before page {number + 1}")
+    finally:
+        for connection in connections:
+            connection.close()
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def iter_pdf_text(path, stats, deadline=None):
+    from pypdf import PdfReader
+    try:
+        stats.page_count = len(PdfReader(path).pages)
+    except Exception as e:
+        raise ExtractionFailed(str(e)) from e
+
+    count = min(stats.page_count, EXTRACT_MAX_PAGES)
+    if count < stats.page_count:
+        stats.truncated = 'max_pages'
+
+    workers = min(EXTRACT_WORKERS, count // MIN_PAGES_PER_WORKER)
+    if workers > 1:
+        pages = _iter_pages_parallel(path, count, workers)
+    else:
+        pages = _iter_pages_inline(path, count)
+
+    try:
+        for number, text, ms, error in pages:
+            stats.pages += 1
+            stats.page_ms.append((number, ms))
+            if error:
+                stats.failed_pages += 1
+                logger.warning("pdf_page_failed", extra={"page": number + 1, "error": error})
+            elif ms > SLOW_PAGE_MS:
+                logger.warning("pdf_page_slow", extra={"page": number + 1, "ms": round(ms, 1)})
+            if text:
+                yield text
+            if deadline is not None and time.monotonic() > deadline:
+                stats.truncated = 'time_budget'
+                return
+    finally:
+        pages.close()
+
+
+def iter_docx_text(path, stats, deadline=None):
+    from docx import Document
+    try:
+        doc = Document(path)
+    except Exception as e:
+        raise ExtractionFailed(str(e)) from e
+    for para in doc.paragraphs:
+        yield para.text
+        if deadline is not None and time.monotonic() > deadline:
+            stats.truncated = 'time_budget'
+            return
+
+
+def iter_utf8_chunks(texts, stats, max_bytes=EXTRACT_MAX_BYTES):
+    # Joins the pieces with newlines as UTF-8 chunks for upload_stream, stopping at
+    # max_bytes on a character boundary. Closes the source when done or abandoned, which
+    # stops any page workers still running.
+    first = True
+    try:
+        for text in texts:
+            data = text.encode('utf-8') if first else b'\n' + text.encode('utf-8')
+            first = False
+            remaining = max_bytes - stats.bytes
+            if len(data) > remaining:
+                data = data[:remaining].decode('utf-8', 'ignore').encode('utf-8')
+                stats.truncated = 'max_bytes'
+            if data:
+                stats.bytes += len(data)
+                yield data
+            if stats.truncated == 'max_bytes':
+                return
+    finally:
+        texts.close()
@@ -0,0 +1,66 @@
+import threading
+import boto3
+from botocore.config import Config
+from io_stage import IO_MAX_WORKERS
+
+# One config for every client. The connection pool covers both the record pool and the
+# I/O pool running at once; keep-alive holds sockets open across warm invocations, and
+# adaptive retries add client-side rate limiting when AWS starts throttling.
+CLIENT_CONFIG = Config(
+    max_pool_connections=IO_MAX_WORKERS * 2,
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=60,
+    retries={'max_attempts': 5, 'mode': 'adaptive'}
+)
+
+_session = None
+_instances = {}
+_lock = threading.Lock()
+
+
+def _create(kind, service):
+    global _session
+    with _lock:
+        key = (kind, service)
+        if key not in _instances:
+            # boto3's default session is not safe to use from several threads at once
+            # while it builds clients, so one session is created and used under the lock.
+            if _session is None:
+                _session = boto3.session.Session()
+            factory = _session.client if kind == 'client' else _session.resource
+            _instances[key] = factory(service, config=CLIENT_CONFIG)
+        return _instances[key]
+
+
+def client(service):
+    return _instances.get(('client', service)) or _create('client', service)
+
+
+def resource(service):
+    return _instances.get(('resource', service)) or _create('resource', service)
+
+
+class LazyClient:
+    # Stands in for a module-level client and builds it on first use, so a cold start
+    # only pays for the clients the invocation actually touches (e.g. no SSM or Logs
+    # client when the rules are cached or nothing is spam).
+
+    def __init__(self, service, kind='client'):
+        self._service = service
+        self._kind = kind
+        self._target = None
+
+    def __getattr__(self, name):
+        target = self._target
+        if target is None:
+            target = self._target = _create(self._kind, self._service)
+        return getattr(target, name)
+
+
+def lazy_client(service):
+    return LazyClient(service)
+
+
+def lazy_resource(service):
+    return LazyClient(service, kind='resource')
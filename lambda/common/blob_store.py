@@ -0,0 +1,114 @@
+import hashlib
+from mime_stream import iter_decoded_payload, upload_stream
+from retry_queue import error_code
+
+# Attachment bodies are stored once under their SHA-256. The per-message key
+# (attachments/{conversationId}/{messageId}/{filename}) is an empty pointer object whose
+# metadata names the blob, so the documented layout and the extractor's S3 trigger stay
+# as they were while repeated files cost one PUT of zero bytes.
+BLOB_PREFIX = 'blobs/sha256/'
+TEXT_PREFIX = 'extracted-text/sha256/'
+BLOB_KEY_METADATA = 'blob-key'
+HASH_METADATA = 'content-sha256'
+SIZE_METADATA = 'blob-size'
+# Set on extracted text that stopped short; the value is the cap that stopped it
+TRUNCATED_METADATA = 'truncated'
+
+# Blob keys known to exist, per container; blobs are immutable so this never goes stale.
+_known_blobs = set()
+
+
+def blob_key(digest):
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}"
+
+
+def text_key(digest):
+    return f"{TEXT_PREFIX}{digest[:2]}/{digest}.txt"
+
+
+def hash_chunks(chunks):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def object_exists(s3, bucket, key):
+    # A missing key is a 404 only when the caller may list the bucket; without
+    # s3:ListBucket S3 answers 403 and this raises.
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except Exception as e:
+        if error_code(e) in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+
+def text_metadata(s3, bucket, key):
+    # Metadata of stored text, or None when there is none yet (see object_exists)
+    try:
+        return s3.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+    except Exception as e:
+        if error_code(e) in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def mark_truncated(s3, bucket, key, reason):
+    # Text is streamed up before the extractor knows whether it will finish, so the flag
+    # is added afterwards by copying the object onto itself (server-side, no download).
+    s3.copy_object(
+        Bucket=bucket,
+        Key=key,
+        CopySource={'Bucket': bucket, 'Key': key},
+        Metadata={TRUNCATED_METADATA: reason},
+        MetadataDirective='REPLACE'
+    )
+
+
+def put_pointer(s3, bucket, key, target_key, digest, size=None):
+    metadata = {BLOB_KEY_METADATA: target_key, HASH_METADATA: digest}
+    if size is not None:
+        metadata[SIZE_METADATA] = str(size)
+    s3.put_object(Bucket=bucket, Key=key, Body=b'', Metadata=metadata)
+
+
+def store_part(s3, bucket, part, key):
+    # Hashes the decoded attachment in one pass, uploads it in a second only if that
+    # content is not stored yet, then writes the pointer at `key`. Returns None for an
+    # empty attachment, otherwise a dict with the pointer key, blob key, digest, size and
+    # whether the content was new.
+    digest, size = hash_chunks(iter_decoded_payload(part))
+    if not size:
+        return None
+
+    target = blob_key(digest)
+    stored = False
+    if target not in _known_blobs and not object_exists(s3, bucket, target):
+        upload_stream(s3, bucket, target, iter_decoded_payload(part))
+        stored = True
+    _known_blobs.add(target)
+
+    # Written after the blob, so anything triggered by the pointer can already read it
+    put_pointer(s3, bucket, key, target, digest, size)
+    return {'key': key, 'blob_key': target, 'sha256': digest, 'size': size, 'stored': stored}
+
+
+def read_pointer(s3, bucket, key):
+    # Returns (target_key, digest) for a pointer object, or (key, None) for an object
+    # written before the store existed, which holds its own content.
+    metadata = s3.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+    if BLOB_KEY_METADATA in metadata:
+        return metadata[BLOB_KEY_METADATA], metadata.get(HASH_METADATA)
+    return key, None
+
+
+def message_attachments(message):
+    # (key to fetch, filename) pairs from a sender queue message. Messages enqueued
+    # before the store existed only carry attachment_keys, which hold the content.
+    if 'attachments' in message:
+        return [(a['key'], a['filename']) for a in message['attachments']]
+    return [(key, key.split('/')[-1]) for key in message.get('attachment_keys', [])]
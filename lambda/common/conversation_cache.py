@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CONVERSATION_CACHE_TTL = int(os.environ.get('CONVERSATION_CACHE_TTL', '300'))  # seconds
+CONVERSATION_CACHE_SIZE = int(os.environ.get('CONVERSATION_CACHE_SIZE', '1024'))
+
+
+class ConversationCache:
+    # Per-container LRU of conversation items with a TTL. Reads go through it and writes
+    # made by this container update it in place, so a warm container rarely needs a
+    # GetItem for a conversation it has already seen. Another container's writes become
+    # visible here after at most the TTL.
+
+    def __init__(self, max_items=CONVERSATION_CACHE_SIZE, ttl=CONVERSATION_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id):
+        with self._lock:
+            entry = self._items.get(conversation_id)
+            if entry is None:
+                return None
+            expires_at, item = entry
+            if expires_at < time.monotonic():
+                del self._items[conversation_id]
+                return None
+            self._items.move_to_end(conversation_id)
+            return item
+
+    def put(self, conversation_id, item):
+        with self._lock:
+            self._items[conversation_id] = (time.monotonic() + self.ttl, dict(item))
+            self._items.move_to_end(conversation_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def update(self, conversation_id, fields):
+        # Write-through for partial updates: merged into a cached item, ignored otherwise
+        # (a partial item would look complete to later reads).
+        with self._lock:
+            entry = self._items.get(conversation_id)
+            if entry is not None:
+                entry[1].update(fields)
+
+    def invalidate(self, conversation_id):
+        with self._lock:
+            self._items.pop(conversation_id, None)
+
+
+conversation_cache = ConversationCache()
@@ -0,0 +1,74 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# botocore clients are thread-safe; aws_clients sizes their connection pool for this many
+# workers in both the record pool and the I/O pool, so no call waits on a connection.
+IO_MAX_WORKERS = int(os.environ.get('IO_MAX_WORKERS', '8'))
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def executor(name='io'):
+    # Created lazily and kept for the life of the container so warm invocations reuse
+    # the threads. Work that fans out from inside a pooled task must use a different
+    # pool than the one it runs on, or a full pool can deadlock waiting on itself.
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=IO_MAX_WORKERS, thread_name_prefix=name)
+        return _executors[name]
+
+
+def submit(fn, *args, **kwargs):
+    return executor().submit(fn, *args, **kwargs)
+
+
+def wait_all(futures):
+    # Waits for every future, even after one fails, so nothing is still writing when the
+    # caller moves on; the first failure is re-raised once all have settled.
+    results = []
+    first_error = None
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(None)
+            if first_error is None:
+                first_error = e
+    if first_error is not None:
+        raise first_error
+    return results
+
+
+class ByteBudget:
+    # Bounds the bytes held by concurrent work: hold(n) waits until n more bytes fit
+    # under max_bytes. A request larger than the whole budget waits until nothing else
+    # is held and then runs alone, so it is slowed down rather than refused.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.held = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size):
+        size = min(size, self.max_bytes)
+        with self._cond:
+            while self.held and self.held + size > self.max_bytes:
+                self._cond.wait()
+            self.held += size
+        return size
+
+    def release(self, size):
+        with self._cond:
+            self.held -= size
+            self._cond.notify_all()
+
+    @contextmanager
+    def hold(self, size):
+        size = self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
@@ -0,0 +1,79 @@
+import os
+import time
+from mypylogger import get_logger
+
+logger = get_logger(__name__)
+
+# When unset the ledger is disabled: load() finds nothing and mark() does nothing.
+LEDGER_TABLE = os.environ.get('LEDGER_TABLE', '')
+LEDGER_TTL_DAYS = int(os.environ.get('LEDGER_TTL_DAYS', '14'))
+
+
+class ProcessingLedger:
+    # Records which stages of a message's processing have finished, so a redelivery
+    # (SES retrying a failed invocation, SQS redelivering a record) resumes where the
+    # last attempt stopped instead of repeating side effects such as outbound mail.
+    #
+    # One item per key: a string set of finished stages plus whatever the caller needs
+    # to resume (first-contact flag, saved attachments). Stages are only ever added, so
+    # concurrent writers cannot undo each other, and items expire via DynamoDB TTL.
+    # Ledger failures never fail the message: a missing read means the work is redone,
+    # a missing write means a later redelivery redoes it.
+
+    def __init__(self, dynamodb, table_name=LEDGER_TABLE, ttl_days=LEDGER_TTL_DAYS):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.ttl_seconds = ttl_days * 86400
+
+    def load(self, key):
+        if not self.table_name:
+            return {}
+        try:
+            response = self.dynamodb.Table(self.table_name).get_item(
+                Key={'ledgerKey': key},
+                ConsistentRead=True
+            )
+            return response.get('Item', {})
+        except Exception as e:
+            logger.warning("ledger_read_failed", extra={"key": key, "error": str(e)})
+            return {}
+
+    def mark(self, key, stages, **attributes):
+        if not self.table_name or not stages:
+            return
+        update_expr = 'ADD stages :stages SET expiresAt = if_not_exists(expiresAt, :ttl)'
+        expr_names = {}
+        expr_values = {
+            ':stages': set(stages),
+            ':ttl': int(time.time()) + self.ttl_seconds,
+        }
+        for i, (name, value) in enumerate(attributes.items()):
+            update_expr += f", #a{i} = :a{i}"
+            expr_names[f"#a{i}"] = name
+            expr_values[f":a{i}"] = value
+
+        request = {
+            'Key': {'ledgerKey': key},
+            'UpdateExpression': update_expr,
+            'ExpressionAttributeValues': expr_values
+        }
+        if expr_names:
+            request['ExpressionAttributeNames'] = expr_names
+        try:
+            self.dynamodb.Table(self.table_name).update_item(**request)
+        except Exception as e:
+            logger.warning("ledger_write_failed", extra={"key": key, "stages": sorted(stages), "error": str(e)})
+
+
+def settle(futures):
+    # Waits for every {stage: future} and returns (results of the stages that finished,
+    # first error), so finished stages can be recorded before the error is re-raised.
+    results = {}
+    first_error = None
+    for stage, future in futures.items():
+        try:
+            results[stage] = future.result()
+        except Exception as e:
+            if first_error is None:
+                first_error = e
+    return results, first_error
@@ -0,0 +1,94 @@
+import base64
+import json
+import os
+from blob_store import text_key
+from mypylogger import get_logger
+
+logger = get_logger(__name__)
+
+# When unset nothing is indexed and queries return no messages.
+MESSAGES_TABLE = os.environ.get('MESSAGES_TABLE', '')
+PREVIEW_CHARS = 200
+# The attachment-extractor stores text for these under the attachment's content hash
+EXTRACTED_EXTENSIONS = ('.pdf', '.docx')
+
+
+def sort_key(received_at, message_id):
+    # ISO timestamps sort chronologically; the message ID keeps two messages received in
+    # the same instant apart and makes a rewrite of the same message land on its own row.
+    return f"{received_at}#{message_id}"
+
+
+def encode_cursor(last_key):
+    return base64.urlsafe_b64encode(json.dumps(last_key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+
+
+class MessageIndex:
+    # One row per message, keyed (conversationId, timestamp), so a thread's history is a
+    # single Query instead of an S3 listing plus a download per archived message. Rows
+    # hold what a thread view shows: direction, sender, subject, a short preview, the
+    # archive key, attachments and the keys their extracted text will be written to:
+    # the hashed text itself, not the empty per-message pointer next to the attachment.
+
+    def __init__(self, dynamodb, table_name=MESSAGES_TABLE):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+
+    def record(self, conversation_id, message_id, received_at, direction, sender, subject,
+               body_text='', attachments=(), size=None):
+        if not self.table_name:
+            return
+        item = {
+            'conversationId': conversation_id,
+            'timestamp': sort_key(received_at, message_id),
+            'messageId': message_id,
+            'receivedAt': received_at,
+            'direction': direction,
+            'sender': sender,
+            'subject': subject,
+            'preview': body_text[:PREVIEW_CHARS],
+            'archiveKey': f"conversations/{conversation_id}/{message_id}",
+            'attachments': [
+                {'key': a['key'], 'blobKey': a['blob_key'], 'filename': a['filename'], 'size': a['size']}
+                for a in attachments
+            ],
+            'textKeys': [
+                text_key(a['sha256']) for a in attachments
+                if a['key'].startswith('attachments/') and a['filename'].lower().endswith(EXTRACTED_EXTENSIONS)
+            ],
+        }
+        if size is not None:
+            item['size'] = size
+        self.dynamodb.Table(self.table_name).put_item(Item=item)
+        logger.info("message_indexed", extra={
+            "conversation_id": conversation_id,
+            "message_id": message_id,
+            "direction": direction
+        })
+
+    def query(self, conversation_id, limit=50, cursor=None, newest_first=True, since=None):
+        # Returns (messages, next_cursor); next_cursor is None on the last page. Pass it
+        # back as cursor for the next page. since limits the page to messages received
+        # at or after that ISO timestamp.
+        if not self.table_name:
+            return [], None
+        request = {
+            'KeyConditionExpression': 'conversationId = :cid',
+            'ExpressionAttributeValues': {':cid': conversation_id},
+            'ScanIndexForward': not newest_first,
+            'Limit': limit,
+        }
+        if since:
+            request['KeyConditionExpression'] += ' AND #ts >= :since'
+            request['ExpressionAttributeNames'] = {'#ts': 'timestamp'}
+            request['ExpressionAttributeValues'][':since'] = since
+        if cursor:
+            request['ExclusiveStartKey'] = decode_cursor(cursor)
+
+        response = self.dynamodb.Table(self.table_name).query(**request)
+        last_key = response.get('LastEvaluatedKey')
+        return response.get('Items', []), encode_cursor(last_key) if last_key else None
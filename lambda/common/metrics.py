@@ -0,0 +1,129 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+
+# Stage timings are written to stdout as CloudWatch Embedded Metric Format, which Lambda
+# ships with the function's logs and CloudWatch turns into metrics; no API calls.
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'EmailHandler')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() != 'false'
+FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+EMF_MAX_VALUES = 100   # values per metric in one EMF record
+
+_samples = []
+_lock = threading.Lock()
+_cold_start = True
+
+
+def record(stage, duration_ms, size=None, error=False):
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _samples.append((stage, duration_ms, size, error))
+
+
+class span(ContextDecorator):
+    # Times a stage, as a context manager or a decorator:
+    #
+    #     with span('mime_parse') as s:
+    #         ...
+    #         s.bytes = size
+    #
+    #     @span('dynamodb_store')
+    #     def store_conversation(...):
+    #
+    # Safe to use from pool threads; samples are emitted when the invocation ends.
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.bytes = None
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call, so concurrent calls do not share state
+        return span(self.stage)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        record(self.stage, (time.perf_counter() - self._started) * 1000, self.bytes, exc_type is not None)
+        return False
+
+
+def _emf(stage, durations, sizes, errors, cold_start):
+    metrics = [{'Name': 'StageDuration', 'Unit': 'Milliseconds'}]
+    entry = {
+        'Function': FUNCTION_NAME,
+        'Stage': stage,
+        'StageDuration': durations,
+        'ColdStart': cold_start,
+        'Errors': errors,
+    }
+    if sizes:
+        metrics.append({'Name': 'StageBytes', 'Unit': 'Bytes'})
+        entry['StageBytes'] = sizes
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Function', 'Stage']],
+                'Metrics': metrics
+            }]
+        },
+        **entry
+    }
+
+
+def flush(cold_start, total_ms):
+    # One record per stage with every sample of that stage as a value array; the
+    # invocation itself is stage "total" and also carries the ColdStart count.
+    with _lock:
+        samples = _samples[:]
+        del _samples[:]
+    if not METRICS_ENABLED:
+        return
+
+    by_stage = {}
+    for stage, duration_ms, size, error in samples:
+        durations, sizes, errors = by_stage.setdefault(stage, ([], [], [0]))
+        durations.append(round(duration_ms, 3))
+        if size is not None:
+            sizes.append(size)
+        errors[0] += error
+
+    lines = []
+    for stage, (durations, sizes, errors) in by_stage.items():
+        for start in range(0, len(durations), EMF_MAX_VALUES):
+            lines.append(_emf(stage, durations[start:start + EMF_MAX_VALUES],
+                              sizes[start:start + EMF_MAX_VALUES], errors[0], cold_start))
+
+    total = _emf('total', [round(total_ms, 3)], [], 0, cold_start)
+    total['_aws']['CloudWatchMetrics'].append({
+        'Namespace': NAMESPACE,
+        'Dimensions': [['Function']],
+        'Metrics': [{'Name': 'ColdStarts', 'Unit': 'Count'}]
+    })
+    total['ColdStarts'] = int(cold_start)
+    lines.append(total)
+
+    for line in lines:
+        print(json.dumps(line))
+
+
+def instrumented(handler):
+    # Wraps a lambda_handler: marks the first invocation in the container as the cold
+    # start and emits the invocation's stage metrics when it returns or raises.
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        started = time.perf_counter()
+        try:
+            return handler(event, context)
+        finally:
+            flush(cold_start, (time.perf_counter() - started) * 1000)
+    return wrapper
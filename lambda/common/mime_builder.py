@@ -0,0 +1,201 @@
+import base64
+import mimetypes
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from email.header import Header
+from email.utils import formatdate
+from urllib.parse import quote
+from retry_queue import error_code
+
+CRLF = b'\r\n'
+MAX_7BIT_LINE = 998
+HEADER_LINE_CHARS = 78                       # RFC 5322 recommended line length
+BASE64_LINE_BYTES = 57                       # raw bytes per 76-character base64 line
+STREAM_READ_SIZE = BASE64_LINE_BYTES * 16384  # ~912 KiB
+
+# Encoded attachment bodies kept per container, keyed by S3 key and validated by ETag.
+# Sized to an eighth of the function's memory unless ATTACHMENT_CACHE_MB says otherwise,
+# so the same code does not claim the same 64 MB on a 128 MB function and a 1 GB one.
+FUNCTION_MEMORY_MB = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '256'))
+ATTACHMENT_CACHE_BYTES = int(os.environ.get('ATTACHMENT_CACHE_MB') or FUNCTION_MEMORY_MB // 8) * 1024 * 1024
+
+CONTENT_TYPE_OVERRIDES = {'.ics': 'text/calendar; charset="utf-8"'}
+
+
+class EncodedBodyCache:
+    # LRU of base64-encoded attachment bodies bounded by total size. Entries carry the
+    # ETag they were encoded from so a changed object is never served stale.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, encoded):
+        size = sum(len(chunk) for chunk in encoded)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            self._entries[key] = (etag, encoded, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+encoded_cache = EncodedBodyCache(ATTACHMENT_CACHE_BYTES)
+
+
+def encode_base64(data):
+    # 76-character lines with CRLF, as RFC 2045 requires
+    return base64.encodebytes(data).replace(b'\n', CRLF)
+
+
+def encode_base64_stream(chunks):
+    # Encodes as the data arrives. Input is re-aligned to 57-byte groups (one 76-char
+    # line each) so the concatenated output is identical to encoding it in one go.
+    encoded = []
+    pending = b''
+    for chunk in chunks:
+        data = pending + chunk if pending else chunk
+        usable = len(data) - len(data) % BASE64_LINE_BYTES
+        if usable:
+            encoded.append(encode_base64(data[:usable]))
+        pending = data[usable:]
+    if pending:
+        encoded.append(encode_base64(pending))
+    return tuple(encoded)
+
+
+def encoded_size(size):
+    # Size of a base64 body with CRLF line breaks for `size` raw bytes
+    lines = -(-size // BASE64_LINE_BYTES)
+    return -(-size // 3) * 4 + lines * 2
+
+
+def fetch_encoded_attachment(s3, bucket, key, etag=None, cache=encoded_cache):
+    # Returns the attachment as a tuple of base64 chunks. With a known ETag (from
+    # head_object) a matching cache entry is used without any request; otherwise a cached
+    # body is revalidated with a conditional GET, so an unchanged object costs a 304 and
+    # no transfer or re-encoding.
+    cached = cache.get(key)
+    if cached is not None and etag is not None and cached[0] == etag:
+        return cached[1]
+    try:
+        if cached is not None and etag is None:
+            obj = s3.get_object(Bucket=bucket, Key=key, IfNoneMatch=cached[0])
+        else:
+            obj = s3.get_object(Bucket=bucket, Key=key)
+    except Exception as e:
+        if cached is not None and error_code(e) in ('304', 'NotModified'):
+            return cached[1]
+        raise
+    body = obj['Body']
+    try:
+        encoded = encode_base64_stream(body.iter_chunks(STREAM_READ_SIZE))
+    finally:
+        body.close()
+    cache.put(key, obj['ETag'], encoded)
+    return encoded
+
+
+def attachment_content_type(filename):
+    lower = filename.lower()
+    for ext, content_type in CONTENT_TYPE_OVERRIDES.items():
+        if lower.endswith(ext):
+            return content_type
+    mime_type, _ = mimetypes.guess_type(filename)
+    return mime_type or 'application/octet-stream'
+
+
+def _header(name, value):
+    # Line breaks in a value would start a new header. ASCII values are folded at
+    # whitespace to HEADER_LINE_CHARS; one that is not ASCII, or still has a line past
+    # MAX_7BIT_LINE (a long unbroken token), goes as UTF-8 encoded-words, which split
+    # anywhere. SES rejects a message with any line over the limit.
+    value = ' '.join(value.splitlines())
+    if value.isascii():
+        folded = Header(value, header_name=name).encode(linesep='\r\n', maxlinelen=HEADER_LINE_CHARS)
+        if all(len(line) <= MAX_7BIT_LINE for line in f"{name}: {folded}".split('\r\n')):
+            return f"{name}: {folded}".encode('ascii') + CRLF
+    folded = Header(value, 'utf-8', header_name=name).encode(linesep='\r\n', maxlinelen=HEADER_LINE_CHARS)
+    return f"{name}: {folded}".encode('ascii') + CRLF
+
+
+def _param(name, value):
+    # Quoted-string for plain ASCII, RFC 2231 extended notation otherwise
+    if value.isascii() and '"' not in value and '\\' not in value:
+        return f'{name}="{value}"'
+    return f"{name}*=utf-8''{quote(value, safe='')}"
+
+
+def _text_part(body):
+    lines = body.splitlines()
+    if body.isascii() and all(len(line) <= MAX_7BIT_LINE for line in lines):
+        return [
+            b'Content-Type: text/plain; charset="us-ascii"', CRLF,
+            b'Content-Transfer-Encoding: 7bit', CRLF,
+            CRLF,
+            '\r\n'.join(lines).encode('ascii'), CRLF,
+        ]
+    return [
+        b'Content-Type: text/plain; charset="utf-8"', CRLF,
+        b'Content-Transfer-Encoding: base64', CRLF,
+        CRLF,
+        encode_base64(body.encode('utf-8')),
+    ]
+
+
+def render_raw_message(sender, recipient, subject, body, attachments, reply_to=None):
+    # Writes the multipart/mixed message straight into a list of byte strings and joins
+    # once. attachments is a list of (filename, content_type, base64_chunks) where the
+    # body is already encoded (see fetch_encoded_attachment), so nothing is re-encoded.
+    boundary = f"=_{uuid.uuid4().hex}"
+    delimiter = f"--{boundary}".encode('ascii')
+
+    out = [
+        _header('From', sender),
+        _header('To', recipient),
+        _header('Subject', subject),
+    ]
+    if reply_to:
+        out.append(_header('Reply-To', reply_to))
+    out += [
+        _header('Date', formatdate(localtime=False)),
+        b'MIME-Version: 1.0', CRLF,
+        f'Content-Type: multipart/mixed; boundary="{boundary}"'.encode('ascii'), CRLF,
+        CRLF,
+        delimiter, CRLF,
+    ]
+    out += _text_part(body)
+
+    for filename, content_type, encoded in attachments:
+        out += [
+            delimiter, CRLF,
+            f"Content-Type: {content_type}; {_param('name', filename)}".encode('ascii'), CRLF,
+            b'Content-Transfer-Encoding: base64', CRLF,
+            f"Content-Disposition: attachment; {_param('filename', filename)}".encode('ascii'), CRLF,
+            CRLF,
+        ]
+        out.extend(encoded)
+
+    out += [delimiter, b'--', CRLF]
+    return b''.join(out)
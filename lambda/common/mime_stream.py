@@ -0,0 +1,144 @@
+import binascii
+import re
+import time
+from email import policy
+from email.feedparser import BytesFeedParser
+from email.parser import BytesHeaderParser
+from metrics import record
+
+READ_CHUNK_SIZE = 1024 * 1024
+DECODE_CHUNK_CHARS = 1024 * 1024
+HEADER_RANGE_BYTES = 64 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024  # S3 requires >= 5 MiB for every part but the last
+
+NON_BASE64_CHARS = re.compile(r'[^A-Za-z0-9+/]')
+
+
+def parse_s3_object(s3, bucket, key):
+    # Feeds the object body to the parser as it arrives, so the raw message is never held
+    # as one bytes object next to the parsed tree. The tree itself is still built in full:
+    # every part's payload is kept, undecoded, until the message is dropped, so peak
+    # memory is about one copy of the message rather than two or more. Time spent waiting
+    # on S3 and time spent parsing are recorded as separate stages.
+    started = time.perf_counter()
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    size = obj.get('ContentLength', 0)
+    body = obj['Body']
+    parser = BytesFeedParser(policy=policy.default)
+    parse_s = 0.0
+    try:
+        for chunk in body.iter_chunks(READ_CHUNK_SIZE):
+            fed = time.perf_counter()
+            parser.feed(chunk)
+            parse_s += time.perf_counter() - fed
+    finally:
+        body.close()
+    fed = time.perf_counter()
+    msg = parser.close()
+    parse_s += time.perf_counter() - fed
+    record('s3_fetch', (time.perf_counter() - started - parse_s) * 1000, size)
+    record('mime_parse', parse_s * 1000, size)
+    return msg, size
+
+
+
+def parse_s3_headers(s3, bucket, key, max_bytes=HEADER_RANGE_BYTES):
+    # Reads only the start of the object and parses the header block, leaving the body
+    # unread. A header block longer than max_bytes comes back truncated.
+    started = time.perf_counter()
+    obj = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{max_bytes - 1}")
+    try:
+        data = obj['Body'].read()
+    finally:
+        obj['Body'].close()
+    end = data.find(b'\r\n\r\n')
+    if end < 0:
+        end = data.find(b'\n\n')
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(data[:end] if end >= 0 else data)
+    record('s3_fetch_headers', (time.perf_counter() - started) * 1000, len(data))
+    return headers
+
+def _iter_base64(payload):
+    # Padding and stray characters are dropped up front so every slice decodes on a
+    # 4-character boundary; a dangling single character is ignored, as email.message does.
+    pending = ''
+    for start in range(0, len(payload), DECODE_CHUNK_CHARS):
+        pending += NON_BASE64_CHARS.sub('', payload[start:start + DECODE_CHUNK_CHARS])
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield binascii.a2b_base64(pending[:usable])
+            pending = pending[usable:]
+    if len(pending) > 1:
+        yield binascii.a2b_base64(pending + '=' * (-len(pending) % 4))
+
+
+def iter_decoded_payload(part):
+    # Decodes base64 attachments slice by slice instead of materialising the whole decoded
+    # payload; other transfer encodings are small in practice and decoded in one go.
+    cte = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    payload = part.get_payload()
+    if cte == 'base64' and isinstance(payload, str):
+        yield from _iter_base64(payload)
+        return
+    data = part.get_payload(decode=True)
+    if data:
+        yield data
+
+
+def upload_stream(s3, bucket, key, chunks, part_size=MULTIPART_PART_SIZE):
+    # Small objects go up in a single put_object; anything over one part switches to a
+    # multipart upload so at most one part is buffered. Returns the number of bytes
+    # written (0 means nothing was uploaded).
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+    total = 0
+
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            total += len(chunk)
+            while len(buffer) >= part_size:
+                if upload_id is None:
+                    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+                parts.append(_upload_part(s3, bucket, key, upload_id, len(parts) + 1, bytes(buffer[:part_size])))
+                del buffer[:part_size]
+
+        if upload_id is None:
+            if buffer:
+                s3.put_object(Bucket=bucket, Key=key, Body=bytes(buffer))
+            return total
+
+        if buffer:
+            parts.append(_upload_part(s3, bucket, key, upload_id, len(parts) + 1, bytes(buffer)))
+        s3.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        return total
+    except Exception:
+        if upload_id is not None:
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def _upload_part(s3, bucket, key, upload_id, part_number, data):
+    response = s3.upload_part(
+        Bucket=bucket,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=part_number,
+        Body=data
+    )
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+
+def copy_within_bucket(s3, bucket, source_key, dest_key):
+    # Server-side copy: the archive never passes back through the Lambda.
+    s3.copy_object(
+        Bucket=bucket,
+        Key=dest_key,
+        CopySource={'Bucket': bucket, 'Key': source_key}
+    )
@@ -0,0 +1,106 @@
+import json
+import os
+import random
+from mypylogger import get_logger
+
+logger = get_logger(__name__)
+
+# Attempts are counted in the message body and survive requeues; SQS's own receive count
+# (and the DLQ redrive policy) still covers crashes and timeouts.
+MAX_ATTEMPTS = int(os.environ.get('SEND_MAX_ATTEMPTS', '6'))
+RETRY_BASE_DELAY = 5     # seconds
+RETRY_MAX_DELAY = 900    # SQS DelaySeconds ceiling
+
+RETRYABLE_ERRORS = {'MailFromDomainNotVerifiedException', 'Throttling', 'ServiceUnavailable'}
+
+
+def error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
+
+
+def is_retryable(error):
+    # Client errors are retried only for the transient codes; anything that is not a
+    # ClientError (connection reset, timeout) is treated as transient.
+    code = error_code(error)
+    return code is None or code in RETRYABLE_ERRORS
+
+
+def backoff_delay(attempt):
+    # Exponential backoff with equal jitter: half the window is fixed, half random, so
+    # a burst of throttled messages does not come back in lockstep.
+    window = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return int(window / 2 + random.uniform(0, window / 2))
+
+
+def schedule_retry(sqs, queue_url, message, attempt):
+    # Puts the message back on its own queue, invisible for the backoff delay, with the
+    # attempt counter advanced. Returns the delay used.
+    delay = backoff_delay(attempt)
+    sqs.send_message(
+        QueueUrl=queue_url,
+        MessageBody=json.dumps({**message, 'attempt': attempt + 1}),
+        DelaySeconds=delay
+    )
+    return delay
+
+
+def send_with_retry(message, send, name, ledger, sqs, queue_url, notify, first_receive=True):
+    # One send per invocation: a retryable failure goes back on the queue with a delay
+    # instead of sleeping here. Only the final failure pages, and only on the first
+    # receive so SQS redeliveries of the same record do not page again. A message whose
+    # idempotency key the ledger has already seen sent is dropped.
+    #
+    # send(message) makes the SES call (building the message first if it has to) and may
+    # return extra fields for the sent event; name prefixes the events ('ack' logs
+    # ack_sent, ack_send_failed, ...); notify(recipient, error) pages.
+    recipient = message['recipient']
+    idempotency_key = message.get('idempotency_key')
+    if idempotency_key and 'sent' in ledger.load(idempotency_key).get('stages', set()):
+        logger.info(f"{name}_send_skipped", extra={
+            "recipient": recipient,
+            "idempotency_key": idempotency_key,
+            "reason": "already_sent"
+        })
+        return
+    attempt = message.get('attempt', 1)
+
+    try:
+        details = send(message)
+        if idempotency_key:
+            ledger.mark(idempotency_key, {'sent'})
+        logger.info(f"{name}_sent", extra={
+            "recipient": recipient,
+            "subject": message['subject'],
+            **(details or {}),
+            "attempt": attempt
+        })
+        return
+    except Exception as e:
+        last_error = e
+        logger.warning(f"{name}_send_failed", extra={
+            "recipient": recipient,
+            "error_code": error_code(e),
+            "error": str(e),
+            "attempt": attempt
+        })
+        if is_retryable(e) and attempt < MAX_ATTEMPTS:
+            delay = schedule_retry(sqs, queue_url, message, attempt)
+            logger.info(f"{name}_retry_scheduled", extra={
+                "recipient": recipient,
+                "attempt": attempt,
+                "delay": delay
+            })
+            return
+
+    logger.error(f"{name}_send_exhausted", extra={
+        "recipient": recipient,
+        "error": str(last_error),
+        "attempts": attempt
+    })
+    if first_receive:
+        notify(recipient, last_error)
+    raise last_error
+
+
+def receive_count(record):
+    return int(record.get('attributes', {}).get('ApproximateReceiveCount', '1'))
@@ -0,0 +1,323 @@
+import json
+import os
+import sqlite3
+import tempfile
+import uuid
+from datetime import datetime
+from mypylogger import get_logger
+from retry_queue import error_code
+
+logger = get_logger(__name__)
+
+# Key prefix the index lives under in the email bucket; when unset nothing is indexed
+# and searches find nothing.
+SEARCH_INDEX_PREFIX = os.environ.get('SEARCH_INDEX_PREFIX', '')
+# Queue the search-indexer takes new documents from; when unset nothing is indexed
+SEARCH_QUEUE_URL = os.environ.get('SEARCH_QUEUE_URL', '')
+# SQS rejects message bodies over 256 KiB; text that would not fit is cut to size
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+# Text past this many characters of one document is not indexed
+MAX_DOC_CHARS = int(os.environ.get('SEARCH_MAX_DOC_CHARS', '200000'))
+# compact() merges this many segments of one level into one segment of the next
+MERGE_FACTOR = int(os.environ.get('SEARCH_MERGE_FACTOR', '10'))
+# Segments at the top level are not merged further
+MAX_LEVEL = 4
+CACHE_DIR = '/tmp/search-index'
+# A compaction can delete a listed segment before sync() downloads it; sync() lists
+# again this many times before giving up.
+SYNC_ATTEMPTS = 3
+
+SCHEMA = (
+    "CREATE VIRTUAL TABLE docs USING fts5("
+    "doc_id UNINDEXED, conversation_id UNINDEXED, message_id UNINDEXED, source UNINDEXED, "
+    "received_at UNINDEXED, subject, body, tokenize = 'porter unicode61')"
+)
+COLUMNS = 'doc_id, conversation_id, message_id, source, received_at, subject, body'
+
+
+def doc_id(conversation_id, message_id, source):
+    return f"{conversation_id}/{message_id}/{source}"
+
+
+def match_expression(query):
+    # Every word must appear; each is quoted so punctuation in addresses, file names
+    # and the like is not read as FTS5 query syntax.
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def document_row(conversation_id, message_id, source, text, subject='', received_at=None):
+    # A document as a tuple in COLUMNS order
+    return (doc_id(conversation_id, message_id, source), conversation_id, message_id, source,
+            received_at or datetime.utcnow().isoformat(), subject or '', (text or '')[:MAX_DOC_CHARS])
+
+
+def queue_message(document):
+    # JSON body for document, with its text cut until the body fits in one SQS message
+    body = json.dumps(document, ensure_ascii=False)
+    excess = len(body.encode('utf-8')) - SQS_MAX_MESSAGE_BYTES
+    while excess > 0:
+        text = document['text'].encode('utf-8')
+        document['text'] = text[:max(0, len(text) - excess)].decode('utf-8', 'ignore')
+        body = json.dumps(document, ensure_ascii=False)
+        excess = len(body.encode('utf-8')) - SQS_MAX_MESSAGE_BYTES
+    return body
+
+
+def write_segment(path, rows):
+    # rows are tuples in COLUMNS order. The finished file is optimized into a single
+    # b-tree per term and vacuumed, since it is never written again.
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(SCHEMA)
+        connection.executemany(f"INSERT INTO docs ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.execute("INSERT INTO docs (docs) VALUES ('optimize')")
+        connection.commit()
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+
+
+def merge_segments(path, sources):
+    # sources are segment files, newest first; a document present in more than one
+    # keeps the newest copy.
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(SCHEMA)
+        for i, source in enumerate(sources):
+            connection.execute(f"ATTACH DATABASE ? AS s{i}", (source,))
+            connection.execute(
+                f"INSERT INTO docs ({COLUMNS}) SELECT {COLUMNS} FROM s{i}.docs "
+                "WHERE doc_id NOT IN (SELECT doc_id FROM docs)"
+            )
+            connection.commit()
+            connection.execute(f"DETACH DATABASE s{i}")
+        connection.execute("INSERT INTO docs (docs) VALUES ('optimize')")
+        connection.commit()
+        connection.execute('VACUUM')
+        return connection.execute("SELECT count(*) FROM docs").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def segment_level(key):
+    return int(key.rsplit('/', 2)[1][1:])
+
+
+class SearchIndex:
+    # Full-text index over message bodies and extracted attachment text, kept in S3 as
+    # immutable SQLite FTS5 segment files:
+    #
+    #   {prefix}segments/L{level}/{created}-{random}.db
+    #
+    # The handlers hand documents to SearchQueue; the search-indexer Lambda writes each
+    # batch it receives as one level-0 segment with add_documents(). compact() (the same
+    # Lambda, on a schedule) merges MERGE_FACTOR segments of a level into one of the next
+    # level and then deletes them, keeping the segment count logarithmic in the document
+    # count.
+    # Segment names sort by the time their newest document was written; the newest copy
+    # of a document wins, both when merging and when searching, so a segment seen both
+    # before and after a merge does not produce duplicate hits.
+    #
+    # search() mirrors the segment files into /tmp (they never change, so a warm container
+    # downloads only segments it has not seen) and queries them locally.
+
+    def __init__(self, s3, bucket, prefix=SEARCH_INDEX_PREFIX, cache_dir=CACHE_DIR):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self._connections = {}
+
+    def segment_key(self, level, created=None):
+        created = created or datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        return f"{self.prefix}segments/L{level}/{created}-{uuid.uuid4().hex[:8]}.db"
+
+    def add_documents(self, rows):
+        # Writes rows (see document_row) as one level-0 segment and returns its key.
+        # Raises on failure, so the caller can have the documents delivered again.
+        key = self.segment_key(0)
+        with tempfile.TemporaryDirectory(dir='/tmp') as scratch:
+            path = os.path.join(scratch, 'segment.db')
+            write_segment(path, rows)
+            self.s3.upload_file(path, self.bucket, key)
+        logger.info("search_documents_indexed", extra={"documents": len(rows), "segment": key})
+        return key
+
+    def list_segments(self):
+        # Segment keys, newest first
+        keys = []
+        request = {'Bucket': self.bucket, 'Prefix': f"{self.prefix}segments/"}
+        while True:
+            page = self.s3.list_objects_v2(**request)
+            keys.extend(item['Key'] for item in page.get('Contents', []) if item['Key'].endswith('.db'))
+            if not page.get('IsTruncated'):
+                break
+            request['ContinuationToken'] = page['NextContinuationToken']
+        return sorted(keys, key=lambda key: key.rsplit('/', 1)[1], reverse=True)
+
+    def compact(self):
+        # Merges full groups of the oldest segments level by level; returns the number
+        # of merges done.
+        merges = 0
+        by_level = {}
+        for key in self.list_segments():
+            by_level.setdefault(segment_level(key), []).append(key)
+
+        for level in range(MAX_LEVEL):
+            # Oldest first, so merged groups cover contiguous ranges of time
+            keys = sorted(by_level.get(level, []), key=lambda key: key.rsplit('/', 1)[1])
+            while len(keys) >= MERGE_FACTOR:
+                group, keys = keys[:MERGE_FACTOR], keys[MERGE_FACTOR:]
+                merged_key = self.merge(group, level + 1)
+                by_level.setdefault(level + 1, []).append(merged_key)
+                merges += 1
+        return merges
+
+    def merge(self, keys, level):
+        with tempfile.TemporaryDirectory(dir='/tmp') as scratch:
+            sources = []
+            for i, key in enumerate(reversed(keys)):
+                path = os.path.join(scratch, f"{i}.db")
+                self.s3.download_file(self.bucket, key, path)
+                sources.append(path)
+            merged_path = os.path.join(scratch, 'merged.db')
+            documents = merge_segments(merged_path, sources)
+            # Named for its newest input, so it still sorts behind any segment written
+            # after that one (such as a redelivered message indexed again)
+            merged_key = self.segment_key(level, keys[-1].rsplit('/', 1)[1].split('-')[0])
+            self.s3.upload_file(merged_path, self.bucket, merged_key)
+            size = os.path.getsize(merged_path)
+
+        # The merged segment is in place before its inputs go, so a search never misses
+        # documents; one that lists both sees duplicates, which it drops.
+        for start in range(0, len(keys), 1000):
+            self.s3.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[start:start + 1000]],
+                'Quiet': True
+            })
+        logger.info("search_segments_merged", extra={
+            "level": level,
+            "inputs": len(keys),
+            "segment": merged_key,
+            "documents": documents,
+            "bytes": size
+        })
+        return merged_key
+
+    def sync(self):
+        # Makes the local mirror match the current segment list and returns the local
+        # paths, newest first. A segment that is gone by the time it is downloaded was
+        # merged into a newer one in the meantime, so the list is read again.
+        for attempt in range(1, SYNC_ATTEMPTS + 1):
+            try:
+                return self._sync(self.list_segments())
+            except Exception as e:
+                if error_code(e) not in ('404', 'NoSuchKey', 'NotFound') or attempt == SYNC_ATTEMPTS:
+                    raise
+                logger.info("search_segment_gone", extra={"attempt": attempt, "error": str(e)})
+
+    def _sync(self, keys):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        wanted = {}
+        for key in keys:
+            path = os.path.join(self.cache_dir, key[len(self.prefix):].replace('/', '_'))
+            wanted[path] = key
+            if not os.path.exists(path):
+                partial = path + '.part'
+                self.s3.download_file(self.bucket, key, partial)
+                os.replace(partial, path)
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if path not in wanted:
+                connection = self._connections.pop(path, None)
+                if connection is not None:
+                    connection.close()
+                os.remove(path)
+        return list(wanted)
+
+    def search(self, query, limit=20, conversation_id=None):
+        # Returns up to limit hits, best first: dicts with the document's conversation,
+        # message, source, received_at, subject and a snippet with matches in [brackets].
+        # bm25 scores are computed per segment, so ranking across segments is approximate.
+        if not self.prefix:
+            return []
+        expression = match_expression(query)
+        if not expression:
+            return []
+        sql = (
+            "SELECT doc_id, conversation_id, message_id, source, received_at, subject, "
+            "snippet(docs, 6, '[', ']', '...', 16), bm25(docs) FROM docs WHERE docs MATCH ?"
+        )
+        params = [expression]
+        if conversation_id:
+            sql += " AND conversation_id = ?"
+            params.append(conversation_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        hits = {}
+        for path in self.sync():
+            for row in self._connection(path).execute(sql, params):
+                if row[0] in hits:
+                    continue
+                hits[row[0]] = {
+                    'conversationId': row[1],
+                    'messageId': row[2],
+                    'source': row[3],
+                    'receivedAt': row[4],
+                    'subject': row[5],
+                    'snippet': row[6],
+                    'score': row[7],
+                }
+        return sorted(hits.values(), key=lambda hit: hit['score'])[:limit]
+
+    def _connection(self, path):
+        connection = self._connections.get(path)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self._connections[path] = connection
+        return connection
+
+
+class SearchQueue:
+    # What the mail handlers index through: each document is one SendMessage to the
+    # search-indexer, which writes a whole batch of them as one segment, so no handler
+    # builds or uploads a segment on its way to delivering mail. text_key names extracted
+    # text in the bucket for the indexer to read, instead of carrying it in the message.
+
+    def __init__(self, sqs, queue_url=SEARCH_QUEUE_URL, prefix=SEARCH_INDEX_PREFIX):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.prefix = prefix
+
+    @property
+    def enabled(self):
+        return bool(self.prefix and self.queue_url)
+
+    def add(self, conversation_id, message_id, source, text='', subject='', received_at=None, text_key=None):
+        # Best effort: returns False instead of raising, so an index outage never holds
+        # up mail. source names the document within the message ('body', or the
+        # attachment's filename).
+        if not self.enabled or not (text or subject or text_key):
+            return False
+        document = {
+            'conversation_id': conversation_id,
+            'message_id': message_id,
+            'source': source,
+            'subject': subject or '',
+            'received_at': received_at or datetime.utcnow().isoformat(),
+        }
+        if text_key:
+            document['text_key'] = text_key
+        else:
+            document['text'] = (text or '')[:MAX_DOC_CHARS]
+        try:
+            self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=queue_message(document))
+        except Exception as e:
+            logger.warning("search_index_failed", extra={
+                "doc_id": doc_id(conversation_id, message_id, source),
+                "error": str(e)
+            })
+            return False
+        return True
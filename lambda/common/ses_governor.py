@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+import aws_clients
+from mypylogger import get_logger
+from retry_queue import error_code
+
+logger = get_logger(__name__)
+
+# Optional per-container ceiling below the account quota (0 = use the quota as-is).
+SES_MAX_SEND_RATE = float(os.environ.get('SES_MAX_SEND_RATE', '0'))
+# When set, sends are also paced account-wide through an atomic per-second counter.
+SES_RATE_TABLE = os.environ.get('SES_RATE_TABLE', '')
+
+QUOTA_FALLBACK_RATE = 1.0   # SES sandbox rate, used if the quota cannot be read
+WINDOW_TTL = 120            # seconds; counter items expire via DynamoDB TTL
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token, going into debt when none is left, and returns how long the
+        # caller must wait before using it. Callers sleep outside the lock.
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class SendRateGovernor:
+    # Paces SES sends before they are throttled. The account's MaxSendRate is read once
+    # per container and fills an in-process token bucket shared by all worker threads;
+    # with SES_RATE_TABLE set, each send also claims a slot in a DynamoDB counter for
+    # the current second so concurrent containers share the quota.
+
+    def __init__(self, ses, table_name=SES_RATE_TABLE, max_send_rate=SES_MAX_SEND_RATE):
+        self.ses = ses
+        self.table_name = table_name
+        self.max_send_rate = max_send_rate
+        self.quota_rate = None
+        self._bucket = None
+        self._dynamodb = None
+        self._init_lock = threading.Lock()
+
+    def _load(self):
+        with self._init_lock:
+            if self._bucket is not None:
+                return
+            try:
+                quota_rate = float(self.ses.get_send_quota()['MaxSendRate'])
+            except Exception as e:
+                logger.warning("ses_quota_unavailable", extra={"error": str(e)})
+                quota_rate = self.max_send_rate or QUOTA_FALLBACK_RATE
+            local_rate = min(quota_rate, self.max_send_rate) if self.max_send_rate > 0 else quota_rate
+            self.quota_rate = quota_rate
+            self._bucket = TokenBucket(local_rate)
+            logger.info("ses_rate_governor_ready", extra={
+                "quota_rate": quota_rate,
+                "local_rate": local_rate,
+                "coordinated": bool(self.table_name)
+            })
+
+    def acquire(self):
+        if self._bucket is None:
+            self._load()
+        wait = self._bucket.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        if self.table_name:
+            self._acquire_global()
+
+    def _acquire_global(self):
+        limit = max(1, int(self.quota_rate))
+        if self._dynamodb is None:
+            self._dynamodb = aws_clients.client('dynamodb')
+
+        while True:
+            now = time.time()
+            window = int(now)
+            try:
+                self._dynamodb.update_item(
+                    TableName=self.table_name,
+                    Key={'rateWindow': {'S': f"ses#{window}"}},
+                    UpdateExpression='ADD sends :one SET expiresAt = :ttl',
+                    ConditionExpression='attribute_not_exists(sends) OR sends < :limit',
+                    ExpressionAttributeValues={
+                        ':one': {'N': '1'},
+                        ':limit': {'N': str(limit)},
+                        ':ttl': {'N': str(window + WINDOW_TTL)}
+                    }
+                )
+                return
+            except Exception as e:
+                if error_code(e) != 'ConditionalCheckFailedException':
+                    # Coordination is best-effort; the local bucket still paces this container.
+                    logger.warning("ses_rate_coordination_failed", extra={"error": str(e)})
+                    return
+            # This second's quota is spent account-wide; try again in the next window.
+            time.sleep(window + 1 - now)
@@ -0,0 +1,23 @@
+from io_stage import executor
+
+
+def process_batch(records, handle_record):
+    # Runs handle_record for every SQS record concurrently and returns (record, error)
+    # for each one that raised; the rest of the batch is unaffected. Records get their
+    # own pool so a handler can still fan out I/O on the default one.
+    pool = executor('records')
+    futures = [(record, pool.submit(handle_record, record)) for record in records]
+    failures = []
+    for record, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            failures.append((record, e))
+    return failures
+
+
+def batch_response(failures):
+    # Partial batch response (ReportBatchItemFailures): SQS redelivers only these records.
+    return {
+        'batchItemFailures': [{'itemIdentifier': record['messageId']} for record, _ in failures]
+    }
@@ -1,122 +1,181 @@
-import email.mime.application
-import email.mime.multipart
-import email.mime.text
 import json
-import mimetypes
 import os
-import time
-import boto3
+from urllib.parse import quote
+from aws_clients import lazy_client, lazy_resource
+from blob_store import message_attachments
+from io_stage import ByteBudget, submit
+from ledger import ProcessingLedger
+from metrics import instrumented, span
+from mime_builder import (ATTACHMENT_CACHE_BYTES, FUNCTION_MEMORY_MB, attachment_content_type, encoded_size,
+                          fetch_encoded_attachment, render_raw_message)
 from mypylogger import get_logger
+from retry_queue import receive_count, send_with_retry
+from ses_governor import SendRateGovernor
+from sqs_batch import batch_response, process_batch
 
 logger = get_logger(__name__)
 
-ses = boto3.client('ses')
-s3 = boto3.client('s3')
-sns = boto3.client('sns')
+ses = lazy_client('ses')
+s3 = lazy_client('s3')
+sqs = lazy_client('sqs')
+sns = lazy_client('sns')
+
+governor = SendRateGovernor(ses)
+ledger = ProcessingLedger(lazy_resource('dynamodb'))
 
 PUBLIC_EMAIL = os.environ['PUBLIC_EMAIL']
 SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 BUCKET_NAME = os.environ['BUCKET_NAME']
+QUEUE_URL = os.environ['QUEUE_URL']
+
+# SendRawEmail rejects messages over 10 MB after encoding
+SES_MAX_MESSAGE_BYTES = int(os.environ.get('SES_MAX_MESSAGE_BYTES', str(10 * 1024 * 1024)))
+MESSAGE_OVERHEAD_BYTES = 64 * 1024  # headers, boundaries, part headers and link footer
+PRESIGNED_URL_TTL = 7 * 24 * 3600   # SigV4 maximum
+
+# Memory one send holds at its peak, per byte of the planned message: the encoded
+# attachment chunks, the joined raw message, and the base64 and form-encoded copies
+# botocore makes of it for the SendRawEmail request.
+SEND_MEMORY_FACTOR = 6
+# What the runtime, boto3 and the handler use before any message is built
+BASELINE_MEMORY_MB = 128
 
-RETRY_DELAYS = [0, 5, 30, 120]
-RETRYABLE_ERRORS = {'MailFromDomainNotVerifiedException', 'Throttling', 'ServiceUnavailable'}
 
-ICS_EXTENSIONS = {'.ics'}
+def send_memory_budget(memory_mb=FUNCTION_MEMORY_MB, cache_bytes=ATTACHMENT_CACHE_BYTES):
+    # Bytes the records of a batch may hold at once while building and sending: the
+    # function's memory less the baseline and the encoded attachment cache.
+    return (memory_mb - BASELINE_MEMORY_MB) * 1024 * 1024 - cache_bytes
 
 
-def build_raw_message(recipient, subject, body, reply_to, attachment_keys):
-    msg = email.mime.multipart.MIMEMultipart()
-    msg['From'] = PUBLIC_EMAIL
-    msg['To'] = recipient
-    msg['Subject'] = subject
-    if reply_to:
-        msg['Reply-To'] = reply_to
+# A batch's records build and send concurrently, and a full-size message costs several
+# times SES_MAX_MESSAGE_BYTES, so each record holds its share of this budget from the
+# first download until SES has the request. Small messages still all run at once; large
+# ones queue behind each other instead of running the function out of memory.
+send_budget = ByteBudget(send_memory_budget())
 
-    msg.attach(email.mime.text.MIMEText(body, 'plain'))
 
-    for key in attachment_keys:
-        filename = key.split('/')[-1]
-        lower = filename.lower()
+def head_attachment(key):
+    head = s3.head_object(Bucket=BUCKET_NAME, Key=key)
+    return head['ContentLength'], head['ETag']
 
+
+def plan_attachments(sources, body):
+    # sources are (key, filename) pairs in MIME order. Sizes come from head_object, so
+    # nothing is downloaded until we know what fits. Smallest attachments are inlined
+    # first; whatever would push the encoded message past the SES limit is sent as a
+    # presigned link instead. Both lists keep the original order.
+    heads = [(i, key, filename, submit(head_attachment, key)) for i, (key, filename) in enumerate(sources)]
+    found = []
+    for i, key, filename, future in heads:
         try:
-            obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-            data = obj['Body'].read()
+            size, etag = future.result()
         except Exception as e:
             logger.error("attachment_fetch_failed", extra={"key": key, "error": str(e)})
             continue
-
-        if any(lower.endswith(ext) for ext in ICS_EXTENSIONS):
-            part = email.mime.text.MIMEText(data.decode('utf-8', errors='replace'), 'calendar')
-            part.add_header('Content-Disposition', 'attachment', filename=filename)
+        found.append((size, i, key, filename, etag))
+
+    budget = SES_MAX_MESSAGE_BYTES - MESSAGE_OVERHEAD_BYTES - encoded_size(len(body.encode('utf-8')))
+    inline = []
+    linked = []
+    for size, i, key, filename, etag in sorted(found):
+        cost = encoded_size(size)
+        if cost <= budget:
+            inline.append((i, key, filename, etag, size))
+            budget -= cost
         else:
-            mime_type, _ = mimetypes.guess_type(filename)
-            maintype, subtype = (mime_type or 'application/octet-stream').split('/', 1)
-            part = email.mime.application.MIMEApplication(data, Name=filename)
-            part.add_header('Content-Disposition', 'attachment', filename=filename)
-
-        msg.attach(part)
-
-    return msg.as_bytes()
-
-
-def send_with_retry(recipient, subject, body, reply_to, attachment_keys):
-    raw = build_raw_message(recipient, subject, body, reply_to, attachment_keys)
-    last_error = None
-
-    for attempt, delay in enumerate(RETRY_DELAYS, start=1):
-        if delay > 0:
-            time.sleep(delay)
+            linked.append((i, key, filename))
+
+    inline.sort()
+    linked.sort()
+    return [item[1:] for item in inline], [item[1:] for item in linked]
+
+
+def planned_size(body, inline):
+    # Encoded size of the message plan_attachments laid out, at most SES_MAX_MESSAGE_BYTES
+    return (MESSAGE_OVERHEAD_BYTES + encoded_size(len(body.encode('utf-8')))
+            + sum(encoded_size(size) for _, _, _, size in inline))
+
+
+def link_footer(linked):
+    # Links are signed with the function's role credentials, so they stop working when
+    # that session expires even if PRESIGNED_URL_TTL has not elapsed. Blob keys carry no
+    # filename, so the download is named through the response headers.
+    footer = ''
+    for key, filename in linked:
+        url = s3.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': BUCKET_NAME,
+                'Key': key,
+                'ResponseContentDisposition': f"attachment; filename*=utf-8''{quote(filename, safe='')}"
+            },
+            ExpiresIn=PRESIGNED_URL_TTL
+        )
+        footer += f"\n[Attachment too large to forward: {filename}]\n{url}"
+    return footer
+
+
+def build_raw_message(recipient, subject, body, reply_to, plan):
+    # plan is the (inline, linked) pair from plan_attachments
+    inline, linked = plan
+    if linked:
+        body += "\n" + link_footer(linked)
+        logger.info("attachments_linked", extra={"recipient": recipient, "keys": [key for key, _ in linked]})
+
+    # Downloads run concurrently and are base64-encoded as they stream in
+    fetches = [(key, filename, submit(fetch_encoded_attachment, s3, BUCKET_NAME, key, etag))
+               for key, filename, etag, _ in inline]
+    attachments = []
+    for key, filename, future in fetches:
         try:
+            encoded = future.result()
+        except Exception as e:
+            logger.error("attachment_fetch_failed", extra={"key": key, "error": str(e)})
+            continue
+        attachments.append((filename, attachment_content_type(filename), encoded))
+
+    return render_raw_message(PUBLIC_EMAIL, recipient, subject, body, attachments, reply_to=reply_to)
+
+
+def send_forward(message):
+    sources = message_attachments(message)
+    body = message['body']
+    plan = plan_attachments(sources, body)
+    with send_budget.hold(SEND_MEMORY_FACTOR * planned_size(body, plan[0])):
+        with span('build_message') as timer:
+            raw = build_raw_message(message['recipient'], message['subject'], body, message.get('reply_to'), plan)
+            timer.bytes = len(raw)
+        with span('rate_wait'):
+            governor.acquire()
+        with span('ses_send'):
             ses.send_raw_email(
                 Source=PUBLIC_EMAIL,
-                Destinations=[recipient],
+                Destinations=[message['recipient']],
                 RawMessage={'Data': raw}
             )
-            logger.info("forward_sent", extra={
-                "recipient": recipient,
-                "subject": subject,
-                "attachment_count": len(attachment_keys),
-                "attempt": attempt
-            })
-            return
-        except ses.exceptions.ClientError as e:
-            error_code = e.response['Error']['Code']
-            last_error = e
-            logger.warning("forward_send_failed", extra={
-                "recipient": recipient,
-                "error_code": error_code,
-                "attempt": attempt
-            })
-            if error_code not in RETRYABLE_ERRORS:
-                break
-        except Exception as e:
-            last_error = e
-            logger.warning("forward_send_failed", extra={
-                "recipient": recipient,
-                "error": str(e),
-                "attempt": attempt
-            })
-
-    logger.error("forward_send_exhausted", extra={
-        "recipient": recipient,
-        "error": str(last_error),
-        "attempts": len(RETRY_DELAYS)
-    })
+    return {"attachment_count": len(sources)}
+
+
+def notify_exhausted(recipient, error):
     sns.publish(
         TopicArn=SNS_TOPIC_ARN,
         Subject="Forward Sender: Send Failed After Retries",
-        Message=f"Failed to forward email to {recipient}: {last_error}"
+        Message=f"Failed to forward email to {recipient}: {error}"
     )
-    raise last_error
 
 
+def handle_record(record):
+    message = json.loads(record['body'])
+    send_with_retry(message, send_forward, 'forward', ledger, sqs, QUEUE_URL, notify_exhausted,
+                    first_receive=receive_count(record) == 1)
+
+
+@instrumented
 def lambda_handler(event, context):
-    for record in event['Records']:
-        message = json.loads(record['body'])
-        send_with_retry(
-            recipient=message['recipient'],
-            subject=message['subject'],
-            body=message['body'],
-            reply_to=message.get('reply_to'),
-            attachment_keys=message.get('attachment_keys', [])
-        )
+    failures = process_batch(event['Records'], handle_record)
+    for record, error in failures:
+        logger.error("forward_record_failed", extra={
+            "message_id": record['messageId'],
+            "error": str(error)
+        })
+    return batch_response(failures)
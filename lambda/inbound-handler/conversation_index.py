@@ -0,0 +1,112 @@
+import os
+import re
+from conversation_cache import ConversationCache
+from mypylogger import get_logger
+from retry_queue import error_code
+
+logger = get_logger(__name__)
+
+# When unset, IDs are derived from the sender on every message and nothing is stored.
+CONVERSATION_ALIAS_TABLE = os.environ.get('CONVERSATION_ALIAS_TABLE', '')
+# An alias only changes when it is repointed with add_alias(overwrite=True), so resolved
+# aliases are kept much longer than conversation items and a warm container resolves a
+# returning sender without any read.
+CONVERSATION_ALIAS_CACHE_TTL = int(os.environ.get('CONVERSATION_ALIAS_CACHE_TTL', '3600'))  # seconds
+# Relay domains send every person's mail from throwaway addresses, so the sender is
+# identified by display name instead: "domain=label" pairs, comma-separated. The label
+# suffixes the derived conversation ID.
+RELAY_DOMAINS = dict(
+    entry.strip().split('=', 1)
+    for entry in os.environ.get('RELAY_DOMAINS', 'bounce.linkedin.com=linkedin').split(',')
+    if '=' in entry
+)
+
+
+def slugify(text):
+    text = text.lower().strip()
+    text = re.sub(r'[^a-z0-9\s-]', '', text)
+    text = re.sub(r'[\s-]+', '-', text)
+    return text.strip('-')
+
+
+def sender_domain(sender_email):
+    return sender_email.split('@')[1].lower() if '@' in sender_email else ''
+
+
+def alias_key(sender_email, display_name=None):
+    # The index key a sender is looked up by: the display name for relay domains that
+    # carry one, otherwise the address exactly as it arrived. Keys map one to one onto
+    # derived IDs, so addresses that had separate conversations before the index (a
+    # different case, a +tag) still do; add_alias joins them when they should not.
+    domain = sender_domain(sender_email)
+    if domain in RELAY_DOMAINS and display_name:
+        return f"name#{domain}#{slugify(display_name)}"
+    return f"addr#{sender_email}"
+
+
+def derive_conversation_id(sender_email, display_name=None):
+    # The ID a sender gets the first time it is seen. Kept identical to the IDs issued
+    # before the index existed, so those conversations resolve without a backfill.
+    domain = sender_domain(sender_email)
+
+    if domain in RELAY_DOMAINS and display_name:
+        slug = slugify(display_name)
+        return f"{slug}-{RELAY_DOMAINS[domain]}"
+
+    return sender_email.replace('@', '-at-')
+
+
+class ConversationIndex:
+    # Resolves a sender to its conversationId with one GetItem on the alias table
+    # (alias -> conversationId), read through a per-container cache; a cached alias
+    # costs no request at all. A sender seen for
+    # the first time gets the derived ID, claimed with a conditional put so concurrent
+    # containers agree on it. Extra addresses or names for an existing conversation are
+    # added with add_alias (see scripts/conversation_aliases.py). Lookup failures fall
+    # back to the derived ID.
+
+    def __init__(self, dynamodb, table_name=CONVERSATION_ALIAS_TABLE, cache=None):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.cache = cache or ConversationCache(ttl=CONVERSATION_ALIAS_CACHE_TTL)
+
+    def resolve(self, sender_email, display_name=None):
+        key = alias_key(sender_email, display_name)
+        cached = self.cache.get(key)
+        if cached:
+            return cached['conversationId']
+
+        derived = derive_conversation_id(sender_email, display_name)
+        if not self.table_name:
+            return derived
+
+        try:
+            table = self.dynamodb.Table(self.table_name)
+            item = table.get_item(Key={'alias': key}).get('Item')
+            if item is None:
+                item = self.add_alias(key, derived)
+        except Exception as e:
+            logger.warning("conversation_resolve_failed", extra={"alias": key, "error": str(e)})
+            return derived
+
+        self.cache.put(key, item)
+        return item['conversationId']
+
+    def add_alias(self, key, conversation_id, overwrite=False):
+        # Returns the item now stored for the alias, which is another writer's when it
+        # claimed the alias first (unless overwrite is set).
+        item = {'alias': key, 'conversationId': conversation_id}
+        table = self.dynamodb.Table(self.table_name)
+        request = {'Item': item}
+        if not overwrite:
+            request['ConditionExpression'] = 'attribute_not_exists(#alias)'
+            request['ExpressionAttributeNames'] = {'#alias': 'alias'}
+        try:
+            table.put_item(**request)
+        except Exception as e:
+            if error_code(e) != 'ConditionalCheckFailedException':
+                raise
+            return table.get_item(Key={'alias': key}, ConsistentRead=True)['Item']
+        self.cache.put(key, item)
+        logger.info("conversation_alias_added", extra={"alias": key, "conversation_id": conversation_id})
+        return item
@@ -1,24 +1,30 @@
 import json
 import os
-import re
-import hashlib
-import time
-import boto3
-import pcre2
-from email import policy
-from email.parser import BytesParser
+import zlib
+from aws_clients import lazy_client, lazy_resource
+from blob_store import store_part
 from email.utils import parseaddr
 from datetime import datetime
 from mypylogger import get_logger
+from conversation_index import ConversationIndex
+from html_text import html_part_to_text
+from io_stage import submit, wait_all
+from ledger import ProcessingLedger, settle
+from message_index import MessageIndex
+from metrics import instrumented, span
+from mime_stream import copy_within_bucket, parse_s3_headers, parse_s3_object
+from rule_source import SpamRuleSource
+from search_index import SearchQueue
+from spam_audit import SpamAuditSink
 
 logger = get_logger(__name__)
 
-s3 = boto3.client('s3')
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
-ssm = boto3.client('ssm')
-logs = boto3.client('logs')
+s3 = lazy_client('s3')
+sqs = lazy_client('sqs')
+dynamodb = lazy_resource('dynamodb')
+sns = lazy_client('sns')
+ssm = lazy_client('ssm')
+logs = lazy_client('logs')
 
 BUCKET_NAME = os.environ['BUCKET_NAME']
 TABLE_NAME = os.environ['TABLE_NAME']
@@ -29,60 +35,40 @@ SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 SPAM_KEYWORDS_SSM_PARAM = os.environ['SPAM_KEYWORDS_SSM_PARAM']
 ACK_QUEUE_URL = os.environ['ACK_QUEUE_URL']
 FORWARD_QUEUE_URL = os.environ['FORWARD_QUEUE_URL']
+SPAM_AUDIT_MODE = os.environ.get('SPAM_AUDIT_MODE', 'logs')  # 'logs' or 'emf'
 
 SPAM_LOG_GROUP = '/email-handler/spam'
-SPAM_KEYWORDS_TTL = 300  # seconds; reload keywords after 5 minutes
+PREVIEW_CHARS = 1000
+PREVIEW_MAX_BYTES = 600
 
-spam_keywords = None
-spam_keywords_loaded_at = 0.0
+spam_audit = SpamAuditSink(logs, SPAM_LOG_GROUP, SPAM_AUDIT_MODE)
+spam_rule_source = SpamRuleSource(ssm, s3, BUCKET_NAME, SPAM_KEYWORDS_SSM_PARAM)
+ledger = ProcessingLedger(dynamodb)
+conversation_index = ConversationIndex(dynamodb)
+message_index = MessageIndex(dynamodb)
+search_queue = SearchQueue(sqs)
 
 def load_spam_keywords():
-    global spam_keywords, spam_keywords_loaded_at
-    now = time.time()
-    if spam_keywords is not None and (now - spam_keywords_loaded_at) < SPAM_KEYWORDS_TTL:
-        return spam_keywords
+    # Patterns are compiled (and invalid ones rejected) once per change to keywords.txt,
+    # not per message; see rule_source for how changes are picked up.
+    return spam_rule_source.get()
 
-    try:
-        param_response = ssm.get_parameter(Name=SPAM_KEYWORDS_SSM_PARAM)
-        s3_key = param_response['Parameter']['Value']
-
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=s3_key)
-        content = obj['Body'].read().decode('utf-8')
 
-        loaded = {
-            "blocked_sender_domains": [],
-            "subject_patterns": [],
-            "body_patterns": []
-        }
+def extract_body_text(msg):
+    # The plain part when there is one; otherwise the visible text of the HTML part, so
+    # HTML-only mail is still checked against the body rules and forwarded readable.
+    body = msg.get_body(preferencelist=('plain', 'html'))
+    if body is None:
+        return ''
+    if body.get_content_subtype() != 'html':
+        return body.get_content()
+    with span('html_to_text') as timer:
+        text, timer.bytes = html_part_to_text(body)
+    return text
 
-        current_section = None
-        for line in content.split('\n'):
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-
-            if line == '--- BLOCKED_SENDER_DOMAINS ---':
-                current_section = 'blocked_sender_domains'
-            elif line == '--- SUBJECT_PATTERNS ---':
-                current_section = 'subject_patterns'
-            elif line == '--- BODY_PATTERNS ---':
-                current_section = 'body_patterns'
-            elif current_section:
-                loaded[current_section].append(line)
-
-        spam_keywords = loaded
-        spam_keywords_loaded_at = now
-        return spam_keywords
-    except Exception as e:
-        logger.error("failed_to_load_spam_keywords", extra={"error": str(e)})
-        return {"blocked_sender_domains": [], "subject_patterns": [], "body_patterns": []}
 
-
-def slugify(text):
-    text = text.lower().strip()
-    text = re.sub(r'[^a-z0-9\s-]', '', text)
-    text = re.sub(r'[\s-]+', '-', text)
-    return text.strip('-')
+def is_dsn_message(subject, sender_email):
+    return subject.lower().startswith('delivery status') or 'mailer-daemon' in sender_email.lower()
 
 
 def extract_display_name(msg):
@@ -91,30 +77,8 @@ def extract_display_name(msg):
     return display_name if display_name else None
 
 
-def email_to_conversation_id(sender_email, display_name=None):
-    domain = sender_email.split('@')[1] if '@' in sender_email else ''
-
-    if domain == 'bounce.linkedin.com' and display_name:
-        slug = slugify(display_name)
-        return f"{slug}-linkedin"
-
-    return sender_email.replace('@', '-at-')
-
-
-def is_first_contact(sender_email):
-    # Table has only conversationId as hash key (no sort key), so get_item works correctly.
-    table = dynamodb.Table(TABLE_NAME)
-    conversation_id = email_to_conversation_id(sender_email)
-
-    try:
-        response = table.get_item(Key={'conversationId': conversation_id})
-        return 'Item' not in response
-    except Exception as e:
-        logger.error("dynamodb_check_failed", extra={"error": str(e), "sender": sender_email})
-        return False
-
-
-def enqueue_acknowledgement(sender_email, subject):
+@span('sqs_ack')
+def enqueue_acknowledgement(sender_email, subject, message_id=None):
     try:
         with open('auto-acknowledgement.txt', 'r') as f:
             body = f.read()
@@ -124,7 +88,8 @@ def enqueue_acknowledgement(sender_email, subject):
             MessageBody=json.dumps({
                 'recipient': sender_email,
                 'subject': 'Thank you for reaching out',
-                'body': body
+                'body': body,
+                'idempotency_key': f"{message_id}#ack" if message_id else None
             })
         )
         logger.info("ack_enqueued", extra={
@@ -140,7 +105,9 @@ def enqueue_acknowledgement(sender_email, subject):
         )
 
 
-def enqueue_forward(sender_email, subject, body, conversation_id, attachment_keys=None, skipped_filenames=None):
+@span('sqs_forward')
+def enqueue_forward(sender_email, subject, body, conversation_id, attachments=None, skipped_filenames=None,
+                    message_id=None):
     if not conversation_id:
         logger.error("enqueue_forward_skipped", extra={"reason": "empty_conversation_id", "subject": subject})
         return
@@ -160,7 +127,9 @@ def enqueue_forward(sender_email, subject, body, conversation_id, attachment_key
                 'subject': f"Fwd: {subject}",
                 'body': body + footer,
                 'reply_to': reply_to,
-                'attachment_keys': attachment_keys or []
+                'attachment_keys': [a['key'] for a in attachments or []],
+                'attachments': [{'key': a['blob_key'], 'filename': a['filename']} for a in attachments or []],
+                'idempotency_key': f"{message_id}#forward" if message_id else None
             })
         )
         logger.info("forward_enqueued", extra={
@@ -178,37 +147,65 @@ def enqueue_forward(sender_email, subject, body, conversation_id, attachment_key
         )
 
 
-def store_conversation(conversation_id, sender_email, subject, body_text, display_name=None):
-    # Uses update_item with if_not_exists for firstContactDate so follow-up emails
-    # update lastMessageBody/timestamp without overwriting the original contact date.
+def compact_preview(body_text):
+    # zlib-compressed start of the body, at most PREVIEW_MAX_BYTES: text that compresses
+    # poorly is halved until it fits, dropping a character cut in two. The rest of the item
+    # is not bounded here; the whole message is in S3 at lastMessageKey.
+    text = body_text[:PREVIEW_CHARS].encode('utf-8')
+    preview = zlib.compress(text)
+    while len(preview) > PREVIEW_MAX_BYTES:
+        text = text[:len(text) // 2].decode('utf-8', 'ignore').encode('utf-8')
+        preview = zlib.compress(text)
+    return preview
+
+@span('dynamodb_store')
+def store_conversation(conversation_id, sender_email, subject, body_text, display_name=None, message_id=None):
+    # Upserts the conversation and reports whether this is first contact in the same
+    # round trip: ALL_OLD returns no attributes when the item did not exist yet.
+    # if_not_exists keeps firstContactDate from being overwritten on follow-up emails.
+    # Every field is written on every message: another container may have changed any of
+    # them, and the write is billed on the item's size either way. messageCount counts
+    # the messages received. Returns None on failure so no acknowledgement is sent for an
+    # unrecorded sender.
     table = dynamodb.Table(TABLE_NAME)
     timestamp = datetime.utcnow().isoformat()
 
     try:
-        update_expr = (
-            'SET senderEmail = :email, emailDomain = :domain, '
-            'subject = :subject, lastMessageBody = :body, '
-            '#ts = :ts, '
-            'firstContactDate = if_not_exists(firstContactDate, :ts)'
-        )
-        expr_values = {
-            ':email': sender_email,
-            ':domain': sender_email.split('@')[1] if '@' in sender_email else '',
-            ':subject': subject,
-            ':body': body_text[:1000],
-            ':ts': timestamp,
+        fields = {
+            'senderEmail': sender_email,
+            'emailDomain': sender_email.split('@')[1] if '@' in sender_email else '',
+            'subject': subject,
+            'timestamp': timestamp,
+            'lastMessagePreview': compact_preview(body_text),
         }
-
         if display_name:
-            update_expr += ', displayName = :dn'
-            expr_values[':dn'] = display_name
+            fields['displayName'] = display_name
+        if message_id:
+            fields['lastMessageKey'] = f"conversations/{conversation_id}/{message_id}"
+
+        expr_names = {}
+        expr_values = {':ts': timestamp, ':one': 1}
+        assignments = []
+        for i, (name, value) in enumerate(fields.items()):
+            expr_names[f"#f{i}"] = name
+            expr_values[f":f{i}"] = value
+            assignments.append(f"#f{i} = :f{i}")
+        # Items written before the compact layout carry the body inline
+        update_expr = (
+            f"SET {', '.join(assignments)}, "
+            'firstContactDate = if_not_exists(firstContactDate, :ts) '
+            'ADD messageCount :one '
+            'REMOVE lastMessageBody'
+        )
 
-        table.update_item(
+        response = table.update_item(
             Key={'conversationId': conversation_id},
             UpdateExpression=update_expr,
-            ExpressionAttributeNames={'#ts': 'timestamp'},
-            ExpressionAttributeValues=expr_values
+            ExpressionAttributeNames=expr_names,
+            ExpressionAttributeValues=expr_values,
+            ReturnValues='ALL_OLD'
         )
+        return not response.get('Attributes')
     except Exception as e:
         logger.error("dynamodb_store_failed", extra={"error": str(e), "conversation_id": conversation_id})
         sns.publish(
@@ -216,11 +213,30 @@ def store_conversation(conversation_id, sender_email, subject, body_text, displa
             Subject="Inbound Handler: DynamoDB Store Failed",
             Message=f"Failed to store conversation {conversation_id}: {str(e)}"
         )
+        return None
 
 FORWARDED_EXTENSIONS = {'.pdf', '.docx', '.ics', '.xlsx', '.png', '.jpg', '.jpeg'}
 
+def save_attachment(part, key, filename):
+    try:
+        with span('attachment_upload') as timer:
+            saved = store_part(s3, BUCKET_NAME, part, key)
+            timer.bytes = saved['size'] if saved else 0
+        if saved:
+            logger.info("attachment_saved", extra={
+                "key": key,
+                "blob_key": saved['blob_key'],
+                "size": saved['size'],
+                "deduplicated": not saved['stored']
+            })
+            return {**saved, 'filename': filename}
+    except Exception as e:
+        logger.error("attachment_save_failed", extra={"error": str(e), "filename": filename})
+    return None
+
 def save_attachments(msg, conversation_id, message_id):
-    saved_keys = []
+    # Uploads run concurrently; attachments come back in MIME order.
+    uploads = []
     skipped_filenames = []
 
     for part in msg.iter_attachments():
@@ -230,22 +246,17 @@ def save_attachments(msg, conversation_id, message_id):
         lower = filename.lower()
         ext = next((e for e in FORWARDED_EXTENSIONS if lower.endswith(e)), None)
         if ext:
-            data = part.get_payload(decode=True)
-            if data:
-                key = f"attachments/{conversation_id}/{message_id}/{filename}"
-                try:
-                    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=data)
-                    logger.info("attachment_saved", extra={"key": key})
-                    saved_keys.append(key)
-                except Exception as e:
-                    logger.error("attachment_save_failed", extra={"error": str(e), "filename": filename})
+            key = f"attachments/{conversation_id}/{message_id}/{filename}"
+            uploads.append(submit(save_attachment, part, key, filename))
         else:
             skipped_filenames.append(filename)
             logger.info("attachment_skipped", extra={"filename": filename, "conversation_id": conversation_id})
 
-    return saved_keys, skipped_filenames
+    saved = [attachment for attachment in wait_all(uploads) if attachment]
+    return saved, skipped_filenames
 
-def check_spam(ses_record, mail, subject, body, sender_email):
+def check_envelope(ses_record, mail, sender_email, rules=None):
+    # Gates that need only the SES event: verdicts, recipient and blocked sender domains.
     spam_verdict = ses_record['receipt'].get('spamVerdict', {}).get('status')
     virus_verdict = ses_record['receipt'].get('virusVerdict', {}).get('status')
 
@@ -256,81 +267,47 @@ def check_spam(ses_record, mail, subject, body, sender_email):
     if not destination or destination[0] != PUBLIC_EMAIL:
         return True, "recipient_mismatch"
 
-    keywords = load_spam_keywords()
+    if rules is None:
+        rules = load_spam_keywords()
 
     sender_domain = sender_email.split('@')[1] if '@' in sender_email else ''
-    for pattern in keywords.get('blocked_sender_domains', []):
-        try:
-            compiled = pcre2.compile(pattern, pcre2.IGNORECASE)
-            if compiled.search(sender_domain):
-                return True, f"blocked_domain:{pattern}"
-        except Exception as e:
-            logger.error("regex_error_domain", extra={"pattern": pattern, "error": str(e)})
-
-    for pattern in keywords.get('subject_patterns', []):
-        try:
-            compiled = pcre2.compile(pattern, pcre2.IGNORECASE)
-            if compiled.search(subject):
-                return True, f"subject_keyword:{pattern}"
-        except Exception as e:
-            logger.error("regex_error_subject", extra={"pattern": pattern, "error": str(e)})
-
-    body_preview = body[:10000]
-    for pattern in keywords.get('body_patterns', []):
-        try:
-            compiled = pcre2.compile(pattern, pcre2.IGNORECASE)
-            if compiled.search(body_preview):
-                return True, f"body_keyword:{pattern}"
-        except Exception as e:
-            logger.error("regex_error_body", extra={"pattern": pattern, "error": str(e)})
+    reason = rules.match_sender(sender_domain)
+    return bool(reason), reason
 
-    return False, None
+def check_spam(ses_record, mail, subject, body, sender_email, rules=None):
+    is_spam, reason = check_envelope(ses_record, mail, sender_email, rules)
+    if is_spam:
+        return True, reason
 
-def log_spam_to_cloudwatch(sender, subject, reason, message_id):
-    try:
-        logs.create_log_group(logGroupName=SPAM_LOG_GROUP)
-    except logs.exceptions.ResourceAlreadyExistsException:
-        pass
-    except Exception as e:
-        logger.error("spam_log_group_creation_failed", extra={"error": str(e)})
+    if rules is None:
+        rules = load_spam_keywords()
+    reason = rules.match_subject(subject) or rules.match_body(body)
+    if reason:
+        return True, reason
 
-    try:
-        stream_name = datetime.utcnow().strftime('%Y/%m/%d')
-        try:
-            logs.create_log_stream(logGroupName=SPAM_LOG_GROUP, logStreamName=stream_name)
-        except logs.exceptions.ResourceAlreadyExistsException:
-            pass
-
-        log_entry = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'sender': sender,
-            'subject': subject,
-            'reason': reason,
-            'message_id': message_id
-        }
+    return False, None
 
-        logs.put_log_events(
-            logGroupName=SPAM_LOG_GROUP,
-            logStreamName=stream_name,
-            logEvents=[{
-                'timestamp': int(datetime.utcnow().timestamp() * 1000),
-                'message': json.dumps(log_entry)
-            }]
-        )
-    except Exception as e:
-        logger.error("spam_cloudwatch_log_failed", extra={"error": str(e)})
+def event_subject(mail, staging_key):
+    # Subject for the header-stage rules without reading the body: SES puts the common
+    # headers in the event; otherwise only the header block of the staging object is read.
+    common_headers = mail.get('commonHeaders')
+    if common_headers is not None:
+        return common_headers.get('subject') or '(no subject)'
+    return parse_s3_headers(s3, BUCKET_NAME, staging_key)['subject'] or '(no subject)'
 
-def handle_spam(message_id, raw_email, sender, subject, reason):
+@span('spam_archive')
+def handle_spam(message_id, staging_key, sender, subject, reason):
     date_prefix = datetime.utcnow().strftime('%Y-%m-%d')
     spam_key = f"spam/{date_prefix}/{message_id}.eml"
 
     try:
-        s3.put_object(Bucket=BUCKET_NAME, Key=spam_key, Body=raw_email)
-        log_spam_to_cloudwatch(sender, subject, reason, message_id)
+        copy_within_bucket(s3, BUCKET_NAME, staging_key, spam_key)
+        spam_audit.record(sender, subject, reason, message_id)
         logger.info("spam_detected", extra={"sender": sender, "reason": reason, "message_id": message_id})
     except Exception as e:
         logger.error("spam_storage_failed", extra={"error": str(e), "message_id": message_id})
 
+@instrumented
 def lambda_handler(event, context):
     try:
         ses_record = event['Records'][0]['ses']
@@ -339,30 +316,73 @@ def lambda_handler(event, context):
 
         staging_key = f"staging/{message_id}"
 
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=staging_key)
-        raw_email = obj['Body'].read()
-
-        msg = BytesParser(policy=policy.default).parsebytes(raw_email)
         sender_email = mail['source']
-        subject = msg['subject'] or '(no subject)'
-        reply_to_header = msg.get('Reply-To', '')
-        body = msg.get_body(preferencelist=('plain',))
-        body_text = body.get_content() if body else ''
 
         # RFC 5321: null reverse-path indicates a bounce/DSN — discard immediately
         if not sender_email:
+            common_headers = mail.get('commonHeaders', {})
             logger.info("dsn_discarded", extra={
                 "message_id": message_id,
+                "subject": common_headers.get('subject'),
+                "reply_to": common_headers.get('replyTo')
+            })
+            s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
+            return
+
+        # Staged classification: the SES event, then the subject, and only then the full
+        # message. Spam caught by the first two is archived by a server-side copy without
+        # the body ever being downloaded or parsed.
+        with span('spam_check'):
+            is_spam, spam_reason = check_envelope(ses_record, mail, sender_email)
+        spam_stage = 'envelope'
+        subject = None
+        if not is_spam:
+            rules = load_spam_keywords()
+            subject = event_subject(mail, staging_key)
+            with span('spam_check'):
+                spam_reason = rules.match_subject(subject)
+            is_spam = bool(spam_reason)
+            spam_stage = 'headers'
+
+        if is_spam:
+            if subject is None:
+                subject = mail.get('commonHeaders', {}).get('subject') or '(no subject)'
+            logger.info("email_received", extra={
+                "message_id": message_id,
+                "sender": sender_email,
+                "recipient": mail['destination'][0] if mail.get('destination') else None,
                 "subject": subject,
-                "reply_to": reply_to_header
+                "is_spam": True,
+                "spam_reason": spam_reason,
+                "spam_stage": spam_stage,
             })
+            handle_spam(message_id, staging_key, sender_email, subject, spam_reason)
             s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
             return
 
-        is_dsn = subject.lower().startswith('delivery status') or 'mailer-daemon' in sender_email.lower()
-        is_spam, spam_reason = check_spam(ses_record, mail, subject, body_text, sender_email)
+        # A redelivery of a message whose earlier attempt failed part-way skips the stages
+        # the ledger recorded; staging is deleted only after the last one, so it is still
+        # there to resume from.
+        ledger_key = f"inbound#{message_id}"
+        progress = ledger.load(ledger_key)
+        done = progress.get('stages', set())
+        if 'forward' in done:
+            logger.info("redelivery_already_processed", extra={"message_id": message_id})
+            s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
+            return
+
+        msg, raw_size = parse_s3_object(s3, BUCKET_NAME, staging_key)
+        subject = msg['subject'] or '(no subject)'
+        reply_to_header = msg.get('Reply-To', '')
+        body_text = extract_body_text(msg)
+
+        is_dsn = is_dsn_message(subject, sender_email)
+        with span('spam_check'):
+            spam_reason = rules.match_body(body_text)
+        is_spam = bool(spam_reason)
         display_name = extract_display_name(msg)
-        conversation_id = email_to_conversation_id(sender_email, display_name)
+        with span('conversation_resolve'):
+            conversation_id = conversation_index.resolve(sender_email, display_name)
 
         logger.info("email_received", extra={
             "message_id": message_id,
@@ -371,30 +391,73 @@ def lambda_handler(event, context):
             "subject": subject,
             "reply_to": reply_to_header,
             "body_preview": body_text[:500],
+            "size": raw_size,
             "conversation_id": conversation_id,
             "display_name": display_name,
             "is_dsn": is_dsn,
             "is_spam": is_spam,
             "spam_reason": spam_reason,
+            "spam_stage": 'body' if is_spam else None,
         })
 
         if is_spam:
-            handle_spam(message_id, raw_email, sender_email, subject, spam_reason)
+            handle_spam(message_id, staging_key, sender_email, subject, spam_reason)
             s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
             return
 
-        first_contact = is_first_contact(sender_email)
-
+        # Independent writes run concurrently. The upsert answers first contact, and that
+        # answer is recorded and acted on as soon as it arrives rather than after the other
+        # writes settle: once the upsert is done a redelivery would see a returning sender,
+        # so a later write failing (or the invocation timing out) must not lose the ack.
+        tasks = {}
+        if 'conversation' not in done:
+            tasks['conversation'] = submit(store_conversation, conversation_id, sender_email, subject, body_text,
+                                          display_name, message_id)
+        if 'archive' not in done:
+            conversations_key = f"conversations/{conversation_id}/{message_id}"
+            tasks['archive'] = submit(span('archive_copy')(copy_within_bucket), s3, BUCKET_NAME, staging_key, conversations_key)
+        if 'conversation' in tasks:
+            first_contact = tasks['conversation'].result()
+            if first_contact:
+                ledger.mark(ledger_key, {'conversation'}, firstContact=True)
+        else:
+            first_contact = progress.get('firstContact', False)
+        if first_contact and 'ack' not in done:
+            # The ack carries an idempotency key, so a redelivery that enqueues it again
+            # before 'ack' is recorded below does not send it twice
+            enqueue_acknowledgement(sender_email, subject, message_id)
+
+        if 'attachments' in done:
+            attachments = json.loads(progress['attachments'])
+            skipped_filenames = json.loads(progress['skippedAttachments'])
+        else:
+            attachments, skipped_filenames = save_attachments(msg, conversation_id, message_id)
+        received_at = mail.get('timestamp') or datetime.utcnow().isoformat()
+        if 'index' not in done:
+            tasks['index'] = submit(span('message_index')(message_index.record), conversation_id, message_id,
+                                    received_at, 'inbound', sender_email, subject, body_text, attachments, raw_size)
+        if 'search' not in done:
+            tasks['search'] = submit(span('search_index')(search_queue.add), conversation_id, message_id, 'body',
+                                     body_text, subject, received_at)
+
+        # Everything that finished is recorded in one ledger write, before any error is
+        # re-raised; the forward goes out only when every write succeeded.
+        results, error = settle(tasks)
+        finished = set(results) | {'attachments'}
+        if results.get('search') is False:
+            finished.discard('search')
+        if first_contact is None:
+            finished.discard('conversation')
         if first_contact:
-            enqueue_acknowledgement(sender_email, subject)
-
-        # Archive raw email and extract/save attachments before forwarding
-        conversations_key = f"conversations/{conversation_id}/{message_id}"
-        s3.put_object(Bucket=BUCKET_NAME, Key=conversations_key, Body=raw_email)
-        attachment_keys, skipped_filenames = save_attachments(msg, conversation_id, message_id)
-
-        enqueue_forward(sender_email, subject, body_text, conversation_id, attachment_keys, skipped_filenames)
-        store_conversation(conversation_id, sender_email, subject, body_text, display_name)
+            finished.add('ack')
+        if error is None and 'forward' not in done:
+            enqueue_forward(sender_email, subject, body_text, conversation_id, attachments, skipped_filenames, message_id)
+            finished.add('forward')
+        ledger.mark(ledger_key, finished - done,
+                    attachments=json.dumps(attachments),
+                    skippedAttachments=json.dumps(skipped_filenames))
+        if error is not None:
+            raise error
 
         s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
 
@@ -406,3 +469,5 @@ def lambda_handler(event, context):
             Message=f"Unhandled exception: {str(e)}"
         )
         raise
+    finally:
+        spam_audit.flush()
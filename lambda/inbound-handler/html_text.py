@@ -0,0 +1,218 @@
+import binascii
+import codecs
+import html
+import os
+import re
+from mime_stream import iter_decoded_payload
+
+# Conversion reads at most this much decoded HTML and produces at most this much text,
+# so the CPU spent on one message is bounded however large its HTML is.
+HTML_MAX_BYTES = int(os.environ.get('HTML_MAX_BYTES', str(256 * 1024)))
+HTML_MAX_TEXT_CHARS = int(os.environ.get('HTML_MAX_TEXT_CHARS', '100000'))
+
+# Elements whose content is never shown by a mail client
+SKIP_TAGS = frozenset({'head', 'script', 'style', 'template', 'svg', 'iframe', 'object', 'title'})
+# Their content is raw text, skipped up to the closing tag without being tokenized
+RAW_TEXT_TAGS = frozenset({'script', 'style', 'title', 'textarea'})
+VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'
+})
+BLOCK_TAGS = frozenset({
+    'address', 'article', 'aside', 'blockquote', 'br', 'center', 'dd', 'div', 'dl', 'dt', 'footer',
+    'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p',
+    'pre', 'section', 'table', 'tr', 'ul'
+})
+# A start tag of the same name implicitly closes these, so a hidden one that is never
+# closed does not hide the rest of the message
+IMPLICIT_END_TAGS = frozenset({'p', 'li', 'td', 'th', 'tr', 'option'})
+# ...unless it is inside one of these opened within the hidden element: a td in a nested
+# table is the nested table's cell, not a sibling of the hidden one
+IMPLICIT_END_SCOPES = frozenset({'table', 'ul', 'ol', 'select'})
+# Inline styles that hide an element: the usual way preheader and filler text is kept
+# out of sight while still being read by filters
+HIDDEN_STYLE = re.compile(
+    r'display\s*:\s*none|visibility\s*:\s*hidden|mso-hide\s*:\s*all'
+    r'|(?:^|;)\s*(?:font-size|max-height|opacity)\s*:\s*0(?:\.0*)?(?:px|em|%)?\s*(?:!important\s*)?(?:;|$)',
+    re.IGNORECASE
+)
+
+# The name of a start or end tag; the tag runs to the next ">"
+TAG = re.compile(r'<(?P<end>/?)(?P<tag>[a-zA-Z][a-zA-Z0-9:-]*)')
+ATTR = re.compile(r'([a-zA-Z_:][-\w:.]*)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+)))?')
+RAW_TEXT_END = {tag: re.compile(rf'</{tag}\s*>', re.IGNORECASE) for tag in RAW_TEXT_TAGS}
+WHITESPACE = re.compile(r'\s+')
+BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def parse_attrs(text):
+    return [(name.lower(), html.unescape(double or single or bare or ''))
+            for name, double, single, bare in ATTR.findall(text)]
+
+
+def is_hidden(attrs):
+    for name, value in attrs:
+        if name == 'hidden':
+            return True
+        if name == 'style' and value and HIDDEN_STYLE.search(value):
+            return True
+    return False
+
+
+def html_to_text(document, max_chars=HTML_MAX_TEXT_CHARS):
+    # The visible text of an HTML document, in one left-to-right pass: block elements
+    # start new lines, whitespace collapses as a browser would, links keep their URL
+    # after the text, and skipped or hidden elements contribute nothing. Attributes are
+    # only parsed on tags that carry any.
+    #
+    # Every scan moves pos past what it read, so time is linear in the document however
+    # malformed it is: a tag ends at the first ">" after it, and a "<" with no ">" after
+    # it makes the rest of the document text.
+    parts = []
+    length = 0
+    skip_tag = None
+    skip_depth = 0
+    # Scope elements open inside the hidden element, with the skip depth at their start
+    scopes = []
+    open_scopes = {}
+    link = None
+    pos = 0
+    end = len(document)
+
+    while pos < end and length < max_chars:
+        text = None
+        if document[pos] != '<':
+            stop = document.find('<', pos)
+            stop = end if stop < 0 else stop
+            text = document[pos:stop]
+            pos = stop
+        elif document.startswith('<!--', pos):
+            close = document.find('-->', pos + 4)
+            pos = end if close < 0 else close + 3
+            continue
+        else:
+            match = TAG.match(document, pos)
+            if match is None and document[pos + 1:pos + 2] not in ('!', '?'):
+                # A "<" that starts no tag is text
+                if not skip_depth:
+                    parts.append('<')
+                    length += 1
+                pos += 1
+                continue
+            close = document.find('>', pos)
+            if close < 0:
+                text = document[pos:]
+                pos = end
+            elif match is None:
+                # A declaration or processing instruction
+                pos = close + 1
+                continue
+
+        if text is not None:
+            if not skip_depth:
+                if '&' in text:
+                    text = html.unescape(text)
+                text = WHITESPACE.sub(' ', text)
+                parts.append(text)
+                length += len(text)
+            continue
+
+        pos = close + 1
+        tag = match.group('tag').lower()
+        attr_text = document[match.end():close]
+        self_closing = attr_text.endswith('/')
+
+        if match.group('end'):
+            if skip_depth:
+                if open_scopes.get(tag):
+                    # Closes the scope and whatever was left open inside it
+                    while True:
+                        name, depth = scopes.pop()
+                        open_scopes[name] -= 1
+                        if name == tag:
+                            break
+                    skip_depth = depth
+                if tag == skip_tag:
+                    skip_depth -= 1
+                continue
+            if tag == 'a' and link:
+                href, start = link
+                link = None
+                if href not in ''.join(parts[start:]):
+                    parts.append(f" <{href}>")
+                    length += len(href) + 3
+            if tag in BLOCK_TAGS:
+                parts.append('\n')
+            continue
+
+        if tag in RAW_TEXT_TAGS and not self_closing:
+            closing = RAW_TEXT_END[tag].search(document, pos)
+            pos = closing.end() if closing else end
+            if tag == 'textarea' and not skip_depth:
+                parts.append(document[match.end():closing.start() if closing else end])
+            continue
+        if skip_depth:
+            if tag in VOID_TAGS or self_closing:
+                continue
+            if tag == skip_tag:
+                if tag in IMPLICIT_END_TAGS and skip_depth == 1 and not scopes:
+                    skip_depth = 0
+                else:
+                    skip_depth += 1
+            if skip_depth:
+                if tag in IMPLICIT_END_SCOPES:
+                    scopes.append((tag, skip_depth))
+                    open_scopes[tag] = open_scopes.get(tag, 0) + 1
+                continue
+
+        attrs = parse_attrs(attr_text) if attr_text.strip(' \t\r\n/') else []
+        if tag not in VOID_TAGS and not self_closing and (tag in SKIP_TAGS or is_hidden(attrs)):
+            skip_tag = tag
+            skip_depth = 1
+            scopes = []
+            open_scopes = {}
+            continue
+        if tag in BLOCK_TAGS:
+            parts.append('\n')
+        if tag == 'li':
+            parts.append('- ')
+        elif tag in ('td', 'th'):
+            parts.append(' ')
+        elif tag == 'a':
+            href = dict(attrs).get('href', '')
+            link = (href, len(parts)) if href.startswith(('http://', 'https://')) else None
+
+    lines = (line.strip() for line in ''.join(parts).split('\n'))
+    return BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()[:max_chars]
+
+
+def iter_html_payload(part, max_bytes):
+    # Quoted-printable takes at most 3 encoded characters per byte, so only that much of
+    # the payload is decoded; base64 is decoded slice by slice (see
+    # mime_stream.iter_decoded_payload) and the caller stops at the cap.
+    cte = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    payload = part.get_payload()
+    if cte == 'quoted-printable' and isinstance(payload, str):
+        yield binascii.a2b_qp(payload[:max_bytes * 3].encode('ascii', errors='replace'))
+        return
+    yield from iter_decoded_payload(part)
+
+
+def html_part_to_text(part, max_bytes=HTML_MAX_BYTES, max_chars=HTML_MAX_TEXT_CHARS):
+    # Returns (text, bytes of HTML read). Decoding stops at max_bytes, so HTML past the
+    # cap is neither decoded nor converted.
+    charset = part.get_content_charset() or 'utf-8'
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    pieces = []
+    consumed = 0
+    for chunk in iter_html_payload(part, max_bytes):
+        chunk = chunk[:max_bytes - consumed]
+        consumed += len(chunk)
+        pieces.append(decoder.decode(chunk))
+        if consumed >= max_bytes:
+            break
+    pieces.append(decoder.decode(b'', final=True))
+    return html_to_text(''.join(pieces), max_chars), consumed
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from mypylogger import get_logger
+from retry_queue import error_code
+from spam_rules import SpamRules
+
+logger = get_logger(__name__)
+
+# How often the keywords object is revalidated. A check is a conditional GET that S3
+# answers with 304 while the file is unchanged, so it can be frequent.
+SPAM_RULES_CHECK_SECONDS = float(os.environ.get('SPAM_RULES_CHECK_SECONDS', '15'))
+# The SSM parameter only names the S3 key and almost never changes.
+SPAM_RULES_SSM_TTL = float(os.environ.get('SPAM_RULES_SSM_TTL', '300'))
+
+
+class SpamRulesUnavailable(Exception):
+    pass
+
+
+class SpamRuleSource:
+    # Compiled spam rules for the container, kept fresh without making a message wait.
+    #
+    # The first call loads synchronously, and get() raises SpamRulesUnavailable until a
+    # rule set has loaded, so a container that never got its rules fails (and pages)
+    # instead of passing every message unfiltered. After that get() always returns the
+    # rules in hand; once they are older than SPAM_RULES_CHECK_SECONDS a single background thread
+    # revalidates them with If-None-Match on the last ETag and swaps in a new rule set
+    # only when the object changed. A failed refresh keeps the last good rules (and is
+    # retried after the next interval) instead of turning the filter off. A thread
+    # still running when the invocation ends is frozen with the container and resumes,
+    # or times out and is retried, on the next invocation.
+
+    def __init__(self, ssm, s3, bucket, param_name):
+        self.ssm = ssm
+        self.s3 = s3
+        self.bucket = bucket
+        self.param_name = param_name
+        self.rules = None
+        self.s3_key = None
+        self.etag = None
+        self.last_error = None
+        self.checked_at = 0.0
+        self.key_checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        if self.rules is None:
+            with self._lock:
+                if self.rules is None and time.monotonic() - self.checked_at >= SPAM_RULES_CHECK_SECONDS:
+                    self.refresh()
+            if self.rules is None:
+                raise SpamRulesUnavailable(f"No spam rules loaded from {self.param_name}: {self.last_error}")
+            return self.rules
+
+        if time.monotonic() - self.checked_at >= SPAM_RULES_CHECK_SECONDS:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return self.rules
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def _current_key(self, now):
+        if self.s3_key is None or now - self.key_checked_at >= SPAM_RULES_SSM_TTL:
+            self.s3_key = self.ssm.get_parameter(Name=self.param_name)['Parameter']['Value']
+            self.key_checked_at = now
+        return self.s3_key
+
+    def refresh(self):
+        # Returns True when a new rule set was loaded. Never raises.
+        now = time.monotonic()
+        self.checked_at = now
+        try:
+            previous_key = self.s3_key
+            s3_key = self._current_key(now)
+            request = {'Bucket': self.bucket, 'Key': s3_key}
+            if self.etag and s3_key == previous_key:
+                request['IfNoneMatch'] = self.etag
+            try:
+                obj = self.s3.get_object(**request)
+            except Exception as e:
+                if error_code(e) in ('304', 'NotModified'):
+                    return False
+                raise
+
+            rules = SpamRules.from_text(obj['Body'].read().decode('utf-8'))
+            self.rules = rules
+            self.etag = obj.get('ETag')
+            logger.info("spam_keywords_loaded", extra={"s3_key": s3_key, "etag": self.etag, **rules.counts()})
+            return True
+        except Exception as e:
+            self.last_error = e
+            logger.error("failed_to_load_spam_keywords", extra={
+                "error": str(e),
+                "using_last_good": self.rules is not None,
+                "etag": self.etag
+            })
+            return False
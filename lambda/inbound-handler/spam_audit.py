@@ -0,0 +1,140 @@
+import json
+import threading
+from datetime import datetime, timezone
+from metrics import NAMESPACE as EMF_NAMESPACE
+from mypylogger import get_logger
+from retry_queue import error_code
+
+logger = get_logger(__name__)
+
+# put_log_events limits: 10,000 events and 1,048,576 bytes per call, counting 26 bytes
+# of overhead per event.
+MAX_BATCH_EVENTS = 10000
+MAX_BATCH_BYTES = 1048576
+EVENT_OVERHEAD_BYTES = 26
+# Buffered events are flushed early once they reach this size, so a long invocation
+# never holds more than one batch.
+FLUSH_THRESHOLD_BYTES = 256 * 1024
+
+
+class SpamAuditSink:
+    # Collects spam audit events for the invocation and writes them in batches.
+    #
+    # mode 'logs' writes to the dedicated log group with put_log_events. The group is
+    # managed by Terraform and the daily stream is created once per container, so a spam
+    # hit costs no control-plane calls after the first. mode 'emf' prints Embedded Metric
+    # Format lines to stdout instead: the Lambda's own log group receives them for free and
+    # CloudWatch derives a SpamDetected metric per reason type.
+
+    def __init__(self, logs, log_group, mode='logs'):
+        self.logs = logs
+        self.log_group = log_group
+        self.mode = mode
+        self._events = []
+        self._bytes = 0
+        self._known_streams = set()
+        self._lock = threading.Lock()
+
+    def record(self, sender, subject, reason, message_id):
+        now = datetime.now(timezone.utc)
+        entry = {
+            'timestamp': now.replace(tzinfo=None).isoformat(),
+            'sender': sender,
+            'subject': subject,
+            'reason': reason,
+            'message_id': message_id
+        }
+        if self.mode == 'emf':
+            print(json.dumps(self._emf(entry, now)))
+            return
+
+        event = {'timestamp': int(now.timestamp() * 1000), 'message': json.dumps(entry)}
+        with self._lock:
+            self._events.append((now.strftime('%Y/%m/%d'), event))
+            self._bytes += len(event['message']) + EVENT_OVERHEAD_BYTES
+            full = self._bytes >= FLUSH_THRESHOLD_BYTES
+        if full:
+            self.flush()
+
+    def _emf(self, entry, now):
+        return {
+            '_aws': {
+                'Timestamp': int(now.timestamp() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': EMF_NAMESPACE,
+                    'Dimensions': [['ReasonType']],
+                    'Metrics': [{'Name': 'SpamDetected', 'Unit': 'Count'}]
+                }]
+            },
+            'ReasonType': entry['reason'].split(':', 1)[0],
+            'SpamDetected': 1,
+            **entry
+        }
+
+    def flush(self):
+        # Never raises: audit logging must not fail the message it describes.
+        with self._lock:
+            events, self._events, self._bytes = self._events, [], 0
+        if not events:
+            return
+
+        by_stream = {}
+        for stream_name, event in events:
+            by_stream.setdefault(stream_name, []).append(event)
+
+        for stream_name, stream_events in by_stream.items():
+            stream_events.sort(key=lambda e: e['timestamp'])
+            for batch in self._batches(stream_events):
+                try:
+                    self._put(stream_name, batch)
+                except Exception as e:
+                    logger.error("spam_cloudwatch_log_failed", extra={
+                        "error": str(e),
+                        "log_stream": stream_name,
+                        "events": len(batch)
+                    })
+
+    def _batches(self, events):
+        batch, size = [], 0
+        for event in events:
+            event_size = len(event['message']) + EVENT_OVERHEAD_BYTES
+            if batch and (len(batch) == MAX_BATCH_EVENTS or size + event_size > MAX_BATCH_BYTES):
+                yield batch
+                batch, size = [], 0
+            batch.append(event)
+            size += event_size
+        if batch:
+            yield batch
+
+    def _put(self, stream_name, batch):
+        if stream_name not in self._known_streams:
+            self._create_stream(stream_name)
+        try:
+            self.logs.put_log_events(logGroupName=self.log_group, logStreamName=stream_name, logEvents=batch)
+        except Exception as e:
+            if error_code(e) != 'ResourceNotFoundException':
+                raise
+            # Deleted since it was cached (retention, manual cleanup); recreate once
+            self._known_streams.discard(stream_name)
+            self._create_stream(stream_name)
+            self.logs.put_log_events(logGroupName=self.log_group, logStreamName=stream_name, logEvents=batch)
+
+    def _create_stream(self, stream_name):
+        try:
+            self.logs.create_log_stream(logGroupName=self.log_group, logStreamName=stream_name)
+        except Exception as e:
+            code = error_code(e)
+            if code == 'ResourceNotFoundException':
+                # Group missing (not deployed through Terraform yet)
+                self._create_group()
+                self.logs.create_log_stream(logGroupName=self.log_group, logStreamName=stream_name)
+            elif code != 'ResourceAlreadyExistsException':
+                raise
+        self._known_streams.add(stream_name)
+
+    def _create_group(self):
+        try:
+            self.logs.create_log_group(logGroupName=self.log_group)
+        except Exception as e:
+            if error_code(e) != 'ResourceAlreadyExistsException':
+                raise
@@ -0,0 +1,145 @@
+import re
+from mypylogger import get_logger
+
+logger = get_logger(__name__)
+
+SECTION_HEADERS = {
+    '--- BLOCKED_SENDER_DOMAINS ---': 'blocked_sender_domains',
+    '--- SUBJECT_PATTERNS ---': 'subject_patterns',
+    '--- BODY_PATTERNS ---': 'body_patterns',
+}
+
+BODY_PREVIEW_CHARS = 10000
+
+# Patterns that refer to their own groups by number or recurse cannot be wrapped
+# into a shared alternation without changing their meaning; they are matched alone.
+STANDALONE_PATTERN = re.compile(r'\\[1-9]|\\[gk]|\(\?(?:P=|P>|&|R|[+-]?\d)')
+
+
+def parse_sections(content):
+    sections = {name: [] for name in SECTION_HEADERS.values()}
+
+    current_section = None
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line in SECTION_HEADERS:
+            current_section = SECTION_HEADERS[line]
+        elif current_section:
+            sections[current_section].append(line)
+
+    return sections
+
+
+def compile_pattern(pattern):
+    # pcre2 is imported on first use: messages dropped before the keyword check (SES
+    # verdicts, bounces) never load it, and it stays out of the cold-start import path.
+    import pcre2
+    compiled = pcre2.compile(pattern, pcre2.IGNORECASE)
+    # JIT is unavailable on some pcre2 builds/architectures; the interpreter still works.
+    jit_compile = getattr(compiled, 'jit_compile', None)
+    if jit_compile:
+        try:
+            jit_compile()
+        except Exception:
+            pass
+    return compiled
+
+
+class RuleSection:
+    # One section of keywords.txt compiled once: a single combined alternation answers
+    # "does anything match" in one scan, and the individual patterns (only consulted on
+    # a hit) report which rule matched, in file order.
+
+    def __init__(self, name, patterns):
+        self.name = name
+        self.patterns = []
+        self.standalone = []
+        self.rejected = []
+
+        for pattern in patterns:
+            try:
+                compiled = compile_pattern(pattern)
+            except Exception as e:
+                self.rejected.append(pattern)
+                logger.error("spam_pattern_rejected", extra={
+                    "section": name,
+                    "pattern": pattern,
+                    "error": str(e)
+                })
+                continue
+            self.patterns.append((pattern, compiled))
+            if STANDALONE_PATTERN.search(pattern):
+                self.standalone.append((pattern, compiled))
+
+        self.combined = self._combine()
+
+    def _combine(self):
+        combinable = [p for p, _ in self.patterns if not STANDALONE_PATTERN.search(p)]
+        if not combinable:
+            return None
+        try:
+            return compile_pattern('|'.join(f'(?:{p})' for p in combinable))
+        except Exception as e:
+            logger.error("spam_pattern_combine_failed", extra={"section": self.name, "error": str(e)})
+            return None
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def search(self, text):
+        if self.combined is not None and not self.combined.search(text):
+            candidates = self.standalone
+        else:
+            candidates = self.patterns
+
+        for pattern, compiled in candidates:
+            if compiled.search(text):
+                return pattern
+        return None
+
+
+class SpamRules:
+
+    def __init__(self, sections):
+        self.blocked_sender_domains = RuleSection('blocked_sender_domains', sections.get('blocked_sender_domains', []))
+        self.subject_patterns = RuleSection('subject_patterns', sections.get('subject_patterns', []))
+        self.body_patterns = RuleSection('body_patterns', sections.get('body_patterns', []))
+
+    @classmethod
+    def from_text(cls, content):
+        return cls(parse_sections(content))
+
+    @classmethod
+    def empty(cls):
+        return cls({})
+
+    def counts(self):
+        return {
+            "blocked_sender_domains": len(self.blocked_sender_domains),
+            "subject_patterns": len(self.subject_patterns),
+            "body_patterns": len(self.body_patterns),
+            "rejected": (len(self.blocked_sender_domains.rejected)
+                         + len(self.subject_patterns.rejected)
+                         + len(self.body_patterns.rejected)),
+        }
+
+    # Each check is available on its own so the handler can run the cheap ones before the
+    # message body has been read. Reasons are "<section>:<pattern>".
+
+    def match_sender(self, sender_domain):
+        pattern = self.blocked_sender_domains.search(sender_domain)
+        return f"blocked_domain:{pattern}" if pattern else None
+
+    def match_subject(self, subject):
+        pattern = self.subject_patterns.search(subject)
+        return f"subject_keyword:{pattern}" if pattern else None
+
+    def match_body(self, body):
+        pattern = self.body_patterns.search(body[:BODY_PREVIEW_CHARS])
+        return f"body_keyword:{pattern}" if pattern else None
+
+    def match(self, sender_domain, subject, body):
+        return self.match_sender(sender_domain) or self.match_subject(subject) or self.match_body(body)
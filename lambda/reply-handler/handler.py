@@ -1,18 +1,24 @@
 import json
 import os
-import re
-import boto3
-from email import policy
-from email.parser import BytesParser
+from aws_clients import lazy_client, lazy_resource
+from blob_store import store_part
 from datetime import datetime
 from mypylogger import get_logger
+from conversation_cache import conversation_cache
+from io_stage import submit, wait_all
+from ledger import ProcessingLedger, settle
+from message_index import MessageIndex
+from metrics import instrumented, span
+from mime_stream import copy_within_bucket, parse_s3_object
+from reply_parser import parse_reply
+from search_index import SearchQueue
 
 logger = get_logger(__name__)
 
-s3 = boto3.client('s3')
-sqs = boto3.client('sqs')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+s3 = lazy_client('s3')
+sqs = lazy_client('sqs')
+dynamodb = lazy_resource('dynamodb')
+sns = lazy_client('sns')
 
 BUCKET_NAME = os.environ['BUCKET_NAME']
 TABLE_NAME = os.environ['TABLE_NAME']
@@ -20,13 +26,24 @@ PUBLIC_EMAIL = os.environ['PUBLIC_EMAIL']
 SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 REPLY_QUEUE_URL = os.environ['REPLY_QUEUE_URL']
 
+ledger = ProcessingLedger(dynamodb)
+message_index = MessageIndex(dynamodb)
+search_queue = SearchQueue(sqs)
 
+
+@span('dynamodb_lookup')
 def lookup_sender_email(conversation_id):
+    # Read-through: a warm container answers repeat replies in a thread from its cache.
+    cached = conversation_cache.get(conversation_id)
+    if cached and 'senderEmail' in cached:
+        return cached['senderEmail']
+
     table = dynamodb.Table(TABLE_NAME)
     try:
         response = table.get_item(Key={'conversationId': conversation_id})
         item = response.get('Item')
         if item and 'senderEmail' in item:
+            conversation_cache.put(conversation_id, item)
             return item['senderEmail']
         return None
     except Exception as e:
@@ -37,42 +54,24 @@ def lookup_sender_email(conversation_id):
         return None
 
 
-def extract_metadata_commands(body):
-    metadata = {}
-    pattern = r'\[(\w+):\s*([^\]]+)\]'
-    matches = re.findall(pattern, body)
-
-    for key, value in matches:
-        key_lower = key.lower()
-        if key_lower == 'company':
-            metadata['companyName'] = value.strip()
-        elif key_lower == 'title':
-            metadata['title'] = value.strip()
-        elif key_lower == 'type':
-            metadata['type'] = value.strip()
-        elif key_lower == 'location':
-            metadata['location'] = value.strip()
-        elif key_lower == 'salary_range':
-            metadata['salaryRange'] = value.strip()
-        elif key_lower == 'job_id':
-            metadata['jobId'] = value.strip()
-        elif key_lower == 'notes':
-            metadata['notes'] = value.strip()
-
-    return metadata
-
-def clean_reply_body(body):
-    # Strip everything from the METADATA marker onward (includes forwarded footer)
-    metadata_marker = '--- METADATA ---'
-    if metadata_marker in body:
-        body = body.split(metadata_marker)[0]
-
-    # Strip quoted lines (lines starting with >) that email clients insert
-    lines = body.splitlines()
-    cleaned = [line for line in lines if not line.startswith('>')]
-
-    return '\n'.join(cleaned).strip()
+def save_reply_attachment(part, key, filename):
+    try:
+        with span('attachment_upload') as timer:
+            saved = store_part(s3, BUCKET_NAME, part, key)
+            timer.bytes = saved['size'] if saved else 0
+        if saved:
+            logger.info("reply_attachment_saved", extra={
+                "key": key,
+                "blob_key": saved['blob_key'],
+                "size": saved['size'],
+                "deduplicated": not saved['stored']
+            })
+            return {**saved, 'filename': filename}
+    except Exception as e:
+        logger.error("reply_attachment_save_failed", extra={"error": str(e), "filename": filename})
+    return None
 
+@span('dynamodb_update')
 def update_conversation_metadata(conversation_id, metadata):
     if not metadata:
         return
@@ -100,6 +99,7 @@ def update_conversation_metadata(conversation_id, metadata):
             ExpressionAttributeNames=expr_names,
             ExpressionAttributeValues=expr_values
         )
+        conversation_cache.update(conversation_id, metadata)
         logger.info("metadata_updated", extra={"conversation_id": conversation_id, "metadata": metadata})
     except Exception as e:
         logger.error("metadata_update_failed", extra={"error": str(e), "conversation_id": conversation_id})
@@ -109,6 +109,7 @@ def update_conversation_metadata(conversation_id, metadata):
             Message=f"Failed to update metadata for {conversation_id}: {str(e)}"
         )
 
+@instrumented
 def lambda_handler(event, context):
     try:
         ses_record = event['Records'][0]['ses']
@@ -134,60 +135,94 @@ def lambda_handler(event, context):
 
         # SES stores incoming mail to staging/; read from there
         staging_key = f"staging/{message_id}"
-        obj = s3.get_object(Bucket=BUCKET_NAME, Key=staging_key)
-        raw_email = obj['Body'].read()
 
-        msg = BytesParser(policy=policy.default).parsebytes(raw_email)
+        # A redelivery after a failed attempt skips the stages the ledger recorded
+        ledger_key = f"reply#{message_id}"
+        progress = ledger.load(ledger_key)
+        done = progress.get('stages', set())
+        if 'reply' in done:
+            logger.info("redelivery_already_processed", extra={"message_id": message_id})
+            s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
+            return
+
+        msg, raw_size = parse_s3_object(s3, BUCKET_NAME, staging_key)
         subject = msg['subject'] or 'Re: Your message'
         body = msg.get_body(preferencelist=('plain',))
         body_text = body.get_content() if body else ''
 
-        attachment_keys = []
-        for part in msg.iter_attachments():
-            filename = part.get_filename()
-            if not filename:
-                continue
-            data = part.get_payload(decode=True)
-            if data:
+        # Archive, attachment uploads, the metadata update and the index writes are
+        # independent and run concurrently; the reply is enqueued once they have all
+        # settled and staging is deleted last.
+        tasks = {}
+        if 'archive' not in done:
+            reply_key = f"conversations/{conversation_id}/{message_id}"
+            tasks['archive'] = submit(span('archive_copy')(copy_within_bucket), s3, BUCKET_NAME, staging_key, reply_key)
+
+        uploads = []
+        if 'attachments' not in done:
+            for part in msg.iter_attachments():
+                filename = part.get_filename()
+                if not filename:
+                    continue
                 key = f"reply-attachments/{conversation_id}/{message_id}/{filename}"
-                try:
-                    s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=data)
-                    attachment_keys.append(key)
-                    logger.info("reply_attachment_saved", extra={"key": key})
-                except Exception as e:
-                    logger.error("reply_attachment_save_failed", extra={"error": str(e), "filename": filename})
-
-        logger.info("reply_received", extra={
-            "conversation_id": conversation_id,
-            "recipient": original_sender,
-            "subject": subject,
-            "body_preview": body_text[:500],
-            "attachment_count": len(attachment_keys)
-        })
-
-        metadata = extract_metadata_commands(body_text)
-        clean_body = clean_reply_body(body_text)
-
-        update_conversation_metadata(conversation_id, metadata)
-
-        sqs.send_message(
-            QueueUrl=REPLY_QUEUE_URL,
-            MessageBody=json.dumps({
-                'recipient': original_sender,
-                'subject': subject,
-                'body': clean_body,
-                'attachment_keys': attachment_keys
+                uploads.append(submit(save_reply_attachment, part, key, filename))
+
+        with span('reply_parse'):
+            metadata, clean_body = parse_reply(body_text)
+        if 'metadata' not in done:
+            tasks['metadata'] = submit(update_conversation_metadata, conversation_id, metadata)
+
+        if 'attachments' in done:
+            attachments = json.loads(progress['attachments'])
+        else:
+            attachments = [attachment for attachment in wait_all(uploads) if attachment]
+        received_at = mail.get('timestamp') or datetime.utcnow().isoformat()
+        if 'index' not in done:
+            tasks['index'] = submit(span('message_index')(message_index.record), conversation_id, message_id,
+                                    received_at, 'reply', mail['source'], subject, clean_body, attachments, raw_size)
+        if 'search' not in done:
+            tasks['search'] = submit(span('search_index')(search_queue.add), conversation_id, message_id, 'reply',
+                                     clean_body, subject, received_at)
+        # The reply is enqueued only when every write succeeded; whatever finished,
+        # the reply included, is recorded in one ledger write before an error is re-raised.
+        results, error = settle(tasks)
+        finished = set(results) | {'attachments'}
+        if results.get('search') is False:
+            finished.discard('search')
+        if error is None:
+            logger.info("reply_received", extra={
+                "conversation_id": conversation_id,
+                "recipient": original_sender,
+                "subject": subject,
+                "body_preview": body_text[:500],
+                "size": raw_size,
+                "attachment_count": len(attachments)
             })
-        )
+            try:
+                with span('sqs_reply'):
+                    sqs.send_message(
+                        QueueUrl=REPLY_QUEUE_URL,
+                        MessageBody=json.dumps({
+                            'recipient': original_sender,
+                            'subject': subject,
+                            'body': clean_body,
+                            'attachment_keys': [a['key'] for a in attachments],
+                            'attachments': [{'key': a['blob_key'], 'filename': a['filename']} for a in attachments],
+                            'idempotency_key': f"{message_id}#reply"
+                        })
+                    )
+                finished.add('reply')
+            except Exception as e:
+                error = e
+        ledger.mark(ledger_key, finished - done, attachments=json.dumps(attachments))
+        if error is not None:
+            raise error
 
         logger.info("reply_enqueued", extra={
             "conversation_id": conversation_id,
             "recipient": original_sender
         })
 
-        # Archive reply email then clean up staging
-        reply_key = f"conversations/{conversation_id}/{message_id}"
-        s3.put_object(Bucket=BUCKET_NAME, Key=reply_key, Body=raw_email)
         s3.delete_object(Bucket=BUCKET_NAME, Key=staging_key)
 
     except Exception as e:
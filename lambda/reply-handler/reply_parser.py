@@ -0,0 +1,81 @@
+import re
+
+METADATA_MARKER = '--- METADATA ---'
+
+# Reply command keyword -> conversation attribute it sets
+COMMAND_FIELDS = {
+    'company': 'companyName',
+    'title': 'title',
+    'type': 'type',
+    'location': 'location',
+    'salary_range': 'salaryRange',
+    'job_id': 'jobId',
+    'notes': 'notes',
+}
+
+COMMAND = re.compile(r'\[(\w+):\s*([^\]]+)\]')
+# One scanner for everything parse_reply looks for. Runs of quoted lines match as one
+# block; a command is matched by lookahead from its "[" so the scan still sees any
+# quoted lines its value spans.
+SCANNER = re.compile(
+    r'\[(?=(?P<key>\w+):\s*(?P<value>[^\]]+)\])'
+    r'|(?P<quoted>(?:^>[^\n]*(?:\n|\Z))+)'
+    r'|(?P<marker>' + re.escape(METADATA_MARKER) + r')',
+    re.MULTILINE
+)
+
+
+def _apply(metadata, key, value):
+    field = COMMAND_FIELDS.get(key.lower())
+    if field:
+        metadata[field] = value.strip()
+
+
+def _apply_all(metadata, body, pos, before):
+    # Applies the commands starting in body[pos:before]; returns where the last one ended.
+    command_end = pos
+    for match in COMMAND.finditer(body, pos):
+        if match.start() >= before:
+            break
+        _apply(metadata, match.group(1), match.group(2))
+        command_end = match.end()
+    return command_end
+
+
+def parse_reply(body):
+    # Returns (metadata, clean_body) from one scan of the reply:
+    #   - [key: value] commands anywhere in the body, quoted text and footer included,
+    #     later ones winning
+    #   - the body cut at the METADATA footer with quoted (>) lines dropped
+    # The kept text is copied once, as the slices between dropped lines.
+    if '\r' in body:
+        body = body.replace('\r\n', '\n')
+    metadata = {}
+    kept = []
+    start = 0
+    end = len(body)
+    command_end = 0
+    for match in SCANNER.finditer(body):
+        kind = match.lastgroup
+        if kind == 'quoted':
+            block = match.group()
+            if METADATA_MARKER in block:
+                end = match.start()
+                break
+            kept.append(body[start:match.start()])
+            start = match.end()
+            if '[' in block:
+                command_end = _apply_all(metadata, body, max(match.start(), command_end), match.end())
+        elif kind == 'marker':
+            end = match.start()
+            break
+        elif match.start() >= command_end:
+            _apply(metadata, match.group('key'), match.group('value'))
+            command_end = match.end('value') + 1
+    else:
+        return metadata, ''.join(kept + [body[start:]]).strip()
+
+    # Commands past the cut are still applied; there is no text left to keep there.
+    _apply_all(metadata, body, max(end, command_end), len(body))
+    kept.append(body[start:end])
+    return metadata, ''.join(kept).strip()
@@ -1,117 +1,83 @@
-import email.mime.application
-import email.mime.multipart
-import email.mime.text
 import json
-import mimetypes
 import os
-import time
-import boto3
+from aws_clients import lazy_client, lazy_resource
+from blob_store import message_attachments
+from io_stage import submit
+from ledger import ProcessingLedger
+from metrics import instrumented, span
+from mime_builder import attachment_content_type, fetch_encoded_attachment, render_raw_message
 from mypylogger import get_logger
+from retry_queue import receive_count, send_with_retry
+from ses_governor import SendRateGovernor
+from sqs_batch import batch_response, process_batch
 
 logger = get_logger(__name__)
 
-ses = boto3.client('ses')
-s3 = boto3.client('s3')
-sns = boto3.client('sns')
+ses = lazy_client('ses')
+s3 = lazy_client('s3')
+sqs = lazy_client('sqs')
+sns = lazy_client('sns')
+
+governor = SendRateGovernor(ses)
+ledger = ProcessingLedger(lazy_resource('dynamodb'))
 
 PUBLIC_EMAIL = os.environ['PUBLIC_EMAIL']
 SNS_TOPIC_ARN = os.environ['SNS_TOPIC_ARN']
 BUCKET_NAME = os.environ['BUCKET_NAME']
+QUEUE_URL = os.environ['QUEUE_URL']
 
-RETRY_DELAYS = [0, 5, 30, 120]
-RETRYABLE_ERRORS = {'MailFromDomainNotVerifiedException', 'Throttling', 'ServiceUnavailable'}
-
-ICS_EXTENSIONS = {'.ics'}
-
-
-def build_raw_message(recipient, subject, body, attachment_keys):
-    msg = email.mime.multipart.MIMEMultipart()
-    msg['From'] = PUBLIC_EMAIL
-    msg['To'] = recipient
-    msg['Subject'] = subject
-
-    msg.attach(email.mime.text.MIMEText(body, 'plain'))
-
-    for key in attachment_keys:
-        filename = key.split('/')[-1]
-        lower = filename.lower()
 
+def build_raw_message(recipient, subject, body, sources):
+    # sources are (key, filename) pairs; the key is the content-addressed blob
+    fetches = [(key, filename, submit(fetch_encoded_attachment, s3, BUCKET_NAME, key)) for key, filename in sources]
+    attachments = []
+    for key, filename, future in fetches:
         try:
-            obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
-            data = obj['Body'].read()
+            encoded = future.result()
         except Exception as e:
             logger.error("attachment_fetch_failed", extra={"key": key, "error": str(e)})
             continue
+        attachments.append((filename, attachment_content_type(filename), encoded))
+
+    return render_raw_message(PUBLIC_EMAIL, recipient, subject, body, attachments)
+
+
+def send_reply(message):
+    sources = message_attachments(message)
+    with span('build_message') as timer:
+        raw = build_raw_message(message['recipient'], message['subject'], message['body'], sources)
+        timer.bytes = len(raw)
+    with span('rate_wait'):
+        governor.acquire()
+    with span('ses_send'):
+        ses.send_raw_email(
+            Source=PUBLIC_EMAIL,
+            Destinations=[message['recipient']],
+            RawMessage={'Data': raw}
+        )
+    return {"attachment_count": len(sources)}
 
-        if any(lower.endswith(ext) for ext in ICS_EXTENSIONS):
-            part = email.mime.text.MIMEText(data.decode('utf-8', errors='replace'), 'calendar')
-            part.add_header('Content-Disposition', 'attachment', filename=filename)
-        else:
-            part = email.mime.application.MIMEApplication(data, Name=filename)
-            part.add_header('Content-Disposition', 'attachment', filename=filename)
-
-        msg.attach(part)
-
-    return msg.as_bytes()
-
-
-def send_with_retry(recipient, subject, body, attachment_keys):
-    raw = build_raw_message(recipient, subject, body, attachment_keys)
-    last_error = None
-
-    for attempt, delay in enumerate(RETRY_DELAYS, start=1):
-        if delay > 0:
-            time.sleep(delay)
-        try:
-            ses.send_raw_email(
-                Source=PUBLIC_EMAIL,
-                Destinations=[recipient],
-                RawMessage={'Data': raw}
-            )
-            logger.info("reply_sent", extra={
-                "recipient": recipient,
-                "subject": subject,
-                "attachment_count": len(attachment_keys),
-                "attempt": attempt
-            })
-            return
-        except ses.exceptions.ClientError as e:
-            error_code = e.response['Error']['Code']
-            last_error = e
-            logger.warning("reply_send_failed", extra={
-                "recipient": recipient,
-                "error_code": error_code,
-                "attempt": attempt
-            })
-            if error_code not in RETRYABLE_ERRORS:
-                break
-        except Exception as e:
-            last_error = e
-            logger.warning("reply_send_failed", extra={
-                "recipient": recipient,
-                "error": str(e),
-                "attempt": attempt
-            })
 
-    logger.error("reply_send_exhausted", extra={
-        "recipient": recipient,
-        "error": str(last_error),
-        "attempts": len(RETRY_DELAYS)
-    })
+def notify_exhausted(recipient, error):
     sns.publish(
         TopicArn=SNS_TOPIC_ARN,
         Subject="Reply Sender: Send Failed After Retries",
-        Message=f"Failed to send reply to {recipient}: {last_error}"
+        Message=f"Failed to send reply to {recipient}: {error}"
     )
-    raise last_error
 
 
+def handle_record(record):
+    message = json.loads(record['body'])
+    send_with_retry(message, send_reply, 'reply', ledger, sqs, QUEUE_URL, notify_exhausted,
+                    first_receive=receive_count(record) == 1)
+
+
+@instrumented
 def lambda_handler(event, context):
-    for record in event['Records']:
-        message = json.loads(record['body'])
-        send_with_retry(
-            recipient=message['recipient'],
-            subject=message['subject'],
-            body=message['body'],
-            attachment_keys=message.get('attachment_keys', [])
-        )
+    failures = process_batch(event['Records'], handle_record)
+    for record, error in failures:
+        logger.error("reply_record_failed", extra={
+            "message_id": record['messageId'],
+            "error": str(error)
+        })
+    return batch_response(failures)
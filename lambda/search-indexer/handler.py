@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import time
+from aws_clients import lazy_client
+from metrics import instrumented, span
+from mypylogger import get_logger
+from search_index import MAX_DOC_CHARS, SearchIndex, document_row
+from sqs_batch import batch_response, process_batch
+
+logger = get_logger(__name__)
+
+s3 = lazy_client('s3')
+
+BUCKET_NAME = os.environ['BUCKET_NAME']
+
+search_index = SearchIndex(s3, BUCKET_NAME)
+
+
+def read_text(key):
+    # At most what the index keeps of extracted text (up to 4 UTF-8 bytes per character)
+    response = s3.get_object(Bucket=BUCKET_NAME, Key=key, Range=f"bytes=0-{MAX_DOC_CHARS * 4 - 1}")
+    return response['Body'].read().decode('utf-8', errors='ignore')
+
+
+def index_batch(records):
+    # Every document in the batch goes into one segment. A record that cannot be read
+    # fails alone; if the segment cannot be written, the whole batch is delivered again.
+    rows = {}
+    indexed = []
+    lock = threading.Lock()
+
+    def handle_record(record):
+        document = json.loads(record['body'])
+        text = read_text(document['text_key']) if 'text_key' in document else document.get('text', '')
+        row = document_row(document['conversation_id'], document['message_id'], document['source'], text,
+                           document.get('subject'), document.get('received_at'))
+        with lock:
+            # A redelivered document is kept once
+            rows[row[0]] = row
+            indexed.append(record)
+
+    failures = process_batch(records, handle_record)
+    if rows:
+        try:
+            with span('search_index'):
+                search_index.add_documents(list(rows.values()))
+        except Exception as e:
+            failures += [(record, e) for record in indexed]
+    for record, error in failures:
+        logger.error("search_record_failed", extra={
+            "message_id": record['messageId'],
+            "error": str(error)
+        })
+    return batch_response(failures)
+
+
+@instrumented
+def lambda_handler(event, context):
+    # SQS batches from the search queue are indexed. An invocation with a "query"
+    # searches instead: {"query": "kubernetes contract", "limit": 20, "conversation_id": "..."}.
+    # Warm containers keep the segment files in /tmp, so a search only downloads
+    # segments written since the last one. Neither is throttled by compaction, which
+    # runs as its own function (compaction_handler).
+    if 'Records' in event:
+        return index_batch(event['Records'])
+
+    if event.get('query') is None:
+        raise ValueError("expected SQS records or a query")
+    started = time.perf_counter()
+    with span('search_query'):
+        hits = search_index.search(
+            event['query'],
+            limit=int(event.get('limit', 20)),
+            conversation_id=event.get('conversation_id')
+        )
+    logger.info("search_query", extra={
+        "query": event['query'],
+        "hits": len(hits),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+    return {'hits': hits}
+
+
+@instrumented
+def compaction_handler(event, context):
+    # The search-compactor function, on a schedule. It has a reserved concurrency of 1,
+    # so two compactions never merge the same segments; writes and searches run
+    # alongside it.
+    with span('search_compact'):
+        merges = search_index.compact()
+    logger.info("search_compaction_finished", extra={"merges": merges})
+    return {'merges': merges}
@@ -32,6 +32,10 @@ locals {
   account_id = data.aws_caller_identity.current.account_id
   bucket_name = "${var.project_name}-${local.account_id}-${var.aws_region}"
   table_name = "${var.project_name}-${var.environment}-conversations"
+  send_rate_table_name = "${var.project_name}-${var.environment}-ses-send-rate"
+  ledger_table_name = "${var.project_name}-${var.environment}-processing-ledger"
+  alias_table_name = "${var.project_name}-${var.environment}-conversation-aliases"
+  message_table_name = "${var.project_name}-${var.environment}-messages"
 }
 
 module "s3_buckets" {
@@ -45,7 +49,11 @@ module "s3_buckets" {
 module "dynamodb_tables" {
   source = "./modules/dynamodb-tables"
   
-  table_name = local.table_name
+  table_name           = local.table_name
+  send_rate_table_name = local.send_rate_table_name
+  ledger_table_name    = local.ledger_table_name
+  alias_table_name     = local.alias_table_name
+  message_table_name   = local.message_table_name
 }
 
 module "sqs_queues" {
@@ -62,6 +70,10 @@ module "lambda_functions" {
   environment        = var.environment
   bucket_name        = module.s3_buckets.bucket_name
   table_name         = module.dynamodb_tables.table_name
+  send_rate_table_name = module.dynamodb_tables.send_rate_table_name
+  ledger_table_name  = module.dynamodb_tables.ledger_table_name
+  alias_table_name   = module.dynamodb_tables.alias_table_name
+  message_table_name = module.dynamodb_tables.message_table_name
   public_email       = var.public_email
   private_email      = var.private_email
   domain_name        = var.domain_name
@@ -72,6 +84,8 @@ module "lambda_functions" {
   forward_queue_url  = module.sqs_queues.forward_queue_url
   reply_queue_arn    = module.sqs_queues.reply_queue_arn
   reply_queue_url    = module.sqs_queues.reply_queue_url
+  search_queue_arn   = module.sqs_queues.search_queue_arn
+  search_queue_url   = module.sqs_queues.search_queue_url
 }
 
 module "ses_config" {
@@ -101,18 +115,21 @@ module "route53_records" {
 module "cloudwatch_alarms" {
   source = "./modules/cloudwatch-alarms"
 
-  project_name               = var.project_name
-  environment                = var.environment
-  alert_email                = var.alert_email
-  inbound_lambda_name        = module.lambda_functions.inbound_handler_name
-  reply_lambda_name          = module.lambda_functions.reply_handler_name
-  extractor_lambda_name      = module.lambda_functions.extractor_handler_name
-  ack_sender_lambda_name     = module.lambda_functions.ack_sender_name
-  forward_sender_lambda_name = module.lambda_functions.forward_sender_name
-  reply_sender_lambda_name   = module.lambda_functions.reply_sender_name
-  ack_dlq_name               = module.sqs_queues.ack_dlq_name
-  forward_dlq_name           = module.sqs_queues.forward_dlq_name
-  reply_dlq_name             = module.sqs_queues.reply_dlq_name
+  project_name                 = var.project_name
+  environment                  = var.environment
+  alert_email                  = var.alert_email
+  inbound_lambda_name          = module.lambda_functions.inbound_handler_name
+  reply_lambda_name            = module.lambda_functions.reply_handler_name
+  extractor_lambda_name        = module.lambda_functions.extractor_handler_name
+  ack_sender_lambda_name       = module.lambda_functions.ack_sender_name
+  forward_sender_lambda_name   = module.lambda_functions.forward_sender_name
+  reply_sender_lambda_name     = module.lambda_functions.reply_sender_name
+  search_indexer_lambda_name   = module.lambda_functions.search_indexer_name
+  search_compactor_lambda_name = module.lambda_functions.search_compactor_name
+  ack_dlq_name                 = module.sqs_queues.ack_dlq_name
+  forward_dlq_name             = module.sqs_queues.forward_dlq_name
+  reply_dlq_name               = module.sqs_queues.reply_dlq_name
+  search_dlq_name              = module.sqs_queues.search_dlq_name
 }
 
 resource "aws_ssm_parameter" "spam_keywords_s3_key" {
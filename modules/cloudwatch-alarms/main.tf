@@ -59,6 +59,40 @@ resource "aws_cloudwatch_metric_alarm" "extractor_errors" {
   }
 }
 
+resource "aws_cloudwatch_metric_alarm" "search_indexer_errors" {
+  alarm_name          = "${var.search_indexer_lambda_name}-errors"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = 1
+  metric_name         = "Errors"
+  namespace           = "AWS/Lambda"
+  period              = 900
+  statistic           = "Sum"
+  threshold           = 1
+  alarm_description   = "Search indexer Lambda errors (search failed)"
+  alarm_actions       = [aws_sns_topic.alerts.arn]
+
+  dimensions = {
+    FunctionName = var.search_indexer_lambda_name
+  }
+}
+
+resource "aws_cloudwatch_metric_alarm" "search_compactor_errors" {
+  alarm_name          = "${var.search_compactor_lambda_name}-errors"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = 1
+  metric_name         = "Errors"
+  namespace           = "AWS/Lambda"
+  period              = 900
+  statistic           = "Sum"
+  threshold           = 1
+  alarm_description   = "Search compactor Lambda errors (segment compaction failed)"
+  alarm_actions       = [aws_sns_topic.alerts.arn]
+
+  dimensions = {
+    FunctionName = var.search_compactor_lambda_name
+  }
+}
+
 # Sender Lambda error alarms
 
 resource "aws_cloudwatch_metric_alarm" "ack_sender_errors" {
@@ -167,3 +201,56 @@ resource "aws_cloudwatch_metric_alarm" "reply_dlq_depth" {
     QueueName = var.reply_dlq_name
   }
 }
+
+resource "aws_cloudwatch_metric_alarm" "search_dlq_depth" {
+  alarm_name          = "${var.search_dlq_name}-depth"
+  comparison_operator = "GreaterThanOrEqualToThreshold"
+  evaluation_periods  = 1
+  metric_name         = "ApproximateNumberOfMessagesVisible"
+  namespace           = "AWS/SQS"
+  period              = 60
+  statistic           = "Maximum"
+  threshold           = 1
+  alarm_description   = "Search indexer DLQ has messages"
+  alarm_actions       = [aws_sns_topic.alerts.arn]
+
+  dimensions = {
+    QueueName = var.search_dlq_name
+  }
+}
+
+# Stage latency alarms, on the StageDuration metrics the handlers write as EMF
+# (lambda/common/metrics.py). Periods with no invocations do not count as breaching.
+
+locals {
+  function_names = {
+    inbound        = var.inbound_lambda_name
+    reply          = var.reply_lambda_name
+    extractor      = var.extractor_lambda_name
+    ack_sender     = var.ack_sender_lambda_name
+    forward_sender = var.forward_sender_lambda_name
+    reply_sender   = var.reply_sender_lambda_name
+  }
+}
+
+resource "aws_cloudwatch_metric_alarm" "stage_latency_p99" {
+  for_each = var.stage_latency_p99_ms
+
+  alarm_name          = "${local.function_names[split("/", each.key)[0]]}-${split("/", each.key)[1]}-p99"
+  comparison_operator = "GreaterThanThreshold"
+  evaluation_periods  = 3
+  datapoints_to_alarm = 3
+  metric_name         = "StageDuration"
+  namespace           = var.metrics_namespace
+  period              = 300
+  extended_statistic  = "p99"
+  threshold           = each.value
+  treat_missing_data  = "notBreaching"
+  alarm_description   = "p99 of the ${split("/", each.key)[1]} stage above ${each.value} ms for 15 minutes"
+  alarm_actions       = [aws_sns_topic.alerts.arn]
+
+  dimensions = {
+    Function = local.function_names[split("/", each.key)[0]]
+    Stage    = split("/", each.key)[1]
+  }
+}
@@ -43,6 +43,16 @@ variable "reply_sender_lambda_name" {
   type        = string
 }
 
+variable "search_indexer_lambda_name" {
+  description = "Search indexer Lambda name"
+  type        = string
+}
+
+variable "search_compactor_lambda_name" {
+  description = "Search compactor Lambda name"
+  type        = string
+}
+
 variable "ack_dlq_name" {
   description = "Ack sender DLQ name"
   type        = string
@@ -57,3 +67,32 @@ variable "reply_dlq_name" {
   description = "Reply sender DLQ name"
   type        = string
 }
+
+variable "search_dlq_name" {
+  description = "Search indexer DLQ name"
+  type        = string
+}
+
+variable "metrics_namespace" {
+  description = "CloudWatch namespace of the handlers' EMF stage metrics"
+  type        = string
+  default     = "EmailHandler"
+}
+
+variable "stage_latency_p99_ms" {
+  description = "p99 StageDuration alarm thresholds in milliseconds, keyed \"<function>/<stage>\"; function is one of inbound, reply, extractor, ack_sender, forward_sender, reply_sender, and stage \"total\" is the whole invocation"
+  type        = map(number)
+  default = {
+    "inbound/total"           = 10000
+    "inbound/s3_fetch"        = 2000
+    "inbound/mime_parse"      = 3000
+    "inbound/spam_check"      = 500
+    "inbound/dynamodb_store"  = 1000
+    "reply/total"             = 10000
+    "extractor/text_extract"  = 90000
+    "forward_sender/total"    = 20000
+    "forward_sender/ses_send" = 3000
+    "reply_sender/ses_send"   = 3000
+    "ack_sender/ses_send"     = 3000
+  }
+}
@@ -109,3 +109,70 @@ resource "aws_dynamodb_table" "conversations" {
     projection_type = "ALL"
   }
 }
+
+# Sender alias -> conversationId, the index inbound-handler resolves senders through
+# (see lambda/inbound-handler/conversation_index.py).
+resource "aws_dynamodb_table" "conversation_aliases" {
+  name         = var.alias_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "alias"
+
+  attribute {
+    name = "alias"
+    type = "S"
+  }
+}
+
+# One row per inbound email or reply, ordered by receipt time within its conversation,
+# so thread history is a single Query (see lambda/common/message_index.py).
+resource "aws_dynamodb_table" "messages" {
+  name         = var.message_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "conversationId"
+  range_key    = "timestamp"
+
+  attribute {
+    name = "conversationId"
+    type = "S"
+  }
+
+  attribute {
+    name = "timestamp"
+    type = "S"
+  }
+}
+
+# Per-message processing ledger: which stages of an inbound email, reply or outbound send
+# have finished, so redeliveries resume instead of repeating them (see lambda/common/ledger.py).
+resource "aws_dynamodb_table" "processing_ledger" {
+  name         = var.ledger_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "ledgerKey"
+
+  attribute {
+    name = "ledgerKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
+
+# Per-second SES send counters shared by the sender Lambdas (see lambda/common/ses_governor.py).
+resource "aws_dynamodb_table" "send_rate" {
+  name         = var.send_rate_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "rateWindow"
+
+  attribute {
+    name = "rateWindow"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+}
@@ -7,3 +7,23 @@ output "table_arn" {
   description = "DynamoDB table ARN"
   value       = aws_dynamodb_table.conversations.arn
 }
+
+output "send_rate_table_name" {
+  description = "SES send-rate counter table name"
+  value       = aws_dynamodb_table.send_rate.name
+}
+
+output "ledger_table_name" {
+  description = "Processing ledger table name"
+  value       = aws_dynamodb_table.processing_ledger.name
+}
+
+output "alias_table_name" {
+  description = "Conversation alias table name"
+  value       = aws_dynamodb_table.conversation_aliases.name
+}
+
+output "message_table_name" {
+  description = "Message index table name"
+  value       = aws_dynamodb_table.messages.name
+}
@@ -2,3 +2,23 @@ variable "table_name" {
   description = "DynamoDB table name"
   type        = string
 }
+
+variable "send_rate_table_name" {
+  description = "DynamoDB table name for shared SES send-rate counters"
+  type        = string
+}
+
+variable "ledger_table_name" {
+  description = "DynamoDB table name for the per-message processing ledger"
+  type        = string
+}
+
+variable "alias_table_name" {
+  description = "DynamoDB table name for sender alias to conversation ID mappings"
+  type        = string
+}
+
+variable "message_table_name" {
+  description = "DynamoDB table name for the per-conversation message index"
+  type        = string
+}
@@ -5,6 +5,8 @@ locals {
   ack_sender_name     = "${var.project_name}-${var.environment}-ack-sender"
   forward_sender_name = "${var.project_name}-${var.environment}-forward-sender"
   reply_sender_name   = "${var.project_name}-${var.environment}-reply-sender"
+  search_indexer_name   = "${var.project_name}-${var.environment}-search-indexer"
+  search_compactor_name = "${var.project_name}-${var.environment}-search-compactor"
 }
 
 # IAM Role for Inbound Handler
@@ -44,10 +46,16 @@ resource "aws_iam_role_policy" "inbound_handler" {
         Action = [
           "s3:GetObject",
           "s3:PutObject",
-          "s3:DeleteObject"
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
         ]
         Resource = "arn:aws:s3:::${var.bucket_name}/*"
       },
+      {
+        Effect = "Allow"
+        Action = "s3:ListBucket"
+        Resource = "arn:aws:s3:::${var.bucket_name}"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -58,7 +66,10 @@ resource "aws_iam_role_policy" "inbound_handler" {
         ]
         Resource = [
           "arn:aws:dynamodb:*:*:table/${var.table_name}",
-          "arn:aws:dynamodb:*:*:table/${var.table_name}/index/*"
+          "arn:aws:dynamodb:*:*:table/${var.table_name}/index/*",
+          "arn:aws:dynamodb:*:*:table/${var.ledger_table_name}",
+          "arn:aws:dynamodb:*:*:table/${var.alias_table_name}",
+          "arn:aws:dynamodb:*:*:table/${var.message_table_name}"
         ]
       },
       {
@@ -66,7 +77,8 @@ resource "aws_iam_role_policy" "inbound_handler" {
         Action = "sqs:SendMessage"
         Resource = [
           var.ack_queue_arn,
-          var.forward_queue_arn
+          var.forward_queue_arn,
+          var.search_queue_arn
         ]
       },
       {
@@ -97,15 +109,22 @@ resource "aws_lambda_function" "inbound_handler" {
 
   environment {
     variables = {
-      BUCKET_NAME             = var.bucket_name
-      TABLE_NAME              = var.table_name
-      PUBLIC_EMAIL            = var.public_email
-      PRIVATE_EMAIL           = var.private_email
-      DOMAIN_NAME             = var.domain_name
-      SNS_TOPIC_ARN           = var.sns_topic_arn
-      SPAM_KEYWORDS_SSM_PARAM = "/service-email-handler/${var.environment}/spam-keywords-s3-key"
-      ACK_QUEUE_URL           = var.ack_queue_url
-      FORWARD_QUEUE_URL       = var.forward_queue_url
+      BUCKET_NAME              = var.bucket_name
+      TABLE_NAME               = var.table_name
+      PUBLIC_EMAIL             = var.public_email
+      PRIVATE_EMAIL            = var.private_email
+      DOMAIN_NAME              = var.domain_name
+      SNS_TOPIC_ARN            = var.sns_topic_arn
+      SPAM_KEYWORDS_SSM_PARAM  = "/service-email-handler/${var.environment}/spam-keywords-s3-key"
+      ACK_QUEUE_URL            = var.ack_queue_url
+      FORWARD_QUEUE_URL        = var.forward_queue_url
+      SPAM_AUDIT_MODE          = var.spam_audit_mode
+      LEDGER_TABLE             = var.ledger_table_name
+      CONVERSATION_ALIAS_TABLE = var.alias_table_name
+      RELAY_DOMAINS            = var.relay_domains
+      MESSAGES_TABLE           = var.message_table_name
+      SEARCH_INDEX_PREFIX      = var.search_index_prefix
+      SEARCH_QUEUE_URL         = var.search_queue_url
     }
   }
 }
@@ -160,10 +179,16 @@ resource "aws_iam_role_policy" "reply_handler" {
         Action = [
           "s3:GetObject",
           "s3:PutObject",
-          "s3:DeleteObject"
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
         ]
         Resource = "arn:aws:s3:::${var.bucket_name}/*"
       },
+      {
+        Effect = "Allow"
+        Action = "s3:ListBucket"
+        Resource = "arn:aws:s3:::${var.bucket_name}"
+      },
       {
         Effect = "Allow"
         Action = [
@@ -174,13 +199,18 @@ resource "aws_iam_role_policy" "reply_handler" {
         ]
         Resource = [
           "arn:aws:dynamodb:*:*:table/${var.table_name}",
-          "arn:aws:dynamodb:*:*:table/${var.table_name}/index/*"
+          "arn:aws:dynamodb:*:*:table/${var.table_name}/index/*",
+          "arn:aws:dynamodb:*:*:table/${var.ledger_table_name}",
+          "arn:aws:dynamodb:*:*:table/${var.message_table_name}"
         ]
       },
       {
         Effect = "Allow"
         Action = "sqs:SendMessage"
-        Resource = var.reply_queue_arn
+        Resource = [
+          var.reply_queue_arn,
+          var.search_queue_arn
+        ]
       },
       {
         Effect = "Allow"
@@ -205,12 +235,16 @@ resource "aws_lambda_function" "reply_handler" {
 
   environment {
     variables = {
-      BUCKET_NAME    = var.bucket_name
-      TABLE_NAME     = var.table_name
-      PUBLIC_EMAIL   = var.public_email
-      DOMAIN_NAME    = var.domain_name
-      SNS_TOPIC_ARN  = var.sns_topic_arn
-      REPLY_QUEUE_URL = var.reply_queue_url
+      BUCKET_NAME         = var.bucket_name
+      TABLE_NAME          = var.table_name
+      PUBLIC_EMAIL        = var.public_email
+      DOMAIN_NAME         = var.domain_name
+      SNS_TOPIC_ARN       = var.sns_topic_arn
+      REPLY_QUEUE_URL     = var.reply_queue_url
+      LEDGER_TABLE        = var.ledger_table_name
+      MESSAGES_TABLE      = var.message_table_name
+      SEARCH_INDEX_PREFIX = var.search_index_prefix
+      SEARCH_QUEUE_URL    = var.search_queue_url
     }
   }
 }
@@ -264,10 +298,16 @@ resource "aws_iam_role_policy" "extractor_handler" {
         Effect = "Allow"
         Action = [
           "s3:GetObject",
-          "s3:PutObject"
+          "s3:PutObject",
+          "s3:AbortMultipartUpload"
         ]
         Resource = "arn:aws:s3:::${var.bucket_name}/*"
       },
+      {
+        Effect = "Allow"
+        Action = "s3:ListBucket"
+        Resource = "arn:aws:s3:::${var.bucket_name}"
+      },
       {
         Effect = "Allow"
         Action = "dynamodb:UpdateItem"
@@ -275,6 +315,11 @@ resource "aws_iam_role_policy" "extractor_handler" {
           "arn:aws:dynamodb:*:*:table/${var.table_name}",
           "arn:aws:dynamodb:*:*:table/${var.table_name}/index/*"
         ]
+      },
+      {
+        Effect = "Allow"
+        Action = "sqs:SendMessage"
+        Resource = var.search_queue_arn
       }
     ]
   })
@@ -286,16 +331,18 @@ resource "aws_lambda_function" "extractor_handler" {
   role          = aws_iam_role.extractor_handler.arn
   handler       = "handler.lambda_handler"
   runtime       = "python3.12"
-  timeout       = 30
-  memory_size   = 256
+  timeout       = 120
+  memory_size   = 512
 
   filename         = "${path.root}/lambda/attachment-extractor/deployment.zip"
   source_code_hash = filebase64sha256("${path.root}/lambda/attachment-extractor/deployment.zip")
 
   environment {
     variables = {
-      BUCKET_NAME = var.bucket_name
-      TABLE_NAME  = var.table_name
+      BUCKET_NAME         = var.bucket_name
+      TABLE_NAME          = var.table_name
+      SEARCH_INDEX_PREFIX = var.search_index_prefix
+      SEARCH_QUEUE_URL    = var.search_queue_url
     }
   }
 }
@@ -314,7 +361,8 @@ resource "aws_lambda_permission" "extractor_s3" {
   source_arn    = "arn:aws:s3:::${var.bucket_name}"
 }
 
-# Spam log group is created by Lambda code; manage it here for retention and lifecycle.
+# Spam audit log group. Managed here for retention and lifecycle; the inbound handler only
+# creates it if it is missing.
 resource "aws_cloudwatch_log_group" "spam" {
   name              = "/email-handler/spam"
   retention_in_days = 365
@@ -357,12 +405,22 @@ resource "aws_iam_role_policy" "ack_sender" {
       },
       {
         Effect   = "Allow"
-        Action   = ["ses:SendEmail", "ses:SendRawEmail"]
+        Action   = ["ses:SendEmail", "ses:SendRawEmail", "ses:GetSendQuota"]
         Resource = "*"
       },
       {
         Effect   = "Allow"
-        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+        Action   = "dynamodb:UpdateItem"
+        Resource = "arn:aws:dynamodb:*:*:table/${var.send_rate_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:GetItem", "dynamodb:UpdateItem"]
+        Resource = "arn:aws:dynamodb:*:*:table/${var.ledger_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes", "sqs:SendMessage"]
         Resource = var.ack_queue_arn
       },
       {
@@ -387,8 +445,12 @@ resource "aws_lambda_function" "ack_sender" {
 
   environment {
     variables = {
-      PUBLIC_EMAIL  = var.public_email
-      SNS_TOPIC_ARN = var.sns_topic_arn
+      PUBLIC_EMAIL      = var.public_email
+      SNS_TOPIC_ARN     = var.sns_topic_arn
+      SES_MAX_SEND_RATE = var.ses_max_send_rate
+      SES_RATE_TABLE    = var.ses_rate_coordination ? var.send_rate_table_name : ""
+      QUEUE_URL         = var.ack_queue_url
+      LEDGER_TABLE      = var.ledger_table_name
     }
   }
 }
@@ -400,9 +462,11 @@ resource "aws_cloudwatch_log_group" "ack_sender" {
 }
 
 resource "aws_lambda_event_source_mapping" "ack_sender" {
-  event_source_arn = var.ack_queue_arn
-  function_name    = aws_lambda_function.ack_sender.arn
-  batch_size       = 1
+  event_source_arn                   = var.ack_queue_arn
+  function_name                      = aws_lambda_function.ack_sender.arn
+  batch_size                         = var.sender_batch_size
+  maximum_batching_window_in_seconds = var.sender_batching_window_seconds
+  function_response_types            = ["ReportBatchItemFailures"]
 }
 
 # --- Forward Sender ---
@@ -426,12 +490,22 @@ resource "aws_iam_role_policy" "forward_sender" {
       },
       {
         Effect   = "Allow"
-        Action   = ["ses:SendEmail", "ses:SendRawEmail"]
+        Action   = ["ses:SendEmail", "ses:SendRawEmail", "ses:GetSendQuota"]
         Resource = "*"
       },
       {
         Effect   = "Allow"
-        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+        Action   = "dynamodb:UpdateItem"
+        Resource = "arn:aws:dynamodb:*:*:table/${var.send_rate_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:GetItem", "dynamodb:UpdateItem"]
+        Resource = "arn:aws:dynamodb:*:*:table/${var.ledger_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes", "sqs:SendMessage"]
         Resource = var.forward_queue_arn
       },
       {
@@ -442,7 +516,10 @@ resource "aws_iam_role_policy" "forward_sender" {
       {
         Effect   = "Allow"
         Action   = "s3:GetObject"
-        Resource = "arn:aws:s3:::${var.bucket_name}/attachments/*"
+        Resource = [
+          "arn:aws:s3:::${var.bucket_name}/attachments/*",
+          "arn:aws:s3:::${var.bucket_name}/blobs/*"
+        ]
       }
     ]
   })
@@ -454,16 +531,21 @@ resource "aws_lambda_function" "forward_sender" {
   handler       = "handler.lambda_handler"
   runtime       = "python3.12"
   timeout       = 120
-  memory_size   = 256
+  # Five full-size messages in flight at once; see send_memory_budget in the handler
+  memory_size   = 512
 
   filename         = "${path.root}/lambda/forward-sender/deployment.zip"
   source_code_hash = filebase64sha256("${path.root}/lambda/forward-sender/deployment.zip")
 
   environment {
     variables = {
-      PUBLIC_EMAIL  = var.public_email
-      SNS_TOPIC_ARN = var.sns_topic_arn
-      BUCKET_NAME   = var.bucket_name
+      PUBLIC_EMAIL      = var.public_email
+      SNS_TOPIC_ARN     = var.sns_topic_arn
+      BUCKET_NAME       = var.bucket_name
+      SES_MAX_SEND_RATE = var.ses_max_send_rate
+      SES_RATE_TABLE    = var.ses_rate_coordination ? var.send_rate_table_name : ""
+      QUEUE_URL         = var.forward_queue_url
+      LEDGER_TABLE      = var.ledger_table_name
     }
   }
 }
@@ -475,9 +557,11 @@ resource "aws_cloudwatch_log_group" "forward_sender" {
 }
 
 resource "aws_lambda_event_source_mapping" "forward_sender" {
-  event_source_arn = var.forward_queue_arn
-  function_name    = aws_lambda_function.forward_sender.arn
-  batch_size       = 1
+  event_source_arn                   = var.forward_queue_arn
+  function_name                      = aws_lambda_function.forward_sender.arn
+  batch_size                         = var.sender_batch_size
+  maximum_batching_window_in_seconds = var.sender_batching_window_seconds
+  function_response_types            = ["ReportBatchItemFailures"]
 }
 
 # --- Reply Sender ---
@@ -501,12 +585,22 @@ resource "aws_iam_role_policy" "reply_sender" {
       },
       {
         Effect   = "Allow"
-        Action   = ["ses:SendEmail", "ses:SendRawEmail"]
+        Action   = ["ses:SendEmail", "ses:SendRawEmail", "ses:GetSendQuota"]
         Resource = "*"
       },
       {
         Effect   = "Allow"
-        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+        Action   = "dynamodb:UpdateItem"
+        Resource = "arn:aws:dynamodb:*:*:table/${var.send_rate_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:GetItem", "dynamodb:UpdateItem"]
+        Resource = "arn:aws:dynamodb:*:*:table/${var.ledger_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes", "sqs:SendMessage"]
         Resource = var.reply_queue_arn
       },
       {
@@ -517,7 +611,10 @@ resource "aws_iam_role_policy" "reply_sender" {
       {
         Effect   = "Allow"
         Action   = "s3:GetObject"
-        Resource = "arn:aws:s3:::${var.bucket_name}/reply-attachments/*"
+        Resource = [
+          "arn:aws:s3:::${var.bucket_name}/reply-attachments/*",
+          "arn:aws:s3:::${var.bucket_name}/blobs/*"
+        ]
       }
     ]
   })
@@ -536,9 +633,13 @@ resource "aws_lambda_function" "reply_sender" {
 
   environment {
     variables = {
-      PUBLIC_EMAIL  = var.public_email
-      SNS_TOPIC_ARN = var.sns_topic_arn
-      BUCKET_NAME   = var.bucket_name
+      PUBLIC_EMAIL      = var.public_email
+      SNS_TOPIC_ARN     = var.sns_topic_arn
+      BUCKET_NAME       = var.bucket_name
+      SES_MAX_SEND_RATE = var.ses_max_send_rate
+      SES_RATE_TABLE    = var.ses_rate_coordination ? var.send_rate_table_name : ""
+      QUEUE_URL         = var.reply_queue_url
+      LEDGER_TABLE      = var.ledger_table_name
     }
   }
 }
@@ -550,7 +651,169 @@ resource "aws_cloudwatch_log_group" "reply_sender" {
 }
 
 resource "aws_lambda_event_source_mapping" "reply_sender" {
-  event_source_arn = var.reply_queue_arn
-  function_name    = aws_lambda_function.reply_sender.arn
-  batch_size       = 1
+  event_source_arn                   = var.reply_queue_arn
+  function_name                      = aws_lambda_function.reply_sender.arn
+  batch_size                         = var.sender_batch_size
+  maximum_batching_window_in_seconds = var.sender_batching_window_seconds
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
+# IAM Role for Search Indexer
+resource "aws_iam_role" "search_indexer" {
+  name = "${local.search_indexer_name}-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [{
+      Action = "sts:AssumeRole"
+      Effect = "Allow"
+      Principal = {
+        Service = "lambda.amazonaws.com"
+      }
+    }]
+  })
+}
+
+resource "aws_iam_role_policy" "search_indexer" {
+  name = "${local.search_indexer_name}-policy"
+  role = aws_iam_role.search_indexer.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = "arn:aws:logs:*:*:*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject",
+          "s3:AbortMultipartUpload"
+        ]
+        Resource = "arn:aws:s3:::${var.bucket_name}/${var.search_index_prefix}*"
+      },
+      {
+        Effect = "Allow"
+        Action = "s3:GetObject"
+        Resource = "arn:aws:s3:::${var.bucket_name}/extracted-text/*"
+      },
+      {
+        Effect = "Allow"
+        Action = "s3:ListBucket"
+        Resource = "arn:aws:s3:::${var.bucket_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+        Resource = var.search_queue_arn
+      }
+    ]
+  })
+}
+
+# Writes queued documents to the index and answers search invocations. Not limited by
+# reserved concurrency, so searches are never throttled; the event source mapping caps
+# how many queue batches are written at once.
+resource "aws_lambda_function" "search_indexer" {
+  function_name = local.search_indexer_name
+  role          = aws_iam_role.search_indexer.arn
+  handler       = "handler.lambda_handler"
+  runtime       = "python3.12"
+  timeout       = 120
+  memory_size   = 512
+
+  ephemeral_storage {
+    size = 2048
+  }
+
+  filename         = "${path.root}/lambda/search-indexer/deployment.zip"
+  source_code_hash = filebase64sha256("${path.root}/lambda/search-indexer/deployment.zip")
+
+  environment {
+    variables = {
+      BUCKET_NAME         = var.bucket_name
+      SEARCH_INDEX_PREFIX = var.search_index_prefix
+    }
+  }
+}
+
+# Large batches over a long window, so the index gains one segment per batch rather than
+# one per message
+resource "aws_lambda_event_source_mapping" "search_indexer" {
+  event_source_arn                   = var.search_queue_arn
+  function_name                      = aws_lambda_function.search_indexer.arn
+  batch_size                         = var.search_batch_size
+  maximum_batching_window_in_seconds = var.search_batching_window_seconds
+  function_response_types            = ["ReportBatchItemFailures"]
+
+  scaling_config {
+    maximum_concurrency = 2
+  }
+}
+
+resource "aws_cloudwatch_log_group" "search_indexer" {
+  name              = "/aws/lambda/${local.search_indexer_name}"
+  retention_in_days = 365
+  skip_destroy      = true
+}
+
+# Merges index segments on a schedule, from the search indexer's package. One instance
+# at a time, so two compactions never merge the same segments; a scheduled run that is
+# throttled behind a long one is retried by Lambda.
+resource "aws_lambda_function" "search_compactor" {
+  function_name = local.search_compactor_name
+  role          = aws_iam_role.search_indexer.arn
+  handler       = "handler.compaction_handler"
+  runtime       = "python3.12"
+  timeout       = 300
+  memory_size   = 512
+
+  reserved_concurrent_executions = 1
+
+  ephemeral_storage {
+    size = 2048
+  }
+
+  filename         = "${path.root}/lambda/search-indexer/deployment.zip"
+  source_code_hash = filebase64sha256("${path.root}/lambda/search-indexer/deployment.zip")
+
+  environment {
+    variables = {
+      BUCKET_NAME         = var.bucket_name
+      SEARCH_INDEX_PREFIX = var.search_index_prefix
+    }
+  }
+}
+
+resource "aws_cloudwatch_log_group" "search_compactor" {
+  name              = "/aws/lambda/${local.search_compactor_name}"
+  retention_in_days = 365
+  skip_destroy      = true
+}
+
+resource "aws_cloudwatch_event_rule" "search_compaction" {
+  name                = local.search_compactor_name
+  description         = "Merge full-text search index segments"
+  schedule_expression = var.search_compaction_schedule
+}
+
+resource "aws_cloudwatch_event_target" "search_compaction" {
+  rule = aws_cloudwatch_event_rule.search_compaction.name
+  arn  = aws_lambda_function.search_compactor.arn
+}
+
+resource "aws_lambda_permission" "search_compaction" {
+  statement_id  = "AllowEventBridgeInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.search_compactor.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.search_compaction.arn
 }
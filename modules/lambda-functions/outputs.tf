@@ -57,3 +57,13 @@ output "reply_sender_name" {
   description = "Reply sender Lambda name"
   value       = aws_lambda_function.reply_sender.function_name
 }
+
+output "search_indexer_name" {
+  description = "Search indexer Lambda name"
+  value       = aws_lambda_function.search_indexer.function_name
+}
+
+output "search_compactor_name" {
+  description = "Search compactor Lambda name"
+  value       = aws_lambda_function.search_compactor.function_name
+}
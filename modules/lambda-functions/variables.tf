@@ -67,3 +67,93 @@ variable "reply_queue_url" {
   description = "Reply sender SQS queue URL"
   type        = string
 }
+
+variable "search_queue_arn" {
+  description = "Search index document SQS queue ARN"
+  type        = string
+}
+
+variable "search_queue_url" {
+  description = "Search index document SQS queue URL"
+  type        = string
+}
+
+variable "sender_batch_size" {
+  description = "Maximum SQS records delivered to each sender Lambda invocation"
+  type        = number
+  default     = 10
+}
+
+variable "sender_batching_window_seconds" {
+  description = "How long SQS may wait to fill a sender batch"
+  type        = number
+  default     = 1
+}
+
+variable "ses_max_send_rate" {
+  description = "Per-container SES send ceiling below the account quota (0 = use the quota)"
+  type        = number
+  default     = 0
+}
+
+variable "send_rate_table_name" {
+  description = "DynamoDB table name for shared SES send-rate counters"
+  type        = string
+}
+
+variable "ledger_table_name" {
+  description = "DynamoDB table name for the per-message processing ledger"
+  type        = string
+}
+
+variable "alias_table_name" {
+  description = "DynamoDB table name for sender alias to conversation ID mappings"
+  type        = string
+}
+
+variable "message_table_name" {
+  description = "DynamoDB table name for the per-conversation message index"
+  type        = string
+}
+
+variable "search_index_prefix" {
+  description = "S3 key prefix of the full-text search index segments (empty disables indexing)"
+  type        = string
+  default     = "search-index/"
+}
+
+variable "search_batch_size" {
+  description = "Maximum documents the search indexer writes as one index segment"
+  type        = number
+  default     = 100
+}
+
+variable "search_batching_window_seconds" {
+  description = "How long SQS may wait to fill a search indexer batch"
+  type        = number
+  default     = 60
+}
+
+variable "search_compaction_schedule" {
+  description = "EventBridge schedule on which the search indexer merges index segments"
+  type        = string
+  default     = "rate(15 minutes)"
+}
+
+variable "relay_domains" {
+  description = "Relay domains whose senders are identified by display name, as comma-separated \"domain=label\" pairs"
+  type        = string
+  default     = "bounce.linkedin.com=linkedin"
+}
+
+variable "ses_rate_coordination" {
+  description = "Pace SES sends account-wide through the send-rate table"
+  type        = bool
+  default     = false
+}
+
+variable "spam_audit_mode" {
+  description = "Where inbound-handler writes spam audit events: \"logs\" (batched into /email-handler/spam) or \"emf\" (EMF lines in the function's own log)"
+  type        = string
+  default     = "logs"
+}
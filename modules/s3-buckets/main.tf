@@ -41,6 +41,20 @@ resource "aws_s3_bucket_lifecycle_configuration" "email_storage" {
       days = 30
     }
   }
+
+  # Attachments and extracted text above 8 MiB are written as multipart uploads; parts of
+  # an upload a timed-out or crashed Lambda never completed or aborted are billed until
+  # they are removed.
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
 }
 
 resource "aws_s3_bucket_notification" "attachment_extraction" {
@@ -22,3 +22,21 @@ resource "aws_sqs_queue" "sender" {
     maxReceiveCount     = 5
   })
 }
+
+# Documents for the full-text search index, settled like the sender queues
+resource "aws_sqs_queue" "search_dlq" {
+  name                      = "${var.project_name}-${var.environment}-search-indexer-dlq"
+  message_retention_seconds = 604800 # 7 days
+  visibility_timeout_seconds = 30
+}
+
+resource "aws_sqs_queue" "search" {
+  name                      = "${var.project_name}-${var.environment}-search-indexer"
+  message_retention_seconds = 86400 # 1 day
+  visibility_timeout_seconds = 180
+
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.search_dlq.arn
+    maxReceiveCount     = 5
+  })
+}
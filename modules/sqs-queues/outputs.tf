@@ -28,6 +28,16 @@ output "reply_queue_url" {
   value       = aws_sqs_queue.sender["reply-sender"].url
 }
 
+output "search_queue_arn" {
+  description = "Search indexer queue ARN"
+  value       = aws_sqs_queue.search.arn
+}
+
+output "search_queue_url" {
+  description = "Search indexer queue URL"
+  value       = aws_sqs_queue.search.url
+}
+
 output "ack_dlq_name" {
   description = "Ack sender DLQ name"
   value       = aws_sqs_queue.sender_dlq["ack-sender"].name
@@ -42,3 +52,8 @@ output "reply_dlq_name" {
   description = "Reply sender DLQ name"
   value       = aws_sqs_queue.sender_dlq["reply-sender"].name
 }
+
+output "search_dlq_name" {
+  description = "Search indexer DLQ name"
+  value       = aws_sqs_queue.search_dlq.name
+}
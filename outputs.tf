@@ -23,6 +23,11 @@ output "extractor_lambda_arn" {
   value       = module.lambda_functions.extractor_handler_arn
 }
 
+output "search_indexer_name" {
+  description = "Search indexer Lambda name (invoke with {\"query\": ...} to search)"
+  value       = module.lambda_functions.search_indexer_name
+}
+
 output "sns_topic_arn" {
   description = "SNS topic ARN for alerts"
   value       = module.cloudwatch_alarms.sns_topic_arn
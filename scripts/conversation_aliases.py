@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Manage the conversation alias table the inbound handler resolves senders through.
+
+Each alias row maps a sender address (addr#user@example.com) or, for relay
+domains such as bounce.linkedin.com, a display name (name#bounce.linkedin.com#jane-smith)
+to a conversationId. The handler adds a row the first time it sees a sender; use this
+to point further addresses at an existing conversation, or to seed the table from the
+conversations table after it is first deployed.
+
+    python scripts/conversation_aliases.py --table TABLE show jane@personal.example.com
+    python scripts/conversation_aliases.py --table TABLE add jane@personal.example.com \\
+        jane-at-agency.com
+    python scripts/conversation_aliases.py --table TABLE add messages-noreply@bounce.linkedin.com \\
+        jane-at-agency.com --display-name "Jane Smith" --overwrite
+    python scripts/conversation_aliases.py --table TABLE backfill --conversations-table CONVERSATIONS
+
+TABLE is {project}-{environment}-conversation-aliases. Set RELAY_DOMAINS as on the
+Lambda if it was changed from the default. Needs boto3 and mypylogger.
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'lambda', 'inbound-handler'), os.path.join(ROOT, 'lambda', 'common')]
+
+from conversation_index import ConversationIndex, alias_key  # noqa: E402
+
+
+def show(index, args):
+    key = alias_key(args.sender, args.display_name)
+    item = index.dynamodb.Table(index.table_name).get_item(Key={'alias': key}, ConsistentRead=True).get('Item')
+    print(json.dumps(item or {'alias': key, 'conversationId': None}))
+
+
+def add(index, args):
+    key = alias_key(args.sender, args.display_name)
+    item = index.add_alias(key, args.conversation_id, overwrite=args.overwrite)
+    if item['conversationId'] != args.conversation_id:
+        raise SystemExit(f"{key} already maps to {item['conversationId']} (use --overwrite to repoint it)")
+    print(json.dumps(item))
+
+
+def backfill(index, args):
+    # Every conversation item already holds the sender (and display name for relay
+    # senders) its ID was derived from; existing aliases are left alone.
+    conversations = index.dynamodb.Table(args.conversations_table)
+    scan = {'ProjectionExpression': 'conversationId, senderEmail, displayName'}
+    counts = {'conversations': 0, 'added': 0, 'existing': 0}
+    while True:
+        page = conversations.scan(**scan)
+        for item in page.get('Items', []):
+            counts['conversations'] += 1
+            if not item.get('senderEmail'):
+                continue
+            key = alias_key(item['senderEmail'], item.get('displayName'))
+            stored = index.add_alias(key, item['conversationId'])
+            counts['added' if stored['conversationId'] == item['conversationId'] else 'existing'] += 1
+        if 'LastEvaluatedKey' not in page:
+            break
+        scan['ExclusiveStartKey'] = page['LastEvaluatedKey']
+    print(json.dumps(counts, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--table', required=True, help='conversation alias table')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('show', help='print the alias row a sender resolves through')
+    command.add_argument('sender')
+    command.add_argument('--display-name')
+    command.set_defaults(run=show)
+
+    command = commands.add_parser('add', help='map a sender to an existing conversation')
+    command.add_argument('sender')
+    command.add_argument('conversation_id')
+    command.add_argument('--display-name', help='for relay-domain senders')
+    command.add_argument('--overwrite', action='store_true', help='repoint an alias that already exists')
+    command.set_defaults(run=add)
+
+    command = commands.add_parser('backfill', help='add an alias for every existing conversation')
+    command.add_argument('--conversations-table', required=True)
+    command.set_defaults(run=backfill)
+
+    args = parser.parse_args()
+
+    import boto3
+    args.run(ConversationIndex(boto3.resource('dynamodb'), args.table), args)
+
+
+if __name__ == '__main__':
+    main()
@@ -97,6 +97,10 @@ echo "Building Lambda functions..."
 # Build each Lambda function
 for lambda_dir in lambda/*/; do
     lambda_name=$(basename "$lambda_dir")
+    # lambda/common holds modules shared by the handlers, not a function of its own
+    if [ "$lambda_name" = "common" ]; then
+        continue
+    fi
     echo "Building $lambda_name..."
     
     cd "$lambda_dir"
@@ -111,11 +115,14 @@ for lambda_dir in lambda/*/; do
             -v "$(pwd)":/workspace \
             -w /workspace \
             python:3.12-slim \
-            bash -c "pip install uv && uv pip install --system -r requirements.txt --target package/ && cp handler.py package/"
+            bash -c "pip install uv && uv pip install --system -r requirements.txt --target package/ && cp *.py package/"
     else
-        cp handler.py package/
+        cp *.py package/
     fi
     
+    # Copy shared modules
+    cp "$PROJECT_ROOT"/lambda/common/*.py package/
+
     # Copy template if exists (for inbound-handler)
     if [ -f "$PROJECT_ROOT/templates/auto-acknowledgement.txt" ] && [ "$lambda_name" = "inbound-handler" ]; then
         cp "$PROJECT_ROOT/templates/auto-acknowledgement.txt" package/
@@ -145,6 +152,10 @@ fi
 # Upload Lambda packages (bucket will be created by Terraform if needed)
 for lambda_dir in lambda/*/; do
     lambda_name=$(basename "$lambda_dir")
+    # lambda/common holds modules shared by the handlers, not a function of its own
+    if [ "$lambda_name" = "common" ]; then
+        continue
+    fi
     # Try to upload, if bucket doesn't exist yet, skip (Terraform will create it)
     if aws s3 ls "s3://${DEPLOYMENT_BUCKET}" 2>/dev/null; then
         aws s3 cp "${lambda_dir}deployment.zip" "s3://${DEPLOYMENT_BUCKET}/deployments/${lambda_name}.zip"
@@ -203,6 +214,10 @@ $TF_CMD apply -auto-approve
 echo "Uploading Lambda packages..."
 for lambda_dir in lambda/*/; do
     lambda_name=$(basename "$lambda_dir")
+    # lambda/common holds modules shared by the handlers, not a function of its own
+    if [ "$lambda_name" = "common" ]; then
+        continue
+    fi
     aws s3 cp "${lambda_dir}deployment.zip" "s3://${DEPLOYMENT_BUCKET}/deployments/${lambda_name}.zip"
 done
 
@@ -128,4 +128,4 @@ aws s3 cp "${OUTPUT_FILE}" "s3://${BUCKET_NAME}/${S3_KEY}" --region "${AWS_REGIO
 rm -rf "${TEMP_DIR}"
 
 echo "Spam filter configuration deployed successfully!"
-echo "Lambda will pick up changes on next cold start (within ${SPAM_KEYWORDS_TTL:-300}s for warm containers)"
+echo "Lambda will pick up changes on next cold start (within ~${SPAM_RULES_CHECK_SECONDS:-15}s for warm containers)"
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""Replay archived emails through the inbound handler's parsing and classification.
+
+Reads raw messages from S3 (conversations/, spam/, or any prefix) or from a local
+directory, runs them through the inbound handler's own functions in a process pool
+(parse, body extraction, DSN detection, conversation ID, spam check against a local
+keywords file, attachment routing, optionally text extraction) and writes one row per
+message to a columnar report. Nothing is written back to S3 or enqueued.
+
+Use it to check a keywords.txt change before ./scripts/deploy_spam_filter.sh:
+
+    python scripts/reprocess_archive.py s3://BUCKET/conversations/ s3://BUCKET/spam/ \\
+        --rules spam-filter/keywords.txt --baseline-rules /tmp/deployed-keywords.txt \\
+        --output report.csv
+    python scripts/reprocess_archive.py ./eml-dump --output report.parquet --extract
+
+Messages are classified as SES would have delivered them: verdicts PASS and the public
+address as the destination, so only the keyword rules (gate 3) can flag them. The
+envelope sender is taken from Return-Path, falling back to From. The conversation_id
+column is the ID derived from the sender (conversation_index.derive_conversation_id);
+the alias table is not read, so a sender that was merged into another conversation
+with scripts/conversation_aliases.py shows its own derived ID, not the one the inbound
+handler would resolve it to. Needs the inbound
+handler's requirements (boto3, mypylogger, pcre2); --extract also needs pypdf and
+python-docx, and a .parquet report needs pyarrow. Use --endpoint-url for a local S3
+stand-in.
+"""
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email import policy
+from email.parser import BytesParser
+from email.utils import parseaddr
+from multiprocessing import Pool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLUMNS = [
+    'source', 'size_bytes', 'sender', 'subject', 'conversation_id', 'verdict', 'reason',
+    'baseline_verdict', 'baseline_reason', 'changed', 'is_dsn', 'attachments',
+    'attachments_forwarded', 'attachments_skipped', 'text_bytes', 'parse_ms',
+    'classify_ms', 'extract_ms', 'error',
+]
+
+FETCH_THREADS = 16
+TASK_SIZE = 64
+
+# Per-process state, set by init_worker
+worker = {}
+
+
+def load_inbound_handler():
+    # The handler reads its configuration at import; none of it is used here.
+    for name, value in {
+        'BUCKET_NAME': 'reprocess', 'TABLE_NAME': 'reprocess', 'PUBLIC_EMAIL': 'public@localhost',
+        'PRIVATE_EMAIL': 'private@localhost', 'DOMAIN_NAME': 'localhost',
+        'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:000000000000:reprocess',
+        'SPAM_KEYWORDS_SSM_PARAM': '/reprocess', 'ACK_QUEUE_URL': 'reprocess',
+        'FORWARD_QUEUE_URL': 'reprocess', 'AWS_DEFAULT_REGION': 'us-east-1',
+        # Pool workers are daemonic and cannot fork page workers; the pool is the parallelism
+        'EXTRACT_WORKERS': '1',
+        'METRICS_ENABLED': 'false',
+    }.items():
+        os.environ.setdefault(name, value)
+    for path in ('attachment-extractor', 'inbound-handler', 'common'):
+        sys.path.insert(0, os.path.join(ROOT, 'lambda', path))
+    spec = importlib.util.spec_from_file_location(
+        'inbound_handler', os.path.join(ROOT, 'lambda', 'inbound-handler', 'handler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_rules(path):
+    from spam_rules import SpamRules
+    if not path:
+        return None
+    with open(path, encoding='utf-8') as f:
+        return SpamRules.from_text(f.read())
+
+
+def make_s3(endpoint_url):
+    import boto3
+    return boto3.client('s3', endpoint_url=endpoint_url)
+
+
+def init_worker(rules_path, baseline_path, use_s3, endpoint_url, extract):
+    handler = load_inbound_handler()
+    worker['handler'] = handler
+    worker['rules'] = load_rules(rules_path)
+    worker['baseline'] = load_rules(baseline_path)
+    worker['s3'] = make_s3(endpoint_url) if use_s3 else None
+    worker['extract'] = extract
+    worker['fetch'] = ThreadPoolExecutor(FETCH_THREADS)
+
+
+def read_source(ref):
+    if ref.startswith('s3://'):
+        bucket, key = ref[5:].split('/', 1)
+        return worker['s3'].get_object(Bucket=bucket, Key=key)['Body'].read()
+    with open(ref, 'rb') as f:
+        return f.read()
+
+
+def classify(handler, rules, mail, subject, body, sender):
+    ses_record = {'receipt': {}}
+    is_spam, reason = handler.check_spam(ses_record, mail, subject, body, sender, rules=rules)
+    return ('spam' if is_spam else 'ham'), reason
+
+
+def extract_text_bytes(part, filename):
+    from mime_stream import iter_decoded_payload
+    from text_extraction import ExtractionFailed, ExtractionStats, iter_docx_text, iter_pdf_text, iter_utf8_chunks
+    extractor = {'.pdf': iter_pdf_text, '.docx': iter_docx_text}.get(os.path.splitext(filename.lower())[1])
+    if extractor is None:
+        return 0
+    stats = ExtractionStats()
+    with tempfile.NamedTemporaryFile() as f:
+        for chunk in iter_decoded_payload(part):
+            f.write(chunk)
+        f.flush()
+        try:
+            for _ in iter_utf8_chunks(extractor(f.name, stats), stats):
+                pass
+        except ExtractionFailed:
+            return 0
+    return stats.bytes
+
+
+def process_message(ref, data):
+    from conversation_index import derive_conversation_id
+    handler = worker['handler']
+    row = dict.fromkeys(COLUMNS)
+    row['source'] = ref
+    row['size_bytes'] = len(data)
+    try:
+        started = time.perf_counter()
+        msg = BytesParser(policy=policy.default).parsebytes(data)
+        subject = msg['subject'] or '(no subject)'
+        body = handler.extract_body_text(msg)
+        sender = parseaddr(str(msg.get('Return-Path', '')))[1] or parseaddr(str(msg.get('From', '')))[1]
+        display_name = handler.extract_display_name(msg)
+        row['parse_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+        started = time.perf_counter()
+        mail = {'destination': [handler.PUBLIC_EMAIL]}
+        row['sender'] = sender
+        row['subject'] = subject
+        row['is_dsn'] = handler.is_dsn_message(subject, sender)
+        row['conversation_id'] = derive_conversation_id(sender, display_name)
+        row['verdict'], row['reason'] = classify(handler, worker['rules'], mail, subject, body, sender)
+        if worker['baseline'] is not None:
+            row['baseline_verdict'], row['baseline_reason'] = classify(
+                handler, worker['baseline'], mail, subject, body, sender)
+            row['changed'] = row['verdict'] != row['baseline_verdict']
+        row['classify_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+        started = time.perf_counter()
+        forwarded = skipped = text_bytes = 0
+        for part in msg.iter_attachments():
+            filename = part.get_filename()
+            if not filename:
+                continue
+            if any(filename.lower().endswith(e) for e in handler.FORWARDED_EXTENSIONS):
+                forwarded += 1
+                if worker['extract']:
+                    text_bytes += extract_text_bytes(part, filename)
+            else:
+                skipped += 1
+        row['attachments'] = forwarded + skipped
+        row['attachments_forwarded'] = forwarded
+        row['attachments_skipped'] = skipped
+        if worker['extract']:
+            row['text_bytes'] = text_bytes
+            row['extract_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    except Exception as e:
+        row['verdict'] = 'error'
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def process_task(refs):
+    # Downloads for the task overlap on threads; parsing stays on this process's core.
+    fetches = [(ref, worker['fetch'].submit(read_source, ref)) for ref in refs]
+    rows = []
+    for ref, future in fetches:
+        try:
+            data = future.result()
+        except Exception as e:
+            row = dict.fromkeys(COLUMNS)
+            row.update(source=ref, verdict='error', error=f"{type(e).__name__}: {e}")
+            rows.append(row)
+            continue
+        rows.append(process_message(ref, data))
+    return rows
+
+
+def list_sources(sources, endpoint_url, limit):
+    s3 = None
+    count = 0
+    for source in sources:
+        if source.startswith('s3://'):
+            bucket, _, prefix = source[5:].partition('/')
+            s3 = s3 or make_s3(endpoint_url)
+            pages = s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix)
+            refs = (f"s3://{bucket}/{obj['Key']}" for page in pages for obj in page.get('Contents', [])
+                    if not obj['Key'].endswith('/'))
+        else:
+            refs = (os.path.join(directory, name) for directory, _, names in os.walk(source)
+                    for name in sorted(names))
+        for ref in refs:
+            yield ref
+            count += 1
+            if limit and count >= limit:
+                return
+
+
+def chunked(refs, size):
+    chunk = []
+    for ref in refs:
+        chunk.append(ref)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ReportWriter:
+    # CSV and JSON Lines are written as rows arrive; Parquet is buffered into columns and
+    # written at the end.
+
+    def __init__(self, path):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lstrip('.').lower()
+        self.columns = {name: [] for name in COLUMNS}
+        self._file = None
+        if self.format == 'parquet':
+            import pyarrow  # noqa: F401 - fail before any work is done
+        elif self.format in ('csv', 'jsonl'):
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            if self.format == 'csv':
+                self._csv = csv.DictWriter(self._file, fieldnames=COLUMNS)
+                self._csv.writeheader()
+        else:
+            raise SystemExit(f"unsupported report format: {path} (use .csv, .jsonl or .parquet)")
+
+    def write(self, row):
+        if self.format == 'csv':
+            self._csv.writerow(row)
+        elif self.format == 'jsonl':
+            self._file.write(json.dumps(row) + '\n')
+        else:
+            for name in COLUMNS:
+                self.columns[name].append(row[name])
+
+    def close(self):
+        if self.format == 'parquet':
+            import pyarrow
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(pyarrow.table(self.columns), self.path)
+        else:
+            self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sources', nargs='+', help='s3://bucket/prefix or a local directory')
+    parser.add_argument('--rules', default=os.path.join(ROOT, 'spam-filter', 'keywords.txt'),
+                        help='keywords file to classify with (default: the repo copy)')
+    parser.add_argument('--baseline-rules', help='second keywords file to compare against')
+    parser.add_argument('--output', default='reprocess-report.csv', help='.csv, .jsonl or .parquet')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--extract', action='store_true', help='also run PDF/DOCX text extraction')
+    parser.add_argument('--endpoint-url', help='S3 endpoint, e.g. a local stand-in')
+    parser.add_argument('--limit', type=int, default=0, help='stop after this many messages')
+    args = parser.parse_args()
+
+    writer = ReportWriter(args.output)
+    use_s3 = any(source.startswith('s3://') for source in args.sources)
+    totals = {'messages': 0, 'spam': 0, 'ham': 0, 'error': 0, 'changed': 0}
+    started = time.perf_counter()
+
+    tasks = chunked(list_sources(args.sources, args.endpoint_url, args.limit), TASK_SIZE)
+    with Pool(args.workers, initializer=init_worker,
+              initargs=(args.rules, args.baseline_rules, use_s3, args.endpoint_url, args.extract)) as pool:
+        for rows in pool.imap_unordered(process_task, tasks):
+            for row in rows:
+                writer.write(row)
+                totals['messages'] += 1
+                totals[row['verdict']] += 1
+                totals['changed'] += bool(row['changed'])
+    writer.close()
+
+    elapsed = time.perf_counter() - started
+    totals['seconds'] = round(elapsed, 1)
+    totals['messages_per_minute'] = round(totals['messages'] / elapsed * 60) if elapsed else 0
+    totals['report'] = args.output
+    print(json.dumps(totals, indent=2))
+
+
+if __name__ == '__main__':
+    main()
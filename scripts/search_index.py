@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Search the full-text index of message bodies and attachment text, or compact it.
+
+Runs the same code as the search-indexer Lambda against the index in S3, mirroring the
+segment files into a local cache directory, so repeated searches only download what
+changed. One JSON hit per line, best first.
+
+    python scripts/search_index.py --bucket BUCKET query kubernetes contract
+    python scripts/search_index.py --bucket BUCKET query "rate negotiable" --conversation jane-at-agency.com
+    python scripts/search_index.py --bucket BUCKET compact
+
+BUCKET is the email bucket; --prefix defaults to search-index/ as on the Lambdas.
+Needs boto3 and mypylogger.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+
+from search_index import SearchIndex  # noqa: E402
+
+
+def query(index, args):
+    started = time.perf_counter()
+    hits = index.search(' '.join(args.terms), limit=args.limit, conversation_id=args.conversation)
+    for hit in hits:
+        print(json.dumps(hit))
+    print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+
+
+def compact(index, args):
+    print(json.dumps({'merges': index.compact()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bucket', required=True, help='email bucket')
+    parser.add_argument('--prefix', default='search-index/', help='index key prefix')
+    parser.add_argument('--cache-dir', default=os.path.join(os.path.expanduser('~'), '.cache', 'email-search-index'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('query', help='keyword search; every term must match')
+    command.add_argument('terms', nargs='+')
+    command.add_argument('--limit', type=int, default=20)
+    command.add_argument('--conversation', help='only this conversationId')
+    command.set_defaults(run=query)
+
+    command = commands.add_parser('compact', help='merge segments now instead of waiting for the schedule')
+    command.set_defaults(run=compact)
+
+    args = parser.parse_args()
+
+    import boto3
+    args.run(SearchIndex(boto3.client('s3'), args.bucket, args.prefix, args.cache_dir), args)
+
+
+if __name__ == '__main__':
+    main()
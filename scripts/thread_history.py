@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Print a conversation's message history from the message index table.
+
+One Query per page against (conversationId, timestamp), newest first unless --oldest-first
+is given. Each output line is one message row as JSON; when more messages remain the
+last line is {"next_cursor": ...}, which --cursor takes to fetch the next page.
+
+    python scripts/thread_history.py --table TABLE jane-at-agency.com
+    python scripts/thread_history.py --table TABLE jane-at-agency.com --limit 20 --cursor CURSOR
+    python scripts/thread_history.py --table TABLE jane-at-agency.com --since 2026-01-01 --all
+
+TABLE is {project}-{environment}-messages. Needs boto3 and mypylogger.
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+
+from message_index import MessageIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('conversation_id')
+    parser.add_argument('--table', required=True, help='message index table')
+    parser.add_argument('--limit', type=int, default=50, help='messages per page')
+    parser.add_argument('--cursor', help='next_cursor from a previous page')
+    parser.add_argument('--since', help='only messages received at or after this ISO timestamp')
+    parser.add_argument('--oldest-first', action='store_true')
+    parser.add_argument('--all', action='store_true', help='follow cursors until the last page')
+    args = parser.parse_args()
+
+    import boto3
+    index = MessageIndex(boto3.resource('dynamodb'), args.table)
+    cursor = args.cursor
+    while True:
+        messages, cursor = index.query(args.conversation_id, limit=args.limit, cursor=cursor,
+                                       newest_first=not args.oldest_first, since=args.since)
+        for message in messages:
+            print(json.dumps(message, default=str))
+        if not cursor or not args.all:
+            break
+    if cursor:
+        print(json.dumps({'next_cursor': cursor}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Shared setup for the handler tests.
+
+The handlers run against the in-memory AWS stand-ins in benchmarks/aws_stubs.py, so no
+AWS calls are made; their own requirements (boto3, mypylogger, pcre2) must be installed.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common'))
+
+ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'BUCKET_NAME': 'test-bucket',
+    'TABLE_NAME': 'test-conversations',
+    'DOMAIN_NAME': 'example.com',
+    'PUBLIC_EMAIL': 'me@example.com',
+    'PRIVATE_EMAIL': 'me@private.example.com',
+    'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:000000000000:alerts',
+    'SPAM_KEYWORDS_SSM_PARAM': '/test/spam-keywords',
+    'ACK_QUEUE_URL': 'https://sqs.local/ack',
+    'FORWARD_QUEUE_URL': 'https://sqs.local/forward',
+    'QUEUE_URL': 'https://sqs.local/forward',
+    'SES_RATE_TABLE': '',
+    'METRICS_ENABLED': 'false',
+}
+for name, value in ENV.items():
+    os.environ.setdefault(name, value)
+
+
+def load_handler(lambda_dir):
+    # Each Lambda's handler.py, loaded under its own name with its directory importable
+    name = lambda_dir.replace('-', '_') + '_handler'
+    if name in sys.modules:
+        return sys.modules[name]
+    sys.path.insert(0, os.path.join(ROOT, 'lambda', lambda_dir))
+    try:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'lambda', lambda_dir, 'handler.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+    return module
@@ -0,0 +1,88 @@
+"""conversation_index: resolving through the alias table gives every sender the ID it had
+before the table existed, so existing conversations are neither renamed nor merged."""
+import os
+import sys
+
+import pytest
+
+from aws_stubs import ClientError, FakeDynamoDB, FakeTable
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'inbound-handler'))
+from conversation_index import ConversationIndex, alias_key, derive_conversation_id  # noqa: E402
+
+ALIAS_TABLE = 'test-conversation-aliases'
+
+SENDERS = [
+    'Jane.Doe@Agency.example',
+    'jane.doe@agency.example',
+    'jane.doe+jobs@agency.example',
+    'JANE.DOE+Jobs@AGENCY.EXAMPLE',
+]
+
+
+class FakeAliasTable(FakeTable):
+    # Keyed puts with attribute_not_exists, as ConversationIndex.add_alias uses them
+
+    def __init__(self):
+        super().__init__()
+        self.gets = 0
+
+    def get_item(self, Key, **kwargs):
+        self.gets += 1
+        return super().get_item(Key, **kwargs)
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        with self._lock:
+            key = self._key({'alias': Item['alias']})
+            if ConditionExpression and key in self.items:
+                raise ClientError('ConditionalCheckFailedException')
+            self.items[key] = dict(Item)
+        return {}
+
+
+@pytest.fixture
+def dynamodb():
+    dynamodb = FakeDynamoDB()
+    dynamodb.tables[ALIAS_TABLE] = FakeAliasTable()
+    return dynamodb
+
+
+def test_mixed_case_and_tagged_senders_keep_their_own_conversations(dynamodb):
+    # IDs issued before the index: one conversation per distinct address
+    before = [derive_conversation_id(sender) for sender in SENDERS]
+    assert len(set(before)) == len(SENDERS)
+    assert len({alias_key(sender) for sender in SENDERS}) == len(SENDERS)
+
+    first = ConversationIndex(dynamodb, ALIAS_TABLE)
+    assert [first.resolve(sender) for sender in SENDERS] == before
+
+    # Another container, with nothing cached, reads the same aliases back
+    second = ConversationIndex(dynamodb, ALIAS_TABLE)
+    assert [second.resolve(sender) for sender in reversed(SENDERS)] == before[::-1]
+
+
+def test_added_alias_joins_a_tagged_address_to_an_existing_conversation(dynamodb):
+    index = ConversationIndex(dynamodb, ALIAS_TABLE)
+    conversation_id = index.resolve('jane.doe@agency.example')
+    index.add_alias(alias_key('Jane.Doe+jobs@Agency.example'), conversation_id)
+
+    assert ConversationIndex(dynamodb, ALIAS_TABLE).resolve('Jane.Doe+jobs@Agency.example') == conversation_id
+
+
+def test_relay_senders_resolve_by_display_name(dynamodb):
+    index = ConversationIndex(dynamodb, ALIAS_TABLE)
+    first = index.resolve('s-2kfv@Bounce.LinkedIn.com', 'Jane Smith')
+    again = ConversationIndex(dynamodb, ALIAS_TABLE).resolve('s-9xq1@bounce.linkedin.com', 'Jane Smith')
+
+    assert first == again == derive_conversation_id('s-2kfv@Bounce.LinkedIn.com', 'Jane Smith') == 'jane-smith-linkedin'
+
+
+def test_cached_alias_costs_no_read(dynamodb):
+    ConversationIndex(dynamodb, ALIAS_TABLE).resolve('jane.doe@agency.example')
+    table = dynamodb.tables[ALIAS_TABLE]
+    index = ConversationIndex(dynamodb, ALIAS_TABLE)
+
+    for _ in range(3):
+        index.resolve('jane.doe@agency.example')
+    assert table.gets == 2
@@ -0,0 +1,29 @@
+"""inbound-handler: the compressed preview on a conversation item never passes its byte
+bound, however poorly the body compresses, and still decodes."""
+import os
+import random
+import zlib
+
+import pytest
+
+from conftest import load_handler
+
+inbound = load_handler('inbound-handler')
+rng = random.Random(7)
+
+BODIES = {
+    'plain': 'Hi, are you open to a contract platform role? ' * 40,
+    'random-ascii': ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789 ') for _ in range(5000)),
+    'random-utf-8': ''.join(chr(rng.randrange(0x4e00, 0x9fff)) for _ in range(5000)),
+    'random-astral': ''.join(chr(rng.randrange(0x10000, 0x110000)) for _ in range(5000)),
+    'random-bytes': os.urandom(3000).decode('latin-1'),
+}
+
+
+@pytest.mark.parametrize('body', BODIES.values(), ids=BODIES.keys())
+def test_preview_stays_within_its_bound(body):
+    preview = inbound.compact_preview(body)
+
+    assert len(preview) <= inbound.PREVIEW_MAX_BYTES
+    text = zlib.decompress(preview).decode('utf-8')
+    assert text and body.startswith(text)
@@ -0,0 +1,108 @@
+"""forward-sender: the worst case a batch can build at once fits the function's memory."""
+import json
+import os
+import re
+
+import pytest
+
+import mime_builder
+from aws_stubs import FakeS3, FakeSES, FakeSQS, Stub
+from conftest import ROOT, load_handler
+from io_stage import IO_MAX_WORKERS, ByteBudget
+from ses_governor import SendRateGovernor
+
+MIB = 1024 * 1024
+
+
+def lambda_setting(function, name, path=os.path.join('modules', 'lambda-functions', 'main.tf')):
+    with open(os.path.join(ROOT, path)) as f:
+        source = f.read()
+    block = re.search(rf'resource "aws_lambda_function" "{function}" {{(.*?)\n}}', source, re.DOTALL).group(1)
+    return int(re.search(rf'^\s*{name}\s*=\s*(\d+)', block, re.MULTILINE).group(1))
+
+
+def terraform_default(variable, path=os.path.join('modules', 'lambda-functions', 'variables.tf')):
+    with open(os.path.join(ROOT, path)) as f:
+        source = f.read()
+    block = re.search(rf'variable "{variable}" {{(.*?)\n}}', source, re.DOTALL).group(1)
+    return int(re.search(r'default\s*=\s*(\d+)', block).group(1))
+
+
+class RecordingBudget(ByteBudget):
+
+    def __init__(self, max_bytes):
+        super().__init__(max_bytes)
+        self.peak = 0
+
+    def acquire(self, size):
+        size = super().acquire(size)
+        with self._cond:
+            self.peak = max(self.peak, self.held)
+        return size
+
+
+@pytest.fixture
+def forward(monkeypatch):
+    handler = load_handler('forward-sender')
+    ses = FakeSES()
+    for name, value in (('s3', FakeS3()), ('ses', ses), ('sqs', FakeSQS()), ('sns', Stub()),
+                        ('governor', SendRateGovernor(ses))):
+        monkeypatch.setattr(handler, name, value)
+    mime_builder.encoded_cache.clear()
+    return handler
+
+
+def full_size_sources(handler, name, count=3):
+    # Attachments that together fill the message up to the SES limit
+    each = (handler.SES_MAX_MESSAGE_BYTES - handler.MESSAGE_OVERHEAD_BYTES - 4096) * 57 // 78 // count
+    sources = []
+    for i in range(count):
+        key = f"blobs/sha256/{name}-{i}"
+        handler.s3.put(key, os.urandom(each))
+        sources.append((key, f"{name}-{i}.pdf"))
+    return sources
+
+
+def test_worst_case_batch_fits_function_memory(forward):
+    memory_mb = lambda_setting('forward_sender', 'memory_size')
+    batch_size = terraform_default('sender_batch_size')
+    cache_bytes = memory_mb // 8 * MIB
+    budget = forward.send_memory_budget(memory_mb, cache_bytes)
+    full_size = forward.SEND_MEMORY_FACTOR * forward.SES_MAX_MESSAGE_BYTES
+
+    in_flight = min(batch_size, IO_MAX_WORKERS, budget // full_size)
+    peak = forward.BASELINE_MEMORY_MB * MIB + cache_bytes + in_flight * full_size
+    assert in_flight >= 1, f"{memory_mb} MB cannot hold one full-size send"
+    assert peak <= memory_mb * MIB, f"peak {peak / MIB:.0f} MB exceeds {memory_mb} MB"
+
+
+def test_planned_size_bounds_the_rendered_message(forward):
+    body = 'Please see the attached role descriptions.\n' * 20
+    plan = forward.plan_attachments(full_size_sources(forward, 'role'), body)
+    raw = forward.build_raw_message('me@private.example.com', 'Fwd: roles', body, 'x@thread.example.com', plan)
+
+    assert len(plan[0]) == 3 and not plan[1]
+    assert len(raw) <= forward.planned_size(body, plan[0]) <= forward.SES_MAX_MESSAGE_BYTES
+
+
+def test_concurrent_records_stay_within_budget(forward, monkeypatch):
+    # Scaled down so a batch of full-size messages is quick to build
+    monkeypatch.setattr(forward, 'SES_MAX_MESSAGE_BYTES', 512 * 1024)
+    full_size = forward.SEND_MEMORY_FACTOR * forward.SES_MAX_MESSAGE_BYTES
+    budget = RecordingBudget(2 * full_size)
+    monkeypatch.setattr(forward, 'send_budget', budget)
+
+    records = []
+    for n in range(10):
+        sources = full_size_sources(forward, f"m{n}")
+        records.append({'messageId': f"r{n}", 'attributes': {'ApproximateReceiveCount': '1'}, 'body': json.dumps({
+            'recipient': 'me@private.example.com',
+            'subject': f"Fwd: role {n}",
+            'body': 'See attached.',
+            'attachments': [{'key': key, 'filename': filename} for key, filename in sources],
+        })})
+
+    assert forward.lambda_handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert forward.ses.sent == 10
+    assert 0 < budget.peak <= budget.max_bytes
+    assert budget.held == 0
@@ -0,0 +1,47 @@
+"""html_text: conversion time stays linear on malformed markup, and hidden content does
+not leak out through nested elements of the same name."""
+import os
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'inbound-handler'))
+from html_text import HTML_MAX_BYTES, html_to_text  # noqa: E402
+
+# Well under the inbound handler's 30 s timeout; a linear pass takes milliseconds
+MAX_SECONDS = 1.0
+
+CRAFTED = {
+    'unclosed-tags': '<a ',
+    'unclosed-declarations': '<!',
+    'stray-brackets': '< ',
+    'nested-tags': '<a<',
+    'unclosed-comments': '<!--',
+    'unclosed-scripts': '<script>',
+    'hidden-scopes': '<td hidden><table>',
+}
+
+
+@pytest.mark.parametrize('unit', CRAFTED.values(), ids=CRAFTED.keys())
+def test_crafted_input_converts_in_linear_time(unit):
+    document = (unit * (HTML_MAX_BYTES // len(unit) + 1))[:HTML_MAX_BYTES]
+    started = time.perf_counter()
+    html_to_text(document)
+    assert time.perf_counter() - started < MAX_SECONDS
+
+
+@pytest.mark.parametrize('document', [
+    '<td style="display:none"><table><tr><td>x</td><td>LEAK</td></tr></table></td><td>vis</td>',
+    '<td style="display:none"><table><tr><td>x<td>LEAK</table><td>vis',
+    '<li hidden><ul><li>x<li>LEAK</ul></li><li>vis',
+    '<p hidden>LEAK<p>vis',
+])
+def test_hidden_content_stays_hidden(document):
+    assert html_to_text(document).strip('- ') == 'vis'
+
+
+def test_unclosed_tag_leaves_the_rest_as_text():
+    assert html_to_text('Call me <b>today</b> <i unclosed') == 'Call me today <i unclosed'
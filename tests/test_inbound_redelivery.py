@@ -0,0 +1,109 @@
+"""inbound-handler: a redelivery after a partial failure still acknowledges first contact
+exactly once and forwards exactly once."""
+import json
+import os
+
+import pytest
+
+from aws_stubs import ClientError, FakeDynamoDB, FakeS3, FakeSQS, FakeSSM, FakeTable, Stub
+from conftest import ENV, ROOT, load_handler
+
+LEDGER_TABLE = 'test-ledger'
+SENDER = 'recruiter@agency.example'
+
+RAW = (
+    f"From: Jane Recruiter <{SENDER}>\r\n"
+    f"To: {ENV['PUBLIC_EMAIL']}\r\n"
+    "Subject: Platform engineer role\r\n"
+    "Message-ID: <m1@agency.example>\r\n"
+    "Content-Type: text/plain; charset=utf-8\r\n"
+    "\r\n"
+    "Hi, are you open to a new role?\r\n"
+).encode()
+
+
+class FakeLedgerTable(FakeTable):
+    # Applies ProcessingLedger.mark's update: ADD to the stages set, SET the attributes
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ExpressionAttributeNames=None,
+                    **kwargs):
+        with self._lock:
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            item['stages'] = item.get('stages', set()) | ExpressionAttributeValues[':stages']
+            for placeholder, name in (ExpressionAttributeNames or {}).items():
+                item[name] = ExpressionAttributeValues[':' + placeholder[1:]]
+        return {}
+
+
+class FailingArchiveS3(FakeS3):
+    # The first copy to conversations/ fails, as a throttled or timed-out write would
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        if Key.startswith('conversations/') and self.failures:
+            self.failures -= 1
+            raise ClientError('SlowDown')
+        return super().copy_object(Bucket, Key, CopySource, **kwargs)
+
+
+@pytest.fixture
+def inbound(monkeypatch):
+    handler = load_handler('inbound-handler')
+    s3 = FailingArchiveS3()
+    s3.put('spam-filter/keywords.txt', b'[subject]\n[body]\n[sender_domains]\n')
+    dynamodb = FakeDynamoDB()
+    ssm = FakeSSM({ENV['SPAM_KEYWORDS_SSM_PARAM']: 'spam-filter/keywords.txt'})
+
+    # The ack body is read from the working directory, as in the deployed package
+    monkeypatch.chdir(os.path.join(ROOT, 'templates'))
+    for name, value in (('s3', s3), ('sqs', FakeSQS()), ('dynamodb', dynamodb), ('sns', Stub()), ('ssm', ssm),
+                        ('ledger', handler.ledger)):
+        monkeypatch.setattr(handler, name, value)
+    monkeypatch.setattr(handler.spam_rule_source, 's3', s3)
+    monkeypatch.setattr(handler.spam_rule_source, 'ssm', ssm)
+    monkeypatch.setattr(handler.spam_audit, 'logs', Stub())
+    return handler
+
+
+def event(message_id):
+    return {'Records': [{'ses': {
+        'mail': {'messageId': message_id, 'source': SENDER, 'destination': [ENV['PUBLIC_EMAIL']],
+                 'commonHeaders': {'subject': 'Platform engineer role'}},
+        'receipt': {'spamVerdict': {'status': 'PASS'}, 'virusVerdict': {'status': 'PASS'}},
+    }}]}
+
+
+def sent_to(handler, queue_url):
+    return [json.loads(body) for url, body in handler.sqs.sent if url == queue_url]
+
+
+@pytest.mark.parametrize('ledger_table', [LEDGER_TABLE, ''], ids=['ledger', 'no-ledger'])
+def test_first_contact_ack_survives_failed_write(inbound, ledger_table):
+    inbound.dynamodb.tables[LEDGER_TABLE] = FakeLedgerTable()
+    inbound.ledger = inbound.ProcessingLedger(inbound.dynamodb, ledger_table)
+    inbound.s3.put('staging/m1', RAW)
+
+    with pytest.raises(ClientError):
+        inbound.lambda_handler(event('m1'), None)
+
+    # The upsert already happened, so the ack must be out even though the attempt failed
+    acks = sent_to(inbound, ENV['ACK_QUEUE_URL'])
+    assert [ack['recipient'] for ack in acks] == [SENDER]
+    assert acks[0]['idempotency_key'] == 'm1#ack'
+    assert sent_to(inbound, ENV['FORWARD_QUEUE_URL']) == []
+    assert 'staging/m1' in inbound.s3.objects
+
+    # SES retries the invocation; the upsert now reports a returning sender
+    inbound.lambda_handler(event('m1'), None)
+
+    assert len(sent_to(inbound, ENV['ACK_QUEUE_URL'])) == 1
+    assert len(sent_to(inbound, ENV['FORWARD_QUEUE_URL'])) == 1
+    assert any(key.startswith('conversations/') for key in inbound.s3.objects)
+    assert 'staging/m1' not in inbound.s3.objects
+    if ledger_table:
+        progress = inbound.ledger.load('inbound#m1')
+        assert {'conversation', 'ack', 'archive', 'forward'} <= progress['stages']
+        assert progress['firstContact'] is True
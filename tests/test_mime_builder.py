@@ -0,0 +1,23 @@
+"""mime_builder: long header values are folded so no line passes the 998-character limit,
+and read back unchanged."""
+from email import policy
+from email.parser import BytesParser
+
+import pytest
+
+from mime_builder import MAX_7BIT_LINE, render_raw_message
+
+SUBJECTS = [
+    'Fwd: ' + 'Senior Platform Engineer (remote, contract) ' * 40,
+    'Re: ' + 'x' * 2000,
+    'Fwd: Ingeniería de plataformas ' * 40,
+]
+
+
+@pytest.mark.parametrize('subject', SUBJECTS, ids=['words', 'unbroken', 'utf-8'])
+def test_long_subject_is_folded(subject):
+    raw = render_raw_message('me@example.com', 'me@private.example.com', subject, 'See below.', [])
+    headers = raw.split(b'\r\n\r\n', 1)[0]
+
+    assert max(len(line) for line in headers.split(b'\r\n')) <= MAX_7BIT_LINE
+    assert BytesParser(policy=policy.default).parsebytes(raw)['Subject'] == subject
@@ -0,0 +1,86 @@
+"""search_index: documents queued by the mail handlers reach the index one segment per
+batch, and a search survives a compaction that deletes segments it has just listed."""
+import json
+
+import pytest
+
+from aws_stubs import FakeS3, FakeSQS
+from conftest import ENV, load_handler
+from search_index import SQS_MAX_MESSAGE_BYTES, SearchIndex, SearchQueue
+
+PREFIX = 'search-index/'
+QUEUE_URL = 'https://sqs.local/search'
+
+
+class StaleListingS3(FakeS3):
+    # The first listing still names a segment a compaction has since deleted
+
+    def __init__(self):
+        super().__init__()
+        self.listings = 0
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        page = super().list_objects_v2(Bucket, Prefix, **kwargs)
+        self.listings += 1
+        if self.listings == 1:
+            page['Contents'].append({'Key': f"{PREFIX}segments/L0/20260101T000000000000-merged.db", 'Size': 1})
+        return page
+
+
+@pytest.fixture
+def indexer(monkeypatch, tmp_path):
+    handler = load_handler('search-indexer')
+    s3 = StaleListingS3()
+    monkeypatch.setattr(handler, 's3', s3)
+    monkeypatch.setattr(handler, 'search_index', SearchIndex(s3, ENV['BUCKET_NAME'], PREFIX, str(tmp_path)))
+    return handler
+
+
+def segments(s3):
+    return [key for key in s3.objects if key.startswith(PREFIX)]
+
+
+def records(sqs):
+    return [{'messageId': str(n), 'body': body} for n, (_, body) in enumerate(sqs.sent)]
+
+
+def test_queued_documents_are_indexed_as_one_segment(indexer):
+    sqs = FakeSQS()
+    queue = SearchQueue(sqs, QUEUE_URL, PREFIX)
+    indexer.s3.put('extracted-text/sha256/ab/ab.txt', b'Kubernetes platform engineer, remote')
+    assert queue.add('jane-at-agency', 'm1', 'body', 'Are you open to a contract role?', 'Platform role')
+    assert queue.add('jane-at-agency', 'm1', 'role.pdf', text_key='extracted-text/sha256/ab/ab.txt')
+    assert queue.add('sam-at-example', 'm2', 'reply', 'The rate is negotiable.', 'Re: Rates')
+
+    assert indexer.lambda_handler({'Records': records(sqs)}, None) == {'batchItemFailures': []}
+    assert len(segments(indexer.s3)) == 1
+
+    # The first listing names a segment that is gone; the search lists again
+    hits = indexer.lambda_handler({'query': 'kubernetes'}, None)['hits']
+    assert [(hit['messageId'], hit['source']) for hit in hits] == [('m1', 'role.pdf')]
+    assert indexer.s3.listings == 2
+
+
+def test_compaction_runs_apart_from_the_indexer(indexer):
+    assert indexer.compaction_handler({}, None) == {'merges': 0}
+    with pytest.raises(ValueError):
+        indexer.lambda_handler({}, None)
+
+
+def test_unreadable_record_fails_alone(indexer):
+    sqs = FakeSQS()
+    queue = SearchQueue(sqs, QUEUE_URL, PREFIX)
+    queue.add('jane-at-agency', 'm1', 'role.pdf', text_key='extracted-text/sha256/cd/missing.txt')
+    queue.add('jane-at-agency', 'm1', 'body', 'Are you open to a contract role?')
+
+    assert indexer.lambda_handler({'Records': records(sqs)}, None) == {'batchItemFailures': [{'itemIdentifier': '0'}]}
+    assert len(segments(indexer.s3)) == 1
+
+
+def test_long_text_is_cut_to_fit_one_message():
+    sqs = FakeSQS()
+    SearchQueue(sqs, QUEUE_URL, PREFIX).add('jane-at-agency', 'm1', 'body', 'é"\n' * 100000)
+
+    _, body = sqs.sent[0]
+    assert len(body.encode('utf-8')) <= SQS_MAX_MESSAGE_BYTES
+    assert json.loads(body)['text'].startswith('é"\né"\n')
@@ -0,0 +1,68 @@
+"""Sender Lambdas: a throttled send goes back on the queue with the attempt advanced, and
+the last attempt pages once."""
+import json
+
+import pytest
+
+from aws_stubs import ClientError, FakeS3, FakeSES, FakeSQS, Stub
+from conftest import ENV, load_handler
+from retry_queue import MAX_ATTEMPTS
+from ses_governor import SendRateGovernor
+
+
+class ThrottledSES(FakeSES):
+
+    def send_raw_email(self, **kwargs):
+        raise ClientError('Throttling')
+
+    send_email = send_raw_email
+
+
+class RecordingSNS(Stub):
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, **kwargs):
+        self.published.append(kwargs)
+        return {}
+
+
+@pytest.fixture(params=['ack-sender', 'forward-sender', 'reply-sender'])
+def sender(request, monkeypatch):
+    handler = load_handler(request.param)
+    ses = ThrottledSES()
+    for name, value in (('ses', ses), ('sqs', FakeSQS()), ('sns', RecordingSNS()),
+                        ('governor', SendRateGovernor(ses))):
+        monkeypatch.setattr(handler, name, value)
+    if hasattr(handler, 's3'):
+        monkeypatch.setattr(handler, 's3', FakeS3())
+    return handler
+
+
+def record(attempt, receive_count='1'):
+    return {'messageId': 'r1', 'attributes': {'ApproximateReceiveCount': receive_count}, 'body': json.dumps({
+        'recipient': 'jane@agency.example',
+        'subject': 'Re: Platform role',
+        'body': 'Thanks, talk soon.',
+        'attempt': attempt,
+    })}
+
+
+def test_throttled_send_is_requeued(sender):
+    assert sender.lambda_handler({'Records': [record(1)]}, None) == {'batchItemFailures': []}
+
+    [(url, body)] = sender.sqs.sent
+    assert url == ENV['QUEUE_URL'] and json.loads(body)['attempt'] == 2
+    assert sender.sns.published == []
+
+
+def test_last_attempt_pages_once(sender):
+    assert sender.lambda_handler({'Records': [record(MAX_ATTEMPTS)]}, None) == {
+        'batchItemFailures': [{'itemIdentifier': 'r1'}]}
+    assert sender.lambda_handler({'Records': [record(MAX_ATTEMPTS, receive_count='2')]}, None) == {
+        'batchItemFailures': [{'itemIdentifier': 'r1'}]}
+
+    assert sender.sqs.sent == []
+    assert len(sender.sns.published) == 1
+    assert 'jane@agency.example' in sender.sns.published[0]['Message']
@@ -0,0 +1,95 @@
+"""attachment-extractor: text stored under a content hash is reused for the next copy of
+the file unless the deadline cut it short, and the message index points at that text."""
+import os
+import sys
+
+import pytest
+
+from aws_stubs import FakeDynamoDB, FakeS3
+from blob_store import BLOB_KEY_METADATA, HASH_METADATA, TRUNCATED_METADATA, text_key
+from conftest import ROOT, load_handler
+from message_index import MessageIndex
+
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'attachment-extractor'))
+from text_extraction import default_workers  # noqa: E402
+
+BUCKET = 'test-bucket'
+DIGEST = 'ab' * 32
+
+
+class ScriptedExtractor:
+    # Yields two pages, or stops after the first as the deadline would
+
+    def __init__(self):
+        self.calls = 0
+        self.hit_deadline = False
+
+    def __call__(self, path, stats, deadline=None):
+        self.calls += 1
+        yield 'page one'
+        if self.hit_deadline:
+            stats.truncated = 'time_budget'
+            return
+        yield 'page two'
+
+
+@pytest.fixture
+def extractor(monkeypatch):
+    handler = load_handler('attachment-extractor')
+    s3 = FakeS3()
+    s3.put(f"blobs/sha256/ab/{DIGEST}", b'%PDF-1.7')
+    scripted = ScriptedExtractor()
+    monkeypatch.setattr(handler, 's3', s3)
+    monkeypatch.setitem(handler.EXTRACTORS, '.pdf', ('pdf', scripted))
+    monkeypatch.setattr(handler.search_queue, 'prefix', '')
+    return handler, scripted
+
+
+def attach(handler, message_id):
+    key = f"attachments/jane-recruiter-agency/{message_id}/role.pdf"
+    handler.s3.put(key, b'', {BLOB_KEY_METADATA: f"blobs/sha256/ab/{DIGEST}", HASH_METADATA: DIGEST})
+    handler.lambda_handler({'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}]}, None)
+
+
+def test_text_cut_off_by_the_deadline_is_extracted_again(extractor):
+    handler, scripted = extractor
+    scripted.hit_deadline = True
+    attach(handler, 'm1')
+
+    data, _, metadata = handler.s3.objects[text_key(DIGEST)]
+    assert data == b'page one'
+    assert metadata == {TRUNCATED_METADATA: 'time_budget'}
+
+    scripted.hit_deadline = False
+    attach(handler, 'm2')
+    data, _, metadata = handler.s3.objects[text_key(DIGEST)]
+    assert scripted.calls == 2
+    assert data == b'page one\npage two'
+    assert TRUNCATED_METADATA not in metadata
+
+    attach(handler, 'm3')
+    assert scripted.calls == 2
+
+
+def test_message_index_points_at_the_extracted_text(extractor):
+    handler, _ = extractor
+    attach(handler, 'm1')
+    dynamodb = FakeDynamoDB()
+    MessageIndex(dynamodb, 'test-messages').record(
+        'jane-recruiter-agency', 'm1', '2026-01-01T00:00:00Z', 'inbound', 'jane@agency.example', 'Role',
+        attachments=[{'key': 'attachments/jane-recruiter-agency/m1/role.pdf', 'blob_key': f"blobs/sha256/ab/{DIGEST}",
+                      'sha256': DIGEST, 'filename': 'role.pdf', 'size': 8}])
+
+    [item] = dynamodb.Table('test-messages').put_items
+    assert [handler.s3.objects[key][0] for key in item['textKeys']] == [b'page one\npage two']
+
+
+@pytest.mark.parametrize('memory_mb, cpu_count, workers', [
+    (512, 2, 1),
+    (1769, 2, 1),
+    (3538, 6, 2),
+    (10240, 6, 5),
+    (0, 8, 8),
+])
+def test_workers_follow_lambda_vcpus(memory_mb, cpu_count, workers):
+    assert default_workers(memory_mb, cpu_count) == workers